@@ -0,0 +1,337 @@
+from collections import OrderedDict
+from concurrent.futures import Future
+from fastapi import Request
+from fastapi.responses import Response
+from app.phones import normalize_phone
+from typing import Any, Callable, Hashable, Optional, Tuple
+import hashlib
+import os
+import threading
+import time
+import uuid
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls for the same key: the first caller runs the
+    function, callers arriving while it is in flight wait for its result.
+    """
+
+    def __init__(self):
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.coalesced = 0
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+            else:
+                self.coalesced += 1
+        if not leader:
+            return future.result()
+        try:
+            result = fn()
+            future.set_result(result)
+            return result
+        except BaseException as exc:
+            future.set_exception(exc)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+
+class CatalogueCache:
+    """
+    In-process cache of serialized medicine catalogue responses.
+
+    Every entry is keyed by (catalogue version, endpoint params). Any write
+    that can change what the catalogue endpoints return (medicine create /
+    update / delete, stock changes) calls bump(), which moves the version
+    forward so older entries and ETags can never be served again. Edits to
+    the medicines themselves (names, prices, packs) pass names=True, which
+    also moves `names_version`, the version the typeahead index is built
+    for; stock changes leave it alone. With several workers, `on_bump`
+    (set by the invalidation bus) tells the others to bump too.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        # Random per-process prefix so ETags from another worker or from
+        # before a restart never match a version counted from zero here
+        self.epoch = uuid.uuid4().hex[:8]
+        self._version = 0
+        self._names_version = 0
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.evictions = 0
+        self._flight = SingleFlight()
+        self.on_bump: Optional[Callable[[bool], None]] = None
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    @property
+    def names_version(self) -> int:
+        return self._names_version
+
+    def bump(self, publish: bool = True, names: bool = False) -> int:
+        """Invalidate every cached response; call after the write is committed"""
+        with self._lock:
+            self._version += 1
+            if names:
+                self._names_version += 1
+            self._entries.clear()
+            self._bytes = 0
+            version = self._version
+        if publish and self.on_bump is not None:
+            self.on_bump(names)
+        return version
+
+    def etag(self, version: int, params: tuple) -> str:
+        digest = hashlib.blake2b(repr(params).encode(), digest_size=8).hexdigest()
+        return f'W/"{self.epoch}-{version}-{digest}"'
+
+    def lookup(self, params: tuple) -> Tuple[int, Optional[bytes]]:
+        """Return the current version and the cached body for it, if any"""
+        with self._lock:
+            version = self._version
+            body = self._entries.get((version, params))
+            if body is None:
+                self.misses += 1
+            else:
+                self._entries.move_to_end((version, params))
+                self.hits += 1
+            return version, body
+
+    def store(self, version: int, params: tuple, body: bytes):
+        with self._lock:
+            # A write landed while the body was being built; don't cache it
+            if version != self._version or len(body) > self.max_bytes:
+                return
+            key = (version, params)
+            if key in self._entries:
+                return
+            self._entries[key] = body
+            self._bytes += len(body)
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "version": self._version,
+                "names_version": self._names_version,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "not_modified": self.not_modified,
+                "evictions": self.evictions,
+                "coalesced": self._flight.coalesced,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+    def cached_response(self, request: Request, params: tuple, build: Callable[[], bytes],
+                        cache_control: str = "private, no-cache",
+                        authorize: Optional[Callable[[], Any]] = None) -> Response:
+        """
+        Serve a catalogue response from cache, honouring If-None-Match.
+        `build` runs the query and serialization only on a cache miss, and
+        identical misses in flight at the same time share a single build.
+        `authorize` (e.g. the users-table check) runs only when a body is
+        sent, so a 304 costs no database query.
+        """
+        version = self._version
+        etag = self.etag(version, params)
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match and etag in [tag.strip() for tag in if_none_match.split(",")]:
+            with self._lock:
+                self.not_modified += 1
+            return Response(status_code=304, headers={"ETag": etag})
+
+        if authorize is not None:
+            authorize()
+        version, body = self.lookup(params)
+        if body is None:
+            def build_and_store():
+                built = build()
+                self.store(version, params, built)
+                return built
+            body = self._flight.do((version, params), build_and_store)
+        return Response(
+            content=body,
+            media_type="application/json",
+            headers={"ETag": self.etag(version, params), "Cache-Control": cache_control}
+        )
+
+
+catalogue_cache = CatalogueCache(
+    max_bytes=int(os.getenv("CATALOGUE_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+)
+
+
+class CallSessionCache:
+    """
+    Per phone call memo of what a Vapi call has already looked up: spoken
+    medicine name -> resolved medicine id plus the stock seen at that time.
+    Entries live for `ttl` seconds after the call's last lookup, so the
+    stock checks and the final order in one call resolve each name once.
+    Stock figures here are only a snapshot; order placement re-validates.
+    """
+
+    def __init__(self, ttl: float, max_calls: int):
+        self.ttl = ttl
+        self.max_calls = max_calls
+        self._calls = OrderedDict()  # call_id -> (expires_at, {name key: entry})
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(name: str) -> str:
+        return " ".join((name or "").replace("\ufeff", "").casefold().split())
+
+    def _entries(self, call_id: str, now: float) -> Optional[dict]:
+        item = self._calls.get(call_id)
+        if item is None:
+            return None
+        if item[0] < now:
+            del self._calls[call_id]
+            return None
+        return item[1]
+
+    def get(self, call_id: Optional[str], name: str) -> Optional[dict]:
+        if not call_id:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            entries = self._entries(call_id, now)
+            entry = entries.get(self.key(name)) if entries else None
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._calls[call_id] = (now + self.ttl, entries)
+            return entry
+
+    def put(self, call_id: Optional[str], name: str, medicine_id: int, medicine_name: str, stock_quantity: int):
+        if not call_id:
+            return
+        now = time.monotonic()
+        with self._lock:
+            entries = self._entries(call_id, now)
+            if entries is None:
+                entries = {}
+            self._calls[call_id] = (now + self.ttl, entries)
+            self._calls.move_to_end(call_id)
+            entries[self.key(name)] = {
+                "medicine_id": medicine_id,
+                "name": medicine_name,
+                "stock_quantity": stock_quantity,
+            }
+            while len(self._calls) > self.max_calls:
+                self._calls.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "calls": len(self._calls),
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+call_cache = CallSessionCache(
+    ttl=float(os.getenv("VAPI_CALL_CACHE_TTL", "300")),
+    max_calls=int(os.getenv("VAPI_CALL_CACHE_MAX_CALLS", "10000"))
+)
+
+
+class CustomerIdCache:
+    """
+    Bounded LRU of phone -> customer id (plus the name and address last
+    written for it) used by order placement. Entries are added only once
+    the order transaction has committed, so an id from a rolled-back
+    insert is never handed out. Customers are never deleted and their
+    phone never changes, so an entry can't point at the wrong row; its
+    name and address can go stale when another worker updates them, so
+    a put that stores something new calls `on_change` (set by the
+    invalidation bus) and the other workers drop their entry for it.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[int, Optional[str], Optional[str]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.on_change: Optional[Callable[[str], None]] = None
+
+    @staticmethod
+    def key(phone: str) -> str:
+        return normalize_phone(phone)
+
+    def get(self, phone: str) -> Optional[Tuple[int, Optional[str], Optional[str]]]:
+        key = self.key(phone)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+            else:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            return entry
+
+    def put(self, phone: str, customer_id: int, name: Optional[str] = None, address: Optional[str] = None):
+        key = self.key(phone)
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None and previous[0] == customer_id:
+                # An order without a name / address leaves the stored ones as they were
+                name = name or previous[1]
+                address = address or previous[2]
+            self._entries[key] = (customer_id, name, address)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        if previous != (customer_id, name, address) and self.on_change is not None:
+            self.on_change(key)
+
+    def discard(self, phone: Optional[str]):
+        """Forget one phone, or everything when `phone` is None"""
+        with self._lock:
+            if phone is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(self.key(phone), None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+customer_ids = CustomerIdCache(
+    max_entries=int(os.getenv("CUSTOMER_CACHE_MAX_ENTRIES", "10000"))
+)
@@ -0,0 +1,218 @@
+from collections import defaultdict
+from datetime import datetime, timedelta
+from sqlalchemy import delete, func, insert, select, text
+from app import models
+from app.cache import catalogue_cache, customer_ids
+from app.database import engine
+from typing import Callable, Dict, List, Optional, Tuple
+import json
+import logging
+import os
+import select as select_module
+import threading
+import uuid
+
+logger = logging.getLogger("app.invalidation")
+
+CACHE_BUS_ENABLED = os.getenv("CACHE_BUS_ENABLED", "true").lower() in ("1", "true", "yes")
+CACHE_BUS_CHANNEL = os.getenv("CACHE_BUS_CHANNEL", "cache_invalidation")
+CACHE_BUS_POLL_INTERVAL = float(os.getenv("CACHE_BUS_POLL_INTERVAL", "1"))
+CACHE_EVENTS_RETENTION = int(os.getenv("CACHE_EVENTS_RETENTION", "600"))  # seconds
+
+
+class InvalidationBus:
+    """
+    Tells the other workers which in-process caches a write made stale.
+
+    publish(topic, key) queues a compact {"topic", "origin", "key"} event
+    and returns; a publisher thread sends what has queued up (duplicates
+    coalesced) through Postgres NOTIFY when the database supports it,
+    otherwise as rows in cache_events that the other workers poll, so a
+    request never waits on it. A listener thread per worker runs the
+    handlers subscribed to the topic for events from any other worker,
+    passing the key (None for "everything"). Whenever the listener
+    (re)connects it also runs every handler with None, since events sent
+    while it was away are lost.
+    """
+
+    def __init__(self, bind, channel: str = CACHE_BUS_CHANNEL, poll_interval: float = CACHE_BUS_POLL_INTERVAL):
+        self.engine = bind
+        self.channel = channel
+        self.poll_interval = poll_interval
+        self.origin = uuid.uuid4().hex[:12]
+        self.use_notify = bind.dialect.name == "postgresql"
+        self._handlers: Dict[str, List[Callable[[Optional[str]], None]]] = defaultdict(list)
+        self._stop = threading.Event()
+        self._thread = None
+        self._publisher = None
+        self._pending: Dict[Tuple[str, Optional[str]], None] = {}  # insertion-ordered set
+        self._pending_lock = threading.Lock()
+        self._wake = threading.Event()
+        self.enabled = CACHE_BUS_ENABLED
+        self.published = 0
+        self.received = 0
+        self.reconnects = 0
+
+    def subscribe(self, topic: str, handler: Callable[[Optional[str]], None]):
+        self._handlers[topic].append(handler)
+
+    def publish(self, topic: str, key: Optional[str] = None):
+        if not self.enabled:
+            return
+        if self._publisher is None:
+            # Not started (scripts, one-off tools): nobody to hand it to
+            self._send([(topic, key)])
+            return
+        with self._pending_lock:
+            self._pending[(topic, key)] = None
+        self._wake.set()
+
+    def _send(self, events: List[Tuple[str, Optional[str]]]):
+        try:
+            with self.engine.connect() as conn:
+                if self.use_notify:
+                    for topic, key in events:
+                        payload = json.dumps({"topic": topic, "origin": self.origin, "key": key},
+                                             separators=(",", ":"))
+                        conn.execute(text("SELECT pg_notify(:channel, :payload)"),
+                                     {"channel": self.channel, "payload": payload})
+                else:
+                    now = datetime.now()
+                    conn.execute(insert(models.CacheEvent.__table__), [
+                        {"topic": topic, "key": key, "origin": self.origin, "created_at": now}
+                        for topic, key in events])
+                conn.commit()
+            self.published += len(events)
+        except Exception:
+            # Other workers catch up through their cache TTLs / next write
+            logger.exception("could not publish cache invalidations %s", [topic for topic, _ in events])
+
+    def _publish_pending(self):
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+            with self._pending_lock:
+                events, self._pending = list(self._pending), {}
+            if events:
+                self._send(events)
+            if self._stop.is_set():
+                return
+
+    def apply(self, topic: str, origin: str, key: Optional[str] = None):
+        if origin == self.origin:
+            return
+        self.received += 1
+        self._run_handlers(topic, key)
+
+    def _run_handlers(self, topic: str, key: Optional[str] = None):
+        for handler in self._handlers.get(topic, ()):
+            try:
+                handler(key)
+            except Exception:
+                logger.exception("cache invalidation handler for %s failed", topic)
+
+    def _apply_all(self):
+        for topic in list(self._handlers):
+            self._run_handlers(topic)
+
+    # ----- listeners -----
+
+    def _listen_notify(self):
+        fairy = self.engine.raw_connection()
+        fairy.detach()  # held for the life of the listener, not borrowed from the pool
+        conn = fairy.driver_connection
+        try:
+            conn.autocommit = True
+            with conn.cursor() as cursor:
+                cursor.execute(f'LISTEN "{self.channel}"')
+            self._apply_all()
+            while not self._stop.is_set():
+                if select_module.select([conn], [], [], self.poll_interval) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    notify = conn.notifies.pop(0)
+                    try:
+                        event = json.loads(notify.payload)
+                    except ValueError:
+                        continue
+                    self.apply(event.get("topic", ""), event.get("origin", ""), event.get("key"))
+        finally:
+            fairy.close()
+
+    def _poll_table(self):
+        events = models.CacheEvent.__table__
+        with self.engine.connect() as conn:
+            last_id = conn.execute(select(func.coalesce(func.max(events.c.id), 0))).scalar()
+        self._apply_all()
+        polls = 0
+        while not self._stop.wait(self.poll_interval):
+            with self.engine.connect() as conn:
+                rows = conn.execute(
+                    select(events.c.id, events.c.topic, events.c.origin, events.c.key)
+                    .where(events.c.id > last_id)
+                    .order_by(events.c.id)
+                ).all()
+                polls += 1
+                if polls % 60 == 0:
+                    # Keep the newest row so ids never restart below what workers have seen
+                    conn.execute(delete(events).where(
+                        events.c.id < last_id,
+                        events.c.created_at < datetime.now() - timedelta(seconds=CACHE_EVENTS_RETENTION)))
+                    conn.commit()
+            for row in rows:
+                last_id = row.id
+                self.apply(row.topic, row.origin, row.key)
+
+    def _run(self):
+        listen = self._listen_notify if self.use_notify else self._poll_table
+        while not self._stop.is_set():
+            try:
+                listen()
+            except Exception:
+                self.reconnects += 1
+                logger.exception("cache invalidation listener failed, reconnecting")
+                self._stop.wait(min(30.0, self.poll_interval * 5))
+
+    def start(self):
+        if self._thread is not None or not self.enabled:
+            return
+        self._stop.clear()
+        self._publisher = threading.Thread(target=self._publish_pending, name="cache-publisher", daemon=True)
+        self._publisher.start()
+        self._thread = threading.Thread(target=self._run, name="cache-invalidation", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()  # the publisher sends what is still queued, then exits
+        for thread in (self._publisher, self._thread):
+            if thread is not None:
+                thread.join(timeout=5)
+        self._publisher = self._thread = None
+
+    def stats(self) -> dict:
+        return {
+            "transport": "notify" if self.use_notify else "polling",
+            "origin": self.origin,
+            "published": self.published,
+            "pending": len(self._pending),
+            "received": self.received,
+            "reconnects": self.reconnects,
+        }
+
+
+cache_bus = InvalidationBus(engine)
+
+# The catalogue version also drives the variant map; "catalogue_names"
+# (medicine edits) additionally rebuilds the typeahead index
+cache_bus.subscribe("catalogue", lambda key: catalogue_cache.bump(publish=False))
+cache_bus.subscribe("catalogue_names", lambda key: catalogue_cache.bump(publish=False, names=True))
+catalogue_cache.on_bump = lambda names: cache_bus.publish("catalogue_names" if names else "catalogue")
+
+# Phone -> customer id entries whose name / address another worker changed
+cache_bus.subscribe("customers", lambda key: customer_ids.discard(key))
+customer_ids.on_change = lambda phone: cache_bus.publish("customers", phone)
+
+# Not on the bus: call_cache is per phone call, expires with VAPI_CALL_CACHE_TTL
+# and its stock is re-read by primary key before an order is placed
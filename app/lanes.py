@@ -0,0 +1,126 @@
+from contextvars import ContextVar
+from typing import List, Optional, Tuple
+from app import metrics
+import anyio
+import os
+import time
+
+LANES_ENABLED = os.getenv("LANES_ENABLED", "true").lower() in ("1", "true", "yes")
+
+
+def _prefixes(name: str, default: str) -> Tuple[str, ...]:
+    return tuple(p.strip() for p in os.getenv(name, default).split(",") if p.strip())
+
+
+lane_waiting = metrics.registry.gauge(
+    "lane_requests_waiting", "Requests queued for a slot in their lane", ("lane",))
+lane_in_use = metrics.registry.gauge(
+    "lane_requests_in_progress", "Requests holding a slot in their lane", ("lane",))
+lane_wait_seconds = metrics.registry.histogram(
+    "lane_wait_seconds", "Time requests waited for a slot in their lane", ("lane",))
+
+# Lane of the request being served, for picking its DB session pool
+current_lane: ContextVar[Optional[str]] = ContextVar("current_lane", default=None)
+
+
+class RequestLane:
+    """
+    A class of requests (matched by path prefix) with its own concurrency
+    budget. Each lane gets a CapacityLimiter; the process-wide thread
+    limiter is sized to the sum of the lanes (see size_thread_pool), so a
+    lane can fill its own slots but never the threads of another.
+    """
+
+    def __init__(self, name: str, prefixes: Tuple[str, ...], capacity: int):
+        self.name = name
+        self.prefixes = prefixes
+        self.capacity = capacity
+        self._limiter = None
+
+    @property
+    def limiter(self) -> anyio.CapacityLimiter:
+        # Created lazily: a CapacityLimiter belongs to the running event loop
+        if self._limiter is None:
+            self._limiter = anyio.CapacityLimiter(self.capacity)
+        return self._limiter
+
+    def matches(self, path: str) -> bool:
+        return any(path.startswith(prefix) for prefix in self.prefixes)
+
+
+VOICE_LANE = "voice"
+LANE_VOICE_CAPACITY = int(os.getenv("LANE_VOICE_CAPACITY", "16"))
+
+LANES: List[RequestLane] = [
+    RequestLane(VOICE_LANE, _prefixes("LANE_VOICE_PREFIXES", "/api/vapi,/api/ai-agent"), LANE_VOICE_CAPACITY),
+    RequestLane("backoffice", _prefixes("LANE_BACKOFFICE_PREFIXES", "/api/export,/api/dashboard,/api/invoices"),
+                int(os.getenv("LANE_BACKOFFICE_CAPACITY", "4"))),
+    RequestLane("default", ("/",), int(os.getenv("LANE_DEFAULT_CAPACITY", "24"))),
+]
+
+# Worker threads for Vapi tool calls (several per request), apart from the lanes' slots
+VOICE_TOOL_THREADS = int(os.getenv("VOICE_TOOL_THREADS", "16"))
+_voice_tool_limiter = None
+
+
+def voice_tool_limiter() -> anyio.CapacityLimiter:
+    global _voice_tool_limiter
+    if _voice_tool_limiter is None:
+        _voice_tool_limiter = anyio.CapacityLimiter(VOICE_TOOL_THREADS)
+    return _voice_tool_limiter
+
+
+def lane_for(path: str) -> RequestLane:
+    return next(lane for lane in LANES if lane.matches(path))
+
+
+def size_thread_pool():
+    """Give the default thread limiter (sync routes, dependencies) room for every lane at once"""
+    anyio.to_thread.current_default_thread_limiter().total_tokens = sum(lane.capacity for lane in LANES)
+
+
+def lane_stats() -> dict:
+    stats = {}
+    for lane in LANES:
+        limiter = lane._limiter
+        stats[lane.name] = {
+            "capacity": lane.capacity,
+            "in_progress": limiter.borrowed_tokens if limiter else 0,
+            "waiting": limiter.statistics().tasks_waiting if limiter else 0,
+        }
+    return stats
+
+
+class LaneMiddleware:
+    """
+    Pure ASGI middleware putting each HTTP request in its lane: it waits
+    for a slot there (queue depth and wait time go to /metrics), then runs
+    with `current_lane` set. The slot is held until the response body is
+    sent, so a streaming export keeps its back-office slot until done.
+    """
+
+    def __init__(self, app, enabled: bool = LANES_ENABLED):
+        self.app = app
+        self.enabled = enabled
+
+    async def __call__(self, scope, receive, send):
+        if not self.enabled or scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        lane = lane_for(scope["path"])
+        started = time.perf_counter()
+        lane_waiting.inc(lane=lane.name)
+        try:
+            await lane.limiter.acquire()
+        finally:
+            lane_waiting.dec(lane=lane.name)
+        lane_wait_seconds.observe(time.perf_counter() - started, lane=lane.name)
+        lane_in_use.inc(lane=lane.name)
+        token = current_lane.set(lane.name)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            current_lane.reset(token)
+            lane_in_use.dec(lane=lane.name)
+            lane.limiter.release()
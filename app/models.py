@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Boolean, Text, Enum
+from sqlalchemy import Column, Integer, String, Float, Date, DateTime, ForeignKey, Boolean, Text, Enum, Index, UniqueConstraint
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.database import Base
@@ -33,6 +33,13 @@ class OrderStatus(str, enum.Enum):
     COMPLETED = "completed"
     CANCELLED = "cancelled"
 
+class MovementType(str, enum.Enum):
+    SALE = "sale"
+    RESTOCK = "restock"
+    ADJUSTMENT = "adjustment"
+    RETURN = "return"
+    EXPIRY_WRITEOFF = "expiry_writeoff"
+
 class Medicine(Base):
     __tablename__ = "medicines"
     
@@ -48,27 +55,66 @@ class Medicine(Base):
     mrp = Column(Float, nullable=False)
     
     # Stock
-    stock_quantity = Column(Integer, default=0)
+    stock_quantity = Column(Integer, default=0, index=True)
     reorder_level = Column(Integer, default=10)
+    # Units held for ongoing voice calls: SUM(stock_holds.quantity), kept by app.stock_holds
+    held_quantity = Column(Integer, nullable=False, default=0, server_default="0")
     
     # Packaging
     default_packaging = Column(String(50), default="strip")
     units_per_package = Column(Integer, default=10)  # e.g., 10 tablets per strip
     
     # Categories
-    category = Column(String(100), nullable=True)  # e.g., Antibiotic, Painkiller
+    category = Column(String(100), nullable=True, index=True)  # e.g., Antibiotic, Painkiller
     prescription_required = Column(Boolean, default=False)
     
     # Metadata
     batch_number = Column(String(100), nullable=True)
-    expiry_date = Column(DateTime, nullable=True)
-    rack_location = Column(String(50), nullable=True)
+    expiry_date = Column(DateTime, nullable=True, index=True)
+    rack_location = Column(String(50), nullable=True, index=True)
     
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
     # Relationships
     order_items = relationship("OrderItem", back_populates="medicine")
+    batches = relationship("MedicineBatch", back_populates="medicine", cascade="all, delete-orphan")
+
+    # Optimistic concurrency: every ORM UPDATE/DELETE checks and bumps this,
+    # and core relative updates bump it too
+    version_id = Column(Integer, nullable=False, server_default="1")
+    __mapper_args__ = {"version_id_col": version_id}
+
+# Case-insensitive exact name lookups (packaging variants of one medicine)
+Index("ix_medicines_name_lower", func.lower(Medicine.name))
+# Low-stock filter (stock_quantity - reorder_level <= 0) as an indexable expression
+Index("ix_medicines_stock_gap", Medicine.stock_quantity - Medicine.reorder_level)
+
+class MedicineBatch(Base):
+    __tablename__ = "medicine_batches"
+
+    id = Column(Integer, primary_key=True, index=True)
+    medicine_id = Column(Integer, ForeignKey("medicines.id"), nullable=False)
+    receipt_id = Column(Integer, ForeignKey("goods_receipts.id"), nullable=True, index=True)
+
+    batch_number = Column(String(100), nullable=True)
+    expiry_date = Column(DateTime, nullable=True)
+    quantity = Column(Integer, nullable=False, default=0)  # units left in this batch
+    purchase_price = Column(Float, nullable=True)
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+    # Relationships
+    medicine = relationship("Medicine", back_populates="batches")
+    receipt = relationship("GoodsReceipt", back_populates="batches")
+
+    __table_args__ = (
+        # FEFO scans: one medicine's batches in expiry order
+        Index("ix_medicine_batches_medicine_expiry", "medicine_id", "expiry_date"),
+        # Expiry radar: all batches expiring inside a date window
+        Index("ix_medicine_batches_expiry", "expiry_date"),
+    )
 
 class Customer(Base):
     __tablename__ = "customers"
@@ -93,6 +139,9 @@ class Customer(Base):
     # Relationships
     orders = relationship("Order", back_populates="customer")
 
+    version_id = Column(Integer, nullable=False, server_default="1")
+    __mapper_args__ = {"version_id_col": version_id}
+
 class Order(Base):
     __tablename__ = "orders"
     
@@ -100,7 +149,7 @@ class Order(Base):
     order_number = Column(String(50), unique=True, nullable=False, index=True)
     
     # Customer
-    customer_id = Column(Integer, ForeignKey("customers.id"), nullable=False)
+    customer_id = Column(Integer, ForeignKey("customers.id"), nullable=False, index=True)
     
     # Order details
     status = Column(String(20), default="pending")
@@ -118,23 +167,29 @@ class Order(Base):
     prescription_image = Column(String(500), nullable=True)
     
     # Timestamps
-    order_date = Column(DateTime(timezone=True), server_default=func.now())
+    order_date = Column(DateTime(timezone=True), server_default=func.now(), index=True)
     completed_at = Column(DateTime(timezone=True), nullable=True)
     
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
+    # Set by the worker that will finalize a fast-ack order, so recovery in another worker leaves it alone
+    finalize_claimed_at = Column(DateTime, nullable=True)
+    
     # Relationships
     customer = relationship("Customer", back_populates="orders")
     order_items = relationship("OrderItem", back_populates="order", cascade="all, delete-orphan")
     invoice = relationship("Invoice", back_populates="order", uselist=False)
 
+    version_id = Column(Integer, nullable=False, server_default="1")
+    __mapper_args__ = {"version_id_col": version_id}
+
 class OrderItem(Base):
     __tablename__ = "order_items"
     
     id = Column(Integer, primary_key=True, index=True)
-    order_id = Column(Integer, ForeignKey("orders.id"), nullable=False)
-    medicine_id = Column(Integer, ForeignKey("medicines.id"), nullable=False)
+    order_id = Column(Integer, ForeignKey("orders.id"), nullable=False, index=True)
+    medicine_id = Column(Integer, ForeignKey("medicines.id"), nullable=False, index=True)
     
     # Item details
     quantity = Column(Integer, nullable=False)
@@ -148,6 +203,20 @@ class OrderItem(Base):
     # Relationships
     order = relationship("Order", back_populates="order_items")
     medicine = relationship("Medicine", back_populates="order_items")
+    batch_allocations = relationship("OrderItemBatch", back_populates="order_item", cascade="all, delete-orphan")
+
+class OrderItemBatch(Base):
+    """Which batches an order item was filled from (FEFO allocation)"""
+    __tablename__ = "order_item_batches"
+
+    id = Column(Integer, primary_key=True, index=True)
+    order_item_id = Column(Integer, ForeignKey("order_items.id"), nullable=False, index=True)
+    batch_id = Column(Integer, ForeignKey("medicine_batches.id"), nullable=False, index=True)
+    quantity = Column(Integer, nullable=False)
+
+    # Relationships
+    order_item = relationship("OrderItem", back_populates="batch_allocations")
+    batch = relationship("MedicineBatch")
 
 class Invoice(Base):
     __tablename__ = "invoices"
@@ -181,3 +250,128 @@ class Invoice(Base):
     
     # Relationships
     order = relationship("Order", back_populates="invoice")
+
+class ExpiryReport(Base):
+    """Precomputed expiry radar, one row per day and window (filled by the nightly job)"""
+    __tablename__ = "expiry_reports"
+
+    id = Column(Integer, primary_key=True, index=True)
+    report_date = Column(Date, nullable=False)
+    window_days = Column(Integer, nullable=False)
+    payload = Column(Text, nullable=False)  # JSON, same shape as /api/inventory/expiring
+    generated_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        UniqueConstraint("report_date", "window_days", name="uq_expiry_reports_date_window"),
+    )
+
+class GoodsReceipt(Base):
+    """A distributor bill received into stock; its lines become batches"""
+    __tablename__ = "goods_receipts"
+
+    id = Column(Integer, primary_key=True, index=True)
+    supplier_name = Column(String(200), nullable=False)
+    bill_number = Column(String(100), nullable=True)
+    bill_date = Column(DateTime, nullable=True)
+    notes = Column(Text, nullable=True)
+
+    line_count = Column(Integer, default=0)
+    total_quantity = Column(Integer, default=0)
+    total_cost = Column(Float, default=0.0)
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    # Relationships
+    batches = relationship("MedicineBatch", back_populates="receipt")
+
+class StockMovement(Base):
+    """Append-only stock ledger: one signed row per change, never updated or deleted"""
+    __tablename__ = "stock_movements"
+
+    id = Column(Integer, primary_key=True)
+    medicine_id = Column(Integer, ForeignKey("medicines.id"), nullable=False)
+    batch_id = Column(Integer, ForeignKey("medicine_batches.id"), nullable=True)
+
+    movement_type = Column(String(20), nullable=False)  # sale, restock, adjustment, return, expiry_writeoff
+    quantity = Column(Integer, nullable=False)  # signed: + into stock, - out of stock
+    reference = Column(String(100), nullable=True)  # e.g. order:42, batch:7
+    note = Column(Text, nullable=True)
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+    __table_args__ = (
+        # Per-medicine history and snapshot + delta scans
+        Index("ix_stock_movements_medicine_created", "medicine_id", "created_at"),
+        # Daily snapshot job: everything since a boundary
+        Index("ix_stock_movements_created", "created_at"),
+    )
+
+class StockSnapshot(Base):
+    """Stock of each medicine at the end of a day, taken by the nightly job"""
+    __tablename__ = "stock_snapshots"
+
+    id = Column(Integer, primary_key=True)
+    medicine_id = Column(Integer, ForeignKey("medicines.id"), nullable=False)
+    snapshot_date = Column(Date, nullable=False)
+    quantity = Column(Integer, nullable=False)
+    taken_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        UniqueConstraint("medicine_id", "snapshot_date", name="uq_stock_snapshots_medicine_date"),
+    )
+
+class DeadLetter(Base):
+    """Background work that kept failing after its retries, kept for an admin to inspect and re-run"""
+    __tablename__ = "dead_letters"
+
+    id = Column(Integer, primary_key=True)
+    task = Column(String(50), nullable=False)  # finalize_order
+    order_id = Column(Integer, ForeignKey("orders.id"), nullable=True, index=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    last_error = Column(Text, nullable=True)
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    resolved_at = Column(DateTime(timezone=True), nullable=True)
+
+class StockHold(Base):
+    """Units promised to a voice call by check-stock, until it orders or the hold expires"""
+    __tablename__ = "stock_holds"
+
+    id = Column(Integer, primary_key=True)
+    call_id = Column(String(100), nullable=False)
+    medicine_id = Column(Integer, ForeignKey("medicines.id"), nullable=False)
+    quantity = Column(Integer, nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+    __table_args__ = (
+        # One hold per call and medicine; asking again replaces it
+        UniqueConstraint("call_id", "medicine_id", name="uq_stock_holds_call_medicine"),
+        # Held totals per medicine, live holds only
+        Index("ix_stock_holds_medicine_expires", "medicine_id", "expires_at"),
+    )
+
+class CacheEvent(Base):
+    """Cache invalidations for other workers to poll, when the database has no LISTEN/NOTIFY (SQLite)"""
+    __tablename__ = "cache_events"
+
+    id = Column(Integer, primary_key=True)
+    topic = Column(String(50), nullable=False)
+    key = Column(String(100), nullable=True)  # what in the topic changed; NULL for all of it
+    origin = Column(String(32), nullable=False)  # worker that published it
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
+
+class ScheduledRun(Base):
+    """One row per scheduled job run, claimed by the worker that runs it so the others skip it"""
+    __tablename__ = "scheduled_runs"
+
+    id = Column(Integer, primary_key=True)
+    job = Column(String(50), nullable=False)
+    scheduled_for = Column(DateTime, nullable=False)
+    worker = Column(String(64), nullable=False)
+    claimed_at = Column(DateTime(timezone=True), server_default=func.now())
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+    failed = Column(Boolean, nullable=False, default=False)
+
+    __table_args__ = (
+        UniqueConstraint("job", "scheduled_for", name="uq_scheduled_runs_job_time"),
+    )
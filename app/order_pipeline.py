@@ -0,0 +1,156 @@
+from datetime import datetime, timedelta
+from sqlalchemy import exists, or_, update
+from sqlalchemy.orm import Session
+from app import models
+from app.database import SessionLocal
+from app.services.order_service import OrderService
+from typing import List, Tuple
+import heapq
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger("app.order_pipeline")
+
+FINALIZE_MAX_ATTEMPTS = int(os.getenv("FINALIZE_MAX_ATTEMPTS", "5"))
+FINALIZE_RETRY_DELAY = float(os.getenv("FINALIZE_RETRY_DELAY", "2"))
+# A claimed order whose worker hasn't finalized it after this long is recovered by the next startup
+FINALIZE_CLAIM_TTL = float(os.getenv("FINALIZE_CLAIM_TTL", "600"))
+
+
+class OrderFinalizer:
+    """
+    Background pipeline finishing fast-ack orders (invoice, customer stats,
+    PDF) on a single daemon thread. A failed attempt is retried with
+    exponential backoff; after `max_attempts` the order goes to the
+    dead_letters table. Queued work is in memory only, so on startup
+    recover() re-queues (and claims) confirmed orders that still have no
+    invoice.
+    """
+
+    def __init__(self, max_attempts: int, retry_delay: float, claim_ttl: float = FINALIZE_CLAIM_TTL,
+                 session_factory=SessionLocal):
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.claim_ttl = claim_ttl
+        self.session_factory = session_factory
+        self._queue: List[Tuple[float, int, int, int]] = []  # heap of (due, seq, order_id, attempt)
+        self._seq = 0
+        self._cond = threading.Condition()
+        self._stop = False
+        self._thread = None
+        self.finalized = 0
+        self.retried = 0
+        self.dead_lettered = 0
+
+    def submit(self, order_id: int, attempt: int = 1, delay: float = 0.0):
+        with self._cond:
+            self._seq += 1
+            heapq.heappush(self._queue, (time.monotonic() + delay, self._seq, order_id, attempt))
+            self._cond.notify()
+
+    def run(self, order_id: int, attempt: int):
+        db = self.session_factory()
+        try:
+            if OrderService.finalize_order(db, order_id) is not None:
+                self.finalized += 1
+        except Exception as exc:
+            db.rollback()
+            if attempt < self.max_attempts:
+                delay = self.retry_delay * 2 ** (attempt - 1)
+                logger.warning("finalizing order %s failed (attempt %s), retrying in %.0fs",
+                               order_id, attempt, delay, exc_info=True)
+                self.retried += 1
+                self.submit(order_id, attempt + 1, delay)
+            else:
+                logger.exception("finalizing order %s failed after %s attempts", order_id, attempt)
+                self._dead_letter(db, order_id, attempt, exc)
+        finally:
+            db.close()
+
+    def _dead_letter(self, db: Session, order_id: int, attempts: int, exc: Exception):
+        try:
+            db.add(models.DeadLetter(task="finalize_order", order_id=order_id,
+                                     attempts=attempts, last_error=repr(exc)))
+            db.commit()
+            self.dead_lettered += 1
+        except Exception:
+            db.rollback()
+            logger.exception("could not dead-letter order %s", order_id)
+
+    def recover(self):
+        """
+        Queue confirmed orders left without an invoice (e.g. by a restart)
+        and not dead-lettered. Every worker runs this at startup, so each
+        order is claimed first with one conditional UPDATE: only orders
+        nobody claimed, or whose claim is older than `claim_ttl` (its
+        worker died), are taken, and of several workers recovering at once
+        exactly one gets each order.
+        """
+        orders = models.Order.__table__
+        now = datetime.now()
+        db = self.session_factory()
+        try:
+            pending = db.execute(
+                # version_id is left alone: a claim is not an edit of the order
+                update(orders)
+                .where(
+                    orders.c.status.in_(("confirmed", "completed")),
+                    ~exists().where(models.Invoice.order_id == orders.c.id),
+                    ~exists().where(
+                        models.DeadLetter.order_id == orders.c.id,
+                        models.DeadLetter.resolved_at.is_(None)
+                    ),
+                    or_(orders.c.finalize_claimed_at.is_(None),
+                        orders.c.finalize_claimed_at < now - timedelta(seconds=self.claim_ttl)),
+                )
+                .values(finalize_claimed_at=now)
+                .returning(orders.c.id)
+            ).scalars().all()
+            db.commit()
+        finally:
+            db.close()
+        for order_id in pending:
+            self.submit(order_id)
+        if pending:
+            logger.info("re-queued %s orders awaiting finalization", len(pending))
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                while not self._stop and (not self._queue or self._queue[0][0] > time.monotonic()):
+                    timeout = self._queue[0][0] - time.monotonic() if self._queue else None
+                    self._cond.wait(timeout)
+                if self._stop:
+                    return
+                _, _, order_id, attempt = heapq.heappop(self._queue)
+            self.run(order_id, attempt)
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop = False
+        self._thread = threading.Thread(target=self._loop, name="order-finalizer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._stop = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def stats(self) -> dict:
+        with self._cond:
+            queued = len(self._queue)
+        return {
+            "queued": queued,
+            "finalized": self.finalized,
+            "retried": self.retried,
+            "dead_lettered": self.dead_lettered,
+        }
+
+
+order_finalizer = OrderFinalizer(FINALIZE_MAX_ATTEMPTS, FINALIZE_RETRY_DELAY)
@@ -0,0 +1,18 @@
+import re
+
+DEFAULT_COUNTRY_CODE = "91"
+
+
+def normalize_phone(raw) -> str:
+    """
+    One spelling per phone number, used wherever customers are stored or
+    looked up by phone: "+91 98765 43210", "9876543210", "098765-43210"
+    and "0091 9876543210" all become "+919876543210". Leading zeros (trunk
+    or international prefix) are dropped; a 10-digit national number gets
+    the default country code, and longer numbers are taken as already
+    carrying one.
+    """
+    digits = re.sub(r'\D', '', str(raw or "")).lstrip("0")
+    if len(digits) > 10:
+        return "+" + digits
+    return "+" + DEFAULT_COUNTRY_CODE + digits.zfill(10)
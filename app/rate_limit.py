@@ -0,0 +1,212 @@
+from collections import OrderedDict
+from typing import Optional, Tuple
+from app import metrics
+from app.lanes import LANE_VOICE_CAPACITY
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger("app.rate_limit")
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() in ("1", "true", "yes")
+RATE_LIMIT_PATHS = tuple(p.strip() for p in os.getenv("RATE_LIMIT_PATHS", "/api/vapi/,/api/ai-agent/").split(",") if p.strip())
+RATE_LIMIT_PER_MINUTE = float(os.getenv("RATE_LIMIT_PER_MINUTE", "120"))
+RATE_LIMIT_BURST = int(os.getenv("RATE_LIMIT_BURST", "20"))
+RATE_LIMIT_REDIS_URL = os.getenv("RATE_LIMIT_REDIS_URL")
+# Same as the voice lane's slots by default: a webhook admitted here never queues for a lane slot,
+# and one that would have to is shed with 503 instead
+WEBHOOK_MAX_CONCURRENCY = int(os.getenv("WEBHOOK_MAX_CONCURRENCY", str(LANE_VOICE_CAPACITY)))
+WEBHOOK_MAX_BODY_BYTES = int(os.getenv("WEBHOOK_MAX_BODY_BYTES", str(64 * 1024)))
+
+throttled_requests_total = metrics.registry.counter(
+    "throttled_requests_total", "Webhook requests rejected before reaching a handler", ("prefix", "reason"))
+webhook_requests_in_flight = metrics.registry.gauge(
+    "webhook_requests_in_flight", "Rate-limited webhook requests currently being served")
+
+
+class MemoryBucketStore:
+    """Token buckets in process memory (per worker), least recently used keys evicted past `max_keys`"""
+
+    def __init__(self, max_keys: int = 10000):
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()  # key -> (tokens, updated_at)
+        self._lock = threading.Lock()
+
+    def take(self, key: str, rate: float, burst: int) -> float:
+        """Take one token; returns 0 if allowed, else seconds until a token is available"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.pop(key, (float(burst), now))
+            tokens = min(float(burst), tokens + (now - updated_at) * rate)
+            retry_after = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                retry_after = (1 - tokens) / rate
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+            return retry_after
+
+
+class RedisBucketStore:
+    """
+    Token buckets shared by every worker through Redis (optional `redis`
+    package). The refill-and-take runs as one Lua script, so concurrent
+    workers never double-spend a token.
+    """
+
+    SCRIPT = """
+    local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated_at')
+    local rate, burst, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+    local tokens = tonumber(bucket[1]) or burst
+    local updated_at = tonumber(bucket[2]) or now
+    tokens = math.min(burst, tokens + math.max(0, now - updated_at) * rate)
+    local retry_after = 0
+    if tokens >= 1 then tokens = tokens - 1 else retry_after = (1 - tokens) / rate end
+    redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated_at', now)
+    redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+    return tostring(retry_after)
+    """
+
+    def __init__(self, url: str, prefix: str = "ratelimit:"):
+        import redis  # optional dependency, only needed for a shared store
+
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url)
+        self._script = self._client.register_script(self.SCRIPT)
+
+    def take(self, key: str, rate: float, burst: int) -> float:
+        return float(self._script(keys=[self.prefix + key], args=[rate, burst, time.time()]))
+
+
+def bucket_key(body: bytes, client_host: Optional[str]) -> str:
+    """Caller number, else assistant id, from the payload; the client address as a last resort"""
+    try:
+        payload = json.loads(body) if body else {}
+    except ValueError:
+        payload = {}
+    if isinstance(payload, dict):
+        message = payload.get("message") if isinstance(payload.get("message"), dict) else {}
+        call = message.get("call") if isinstance(message.get("call"), dict) else {}
+        customer = call.get("customer") or message.get("customer") or {}
+        assistant = message.get("assistant") or {}
+        caller = (customer.get("number") if isinstance(customer, dict) else None) or payload.get("customer_phone")
+        if caller:
+            return f"caller:{caller}"
+        assistant_id = call.get("assistantId") or (assistant.get("id") if isinstance(assistant, dict) else None)
+        if assistant_id:
+            return f"assistant:{assistant_id}"
+    return f"ip:{client_host or 'unknown'}"
+
+
+class WebhookLimiter:
+    """
+    Pure ASGI middleware in front of the unauthenticated webhook routes.
+    Requests over the caller's token bucket get 429, requests beyond
+    `max_concurrency` in flight get 503 and bodies over `max_body_bytes`
+    get 413 (checked against Content-Length, then while reading), all
+    before the route runs, so a runaway assistant never gets to open DB
+    sessions or fill memory. Other paths pass straight through.
+    """
+
+    def __init__(self, app, prefixes=RATE_LIMIT_PATHS, per_minute: float = RATE_LIMIT_PER_MINUTE,
+                 burst: int = RATE_LIMIT_BURST, max_concurrency: int = WEBHOOK_MAX_CONCURRENCY,
+                 max_body_bytes: int = WEBHOOK_MAX_BODY_BYTES, store=None, enabled: bool = RATE_LIMIT_ENABLED):
+        self.app = app
+        self.prefixes = prefixes
+        self.rate = per_minute / 60.0
+        self.burst = burst
+        self.max_concurrency = max_concurrency
+        self.max_body_bytes = max_body_bytes
+        self.enabled = enabled
+        self.in_flight = 0
+        if store is None:
+            store = RedisBucketStore(RATE_LIMIT_REDIS_URL) if RATE_LIMIT_REDIS_URL else MemoryBucketStore()
+        self.store = store
+
+    async def __call__(self, scope, receive, send):
+        prefix = None
+        if self.enabled and scope["type"] == "http":
+            prefix = next((p for p in self.prefixes if scope["path"].startswith(p)), None)
+        if prefix is None:
+            await self.app(scope, receive, send)
+            return
+
+        if self.in_flight >= self.max_concurrency:
+            throttled_requests_total.inc(prefix=prefix, reason="overloaded")
+            await self._reject(send, 503, "Server busy, try again shortly", 1)
+            return
+
+        content_length = dict(scope.get("headers") or ()).get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > self.max_body_bytes:
+            throttled_requests_total.inc(prefix=prefix, reason="too_large")
+            await self._reject(send, 413, "Request body too large")
+            return
+
+        # The key lives in the JSON body: read it here and replay it to the app
+        self.in_flight += 1
+        webhook_requests_in_flight.inc()
+        try:
+            chunks = []
+            size = 0
+            more_body = True
+            while more_body:
+                message = await receive()
+                if message["type"] == "http.disconnect":
+                    return
+                chunk = message.get("body", b"")
+                size += len(chunk)
+                if size > self.max_body_bytes:
+                    # Chunked or understated Content-Length
+                    throttled_requests_total.inc(prefix=prefix, reason="too_large")
+                    await self._reject(send, 413, "Request body too large")
+                    return
+                chunks.append(chunk)
+                more_body = message.get("more_body", False)
+            body = b"".join(chunks)
+
+            client = scope.get("client")
+            key = bucket_key(body, client[0] if client else None)
+            try:
+                retry_after = self.store.take(key, self.rate, self.burst)
+            except Exception:
+                # A shared store being down must not take the webhooks with it
+                logger.exception("rate limit store failed, letting the request through")
+                retry_after = 0.0
+            if retry_after > 0:
+                throttled_requests_total.inc(prefix=prefix, reason="rate_limited")
+                await self._reject(send, 429, "Too many requests", retry_after)
+                return
+
+            replayed = False
+
+            async def replay():
+                nonlocal replayed
+                if not replayed:
+                    replayed = True
+                    return {"type": "http.request", "body": body, "more_body": False}
+                return await receive()
+
+            await self.app(scope, replay, send)
+        finally:
+            self.in_flight -= 1
+            webhook_requests_in_flight.dec()
+
+    @staticmethod
+    async def _reject(send, status_code: int, detail: str, retry_after: Optional[float] = None):
+        body = json.dumps({"detail": detail}).encode()
+        headers = [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+        ]
+        if retry_after is not None:
+            headers.append((b"retry-after", str(max(1, int(retry_after + 0.999))).encode()))
+        await send({
+            "type": "http.response.start",
+            "status": status_code,
+            "headers": headers,
+        })
+        await send({"type": "http.response.body", "body": body})
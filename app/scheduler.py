@@ -0,0 +1,138 @@
+from sqlalchemy import func, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+from app import models
+from app.database import SessionLocal
+from app.services.inventory_service import InventoryService
+from app.services.stock_service import StockService
+from datetime import date, datetime, timedelta
+from typing import Callable, List, Optional, Tuple
+import logging
+import os
+import socket
+import threading
+
+logger = logging.getLogger("app.scheduler")
+
+SCHEDULER_ENABLED = os.getenv("SCHEDULER_ENABLED", "true").lower() in ("1", "true", "yes")
+EXPIRY_REPORT_TIME = os.getenv("EXPIRY_REPORT_TIME", "02:00")
+STOCK_SNAPSHOT_TIME = os.getenv("STOCK_SNAPSHOT_TIME", "00:05")
+EXPIRY_REPORT_WINDOWS = [int(d) for d in os.getenv("EXPIRY_REPORT_WINDOWS", "30,90").split(",") if d.strip()]
+
+
+class DailyScheduler:
+    """
+    Runs registered jobs once a day at a fixed local time on a single
+    daemon thread. Jobs get their own DB session; a failing job is logged
+    and retried at the next run, never taking the thread down. Every
+    worker runs a scheduler, so each run is claimed in the scheduled_runs
+    table first and only the worker that claims it runs the job.
+    """
+
+    def __init__(self, session_factory=SessionLocal):
+        self.session_factory = session_factory
+        self.worker = f"{socket.gethostname()}:{os.getpid()}"[:64]
+        self._jobs: List[Tuple[str, int, int, Callable]] = []
+        self._stop = threading.Event()
+        self._thread = None
+
+    def daily(self, at: str, name: str = None):
+        """Decorator registering `fn(db)` to run every day at HH:MM"""
+        hour, minute = (int(part) for part in at.split(":"))
+
+        def register(fn):
+            self._jobs.append((name or fn.__name__, hour, minute, fn))
+            return fn
+        return register
+
+    @staticmethod
+    def _next_run(now: datetime, hour: int, minute: int) -> datetime:
+        run = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+        return run if run > now else run + timedelta(days=1)
+
+    def claim(self, db: Session, name: str, scheduled_for: datetime) -> bool:
+        """Insert the run's row; False when another worker already has it"""
+        runs = models.ScheduledRun.__table__
+        insert = postgresql.insert if db.get_bind().dialect.name == "postgresql" else sqlite.insert
+        claimed = db.execute(
+            insert(runs)
+            .values(job=name, scheduled_for=scheduled_for, worker=self.worker, failed=False)
+            .on_conflict_do_nothing(index_elements=[runs.c.job, runs.c.scheduled_for])
+            .returning(runs.c.id)
+        ).scalar()
+        db.commit()
+        return claimed is not None
+
+    def _finish(self, db: Session, name: str, scheduled_for: datetime, failed: bool):
+        runs = models.ScheduledRun.__table__
+        db.execute(
+            update(runs)
+            .where(runs.c.job == name, runs.c.scheduled_for == scheduled_for)
+            .values(finished_at=func.now(), failed=failed)
+        )
+        db.commit()
+
+    def run_job(self, name: str, fn: Callable, scheduled_for: Optional[datetime] = None):
+        """
+        Run one job. With `scheduled_for` (the scheduler's own runs) the run
+        is claimed first, and skipped when another worker has claimed it.
+        """
+        db = self.session_factory()
+        try:
+            if scheduled_for is not None and not self.claim(db, name, scheduled_for):
+                logger.info("scheduled job %s for %s runs in another worker", name, scheduled_for)
+                return
+            failed = False
+            try:
+                fn(db)
+                logger.info("scheduled job %s finished", name)
+            except Exception:
+                db.rollback()
+                failed = True
+                logger.exception("scheduled job %s failed", name)
+            if scheduled_for is not None:
+                self._finish(db, name, scheduled_for, failed)
+        except Exception:
+            db.rollback()
+            logger.exception("scheduled job %s could not be claimed or recorded", name)
+        finally:
+            db.close()
+
+    def _loop(self):
+        pending = {name: self._next_run(datetime.now(), hour, minute) for name, hour, minute, _ in self._jobs}
+        while not self._stop.is_set():
+            now = datetime.now()
+            for name, hour, minute, fn in self._jobs:
+                if pending[name] <= now:
+                    self.run_job(name, fn, pending[name])
+                    pending[name] = self._next_run(datetime.now(), hour, minute)
+            wait = min(pending.values()) - datetime.now() if pending else timedelta(hours=1)
+            # Wake at least once a minute so clock changes are picked up
+            self._stop.wait(max(1.0, min(wait.total_seconds(), 60.0)))
+
+    def start(self):
+        if self._thread is not None or not self._jobs:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="daily-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+
+scheduler = DailyScheduler()
+
+
+@scheduler.daily(EXPIRY_REPORT_TIME, name="expiry_report")
+def precompute_expiry_reports(db):
+    for days in EXPIRY_REPORT_WINDOWS:
+        InventoryService.generate_expiry_report(db, days)
+
+
+@scheduler.daily(STOCK_SNAPSHOT_TIME, name="stock_snapshot")
+def snapshot_stock(db):
+    StockService.take_snapshot(db, date.today() - timedelta(days=1))
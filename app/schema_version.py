@@ -0,0 +1,64 @@
+from typing import Optional
+from app.database import engine
+import logging
+import os
+
+logger = logging.getLogger("app.schema")
+
+# error: refuse to start on an out-of-date schema, warn: log and carry on, off: skip the check
+SCHEMA_CHECK = os.getenv("SCHEMA_CHECK", "error").lower()
+ALEMBIC_INI = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "alembic.ini")
+
+
+class SchemaVersionError(RuntimeError):
+    pass
+
+
+def alembic_config():
+    from alembic.config import Config
+
+    config = Config(ALEMBIC_INI)
+    config.attributes["configure_logger"] = False
+    # Resolve migrations/ from the ini's folder, not the current directory
+    config.set_main_option("script_location", os.path.join(os.path.dirname(ALEMBIC_INI), "migrations"))
+    return config
+
+
+def head_revision() -> Optional[str]:
+    from alembic.script import ScriptDirectory
+
+    return ScriptDirectory.from_config(alembic_config()).get_current_head()
+
+
+def current_revision(bind=engine) -> Optional[str]:
+    from alembic.runtime.migration import MigrationContext
+
+    with bind.connect() as conn:
+        return MigrationContext.configure(conn).get_current_revision()
+
+
+def upgrade_to_head():
+    """Apply pending migrations (same as `alembic upgrade head`)"""
+    from alembic import command
+
+    command.upgrade(alembic_config(), "head")
+
+
+def check_schema_version(bind=engine, mode: str = SCHEMA_CHECK):
+    """
+    Compare the database's alembic revision with the newest migration.
+    Only reads the version table; schema changes are applied by
+    `alembic upgrade head` as a deploy step, never by the app itself.
+    """
+    if mode == "off":
+        return
+    current, head = current_revision(bind), head_revision()
+    if current == head:
+        logger.info("database schema at revision %s", current)
+        return
+    message = (f"database schema is at revision {current or 'none'}, the code expects {head}; "
+               f"run `alembic upgrade head`")
+    if mode == "warn":
+        logger.warning(message)
+        return
+    raise SchemaVersionError(message)
@@ -1,6 +1,6 @@
 from pydantic import BaseModel, EmailStr, validator
 from typing import Optional, List
-from datetime import datetime
+from datetime import date, datetime
 from enum import Enum
 
 
@@ -21,6 +21,14 @@ class OrderStatusEnum(str, Enum):
     CANCELLED = "cancelled"
 
 
+class StockMovementTypeEnum(str, Enum):
+    SALE = "sale"
+    RESTOCK = "restock"
+    ADJUSTMENT = "adjustment"
+    RETURN = "return"
+    EXPIRY_WRITEOFF = "expiry_writeoff"
+
+
 class PaymentMethodEnum(str, Enum):
     CASH = "cash"
     CARD = "card"
@@ -45,6 +53,7 @@ class MedicineBase(BaseModel):
     category: Optional[str] = None
     prescription_required: bool = False
     batch_number: Optional[str] = None
+    expiry_date: Optional[datetime] = None
     rack_location: Optional[str] = None
 
 
@@ -69,12 +78,134 @@ class MedicineUpdate(BaseModel):
 
 class MedicineResponse(MedicineBase):
     id: int
+    version_id: int = 1
     created_at: datetime
 
     class Config:
         from_attributes = True
 
 
+class MedicineBatchCreate(BaseModel):
+    batch_number: Optional[str] = None
+    expiry_date: Optional[datetime] = None
+    quantity: int
+    purchase_price: Optional[float] = None
+
+    @validator('quantity')
+    def validate_quantity(cls, v):
+        if v <= 0:
+            raise ValueError('Batch quantity must be positive')
+        return v
+
+
+class MedicineBatchResponse(BaseModel):
+    id: int
+    medicine_id: int
+    receipt_id: Optional[int] = None
+    batch_number: Optional[str] = None
+    expiry_date: Optional[datetime] = None
+    quantity: int
+    purchase_price: Optional[float] = None
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
+class GoodsReceiptLine(BaseModel):
+    medicine_id: int
+    quantity: int  # units
+    batch_number: Optional[str] = None
+    expiry_date: Optional[datetime] = None
+    purchase_price: Optional[float] = None  # per unit
+
+    @validator('quantity')
+    def validate_quantity(cls, v):
+        if v <= 0:
+            raise ValueError('Received quantity must be positive')
+        return v
+
+
+class GoodsReceiptCreate(BaseModel):
+    supplier_name: str
+    bill_number: Optional[str] = None
+    bill_date: Optional[datetime] = None
+    notes: Optional[str] = None
+    lines: List[GoodsReceiptLine]
+
+    @validator('lines')
+    def validate_lines(cls, v):
+        if not v:
+            raise ValueError('Receipt must have at least one line')
+        if len(v) > 1000:
+            raise ValueError('Receipt cannot have more than 1000 lines')
+        return v
+
+
+class GoodsReceiptResponse(BaseModel):
+    id: int
+    supplier_name: str
+    bill_number: Optional[str] = None
+    bill_date: Optional[datetime] = None
+    notes: Optional[str] = None
+    line_count: int
+    total_quantity: int
+    total_cost: float
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
+class GoodsReceiptDetailResponse(GoodsReceiptResponse):
+    batches: List[MedicineBatchResponse] = []
+
+
+class StockAdjustmentCreate(BaseModel):
+    quantity: int  # signed: negative takes stock out
+    movement_type: StockMovementTypeEnum = StockMovementTypeEnum.ADJUSTMENT
+    batch_id: Optional[int] = None
+    note: Optional[str] = None
+
+    @validator('quantity')
+    def validate_quantity(cls, v):
+        if v == 0:
+            raise ValueError('Adjustment quantity must not be zero')
+        return v
+
+    @validator('movement_type')
+    def validate_movement_type(cls, v, values):
+        quantity = values.get('quantity') or 0
+        if v in (StockMovementTypeEnum.SALE, StockMovementTypeEnum.RESTOCK):
+            raise ValueError('Sales and restocks are recorded by orders and batches')
+        if v == StockMovementTypeEnum.EXPIRY_WRITEOFF and quantity > 0:
+            raise ValueError('Expiry write-offs must be negative')
+        if v == StockMovementTypeEnum.RETURN and quantity < 0:
+            raise ValueError('Returns must be positive')
+        return v
+
+
+class StockMovementResponse(BaseModel):
+    id: int
+    medicine_id: int
+    batch_id: Optional[int] = None
+    movement_type: str
+    quantity: int
+    reference: Optional[str] = None
+    note: Optional[str] = None
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
+class StockAtResponse(BaseModel):
+    medicine_id: int
+    at: datetime
+    quantity: int
+    snapshot_date: Optional[date] = None
+
+
 # ================= CUSTOMER =================
 
 class CustomerBase(BaseModel):
@@ -94,6 +225,7 @@ class CustomerResponse(CustomerBase):
     id: int
     total_orders: int = 0
     total_amount_spent: float = 0.0
+    version_id: int = 1
     created_at: datetime
 
     class Config:
@@ -166,6 +298,7 @@ class OrderCreate(BaseModel):
 class OrderResponse(BaseModel):
     id: int
     order_number: str
+    version_id: int = 1
     customer: CustomerResponse
     status: str
     total_amount: float
@@ -176,6 +309,7 @@ class OrderResponse(BaseModel):
     language_used: Optional[str]
     notes: Optional[str]
     order_date: datetime
+    completed_at: Optional[datetime] = None
     order_items: List[OrderItemResponse]
     invoice: Optional[InvoiceResponse] = None   # ✅ ADDED (only change)
 
@@ -183,6 +317,28 @@ class OrderResponse(BaseModel):
         from_attributes = True
 
 
+class OrderStatusUpdate(BaseModel):
+    status: OrderStatusEnum
+
+
+class BulkOrderStatusUpdate(BaseModel):
+    status: OrderStatusEnum
+    order_ids: Optional[List[int]] = None
+    order_date: Optional[date] = None  # every order placed that day
+
+    @validator('order_date', always=True)
+    def validate_selection(cls, v, values):
+        if (v is None) == (values.get('order_ids') is None):
+            raise ValueError('Give either order_ids or order_date')
+        return v
+
+
+class BulkOrderStatusResult(BaseModel):
+    status: str
+    updated: List[int]
+    skipped: List[int] = []  # requested ids not in a state that allows the change
+
+
 # ================= AI AGENT =================
 
 class AIAgentOrderRequest(BaseModel):
@@ -204,6 +360,19 @@ class AIAgentOrderResponse(BaseModel):
     invoice_pdf_url: Optional[str] = None
 
 
+class DeadLetterResponse(BaseModel):
+    id: int
+    task: str
+    order_id: Optional[int] = None
+    attempts: int
+    last_error: Optional[str] = None
+    created_at: datetime
+    resolved_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+
 # ================= SEARCH =================
 
 class MedicineSearchRequest(BaseModel):
@@ -216,6 +385,43 @@ class MedicineSearchResponse(BaseModel):
     total: int
 
 
+class MedicineListResponse(BaseModel):
+    items: List[MedicineResponse]
+    total: int
+    low_stock: int
+    out_of_stock: int
+
+
+class ExpiringItem(BaseModel):
+    medicine_id: int
+    name: str
+    rack_location: Optional[str] = None
+    batch_count: int
+    earliest_expiry: datetime
+    quantity_at_risk: int
+    value_at_risk: float
+    cost_at_risk: float
+
+
+class ExpiryReportResponse(BaseModel):
+    window_days: int
+    generated_at: datetime
+    items: List[ExpiringItem]
+    total_quantity_at_risk: int
+    total_value_at_risk: float
+    total_cost_at_risk: float
+
+
+class MedicineTypeaheadItem(BaseModel):
+    id: int
+    name: str
+    name_hindi: Optional[str] = None
+    default_packaging: Optional[str] = None
+    units_per_package: Optional[int] = None
+    price_per_unit: float
+    stock_quantity: int = 0
+
+
 # ================= AUTH =================
 
 class UserRegister(BaseModel):
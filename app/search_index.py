@@ -0,0 +1,194 @@
+from sqlalchemy import select
+from app import models
+from app.cache import catalogue_cache, SingleFlight
+from app.database import SessionLocal
+from typing import List
+import bisect
+import threading
+import unicodedata
+
+# Lower value ranks first when several fields match the same prefix
+PRIORITY_NAME = 0
+PRIORITY_NAME_WORD = 1
+PRIORITY_HINDI = 2
+PRIORITY_GENERIC = 3
+
+# Upper bound on sorted-array entries inspected per lookup, so a one
+# letter prefix over a large catalogue stays cheap
+MAX_SCAN = 500
+
+
+def normalize(text: str) -> str:
+    """Case-fold and compact a name so 'Dolo  650' and 'dolo 650' share a key"""
+    if not text:
+        return ""
+    text = unicodedata.normalize("NFKC", text.replace("\ufeff", ""))
+    return " ".join(text.casefold().split())
+
+
+class TypeaheadIndex:
+    """
+    Sorted array of normalized name keys searched with bisect.
+
+    Each medicine contributes its full name, every word start within the
+    name, its Hindi name and its generic name, so "650" finds "Dolo 650"
+    and "पैरा" finds Paracetamol. The index is rebuilt lazily when a
+    medicine is added, edited or removed (the catalogue's names_version),
+    with concurrent rebuilds coalesced into one. Sales and restocks don't
+    rebuild it: the stock of the few medicines a search returns is read
+    by primary key instead.
+    """
+
+    def __init__(self, session_factory=SessionLocal):
+        self.session_factory = session_factory
+        self._keys: List[str] = []
+        self._postings: List[tuple] = []  # (priority, medicine_id), aligned with _keys
+        self._entries = {}
+        self._version = -1
+        self._lock = threading.Lock()
+        self._flight = SingleFlight()
+
+    @staticmethod
+    def _keys_for(row) -> List[tuple]:
+        keys = []
+        name = normalize(row.name)
+        if name:
+            keys.append((name, PRIORITY_NAME))
+            words = name.split(" ")
+            for i in range(1, len(words)):
+                keys.append((" ".join(words[i:]), PRIORITY_NAME_WORD))
+        for value, priority in ((row.name_hindi, PRIORITY_HINDI), (row.generic_name, PRIORITY_GENERIC)):
+            value = normalize(value)
+            if value:
+                keys.append((value, priority))
+        return keys
+
+    def _build(self, version: int):
+        db = self.session_factory()
+        try:
+            rows = db.execute(
+                select(
+                    models.Medicine.id,
+                    models.Medicine.name,
+                    models.Medicine.name_hindi,
+                    models.Medicine.generic_name,
+                    models.Medicine.default_packaging,
+                    models.Medicine.units_per_package,
+                    models.Medicine.price_per_unit,
+                    models.Medicine.stock_quantity,
+                )
+            ).all()
+        finally:
+            db.close()
+
+        pairs = []
+        entries = {}
+        for row in rows:
+            entries[row.id] = {
+                "id": row.id,
+                "name": row.name,
+                "name_hindi": row.name_hindi,
+                "default_packaging": row.default_packaging,
+                "units_per_package": row.units_per_package,
+                "price_per_unit": row.price_per_unit,
+                "stock_quantity": row.stock_quantity,
+            }
+            for key, priority in self._keys_for(row):
+                pairs.append((key, priority, row.id))
+        pairs.sort()
+
+        with self._lock:
+            if version < self._version:
+                return
+            self._keys = [key for key, _, _ in pairs]
+            self._postings = [(priority, medicine_id) for _, priority, medicine_id in pairs]
+            self._entries = entries
+            self._version = version
+
+    def ensure_current(self):
+        version = catalogue_cache.names_version
+        if self._version != version:
+            self._flight.do(version, lambda: self._build(version))
+
+    def _current_stock(self, medicine_ids: List[int]) -> dict:
+        db = self.session_factory()
+        try:
+            return dict(db.execute(
+                select(models.Medicine.id, models.Medicine.stock_quantity)
+                .where(models.Medicine.id.in_(medicine_ids))
+            ).all())
+        finally:
+            db.close()
+
+    def search(self, query: str, limit: int = 10) -> List[dict]:
+        prefix = normalize(query)
+        if not prefix:
+            return []
+        self.ensure_current()
+
+        with self._lock:
+            keys, postings, entries = self._keys, self._postings, self._entries
+
+        best = {}
+        start = bisect.bisect_left(keys, prefix)
+        end = min(len(keys), start + MAX_SCAN)
+        for i in range(start, end):
+            if not keys[i].startswith(prefix):
+                break
+            priority, medicine_id = postings[i]
+            if priority < best.get(medicine_id, (99,))[0]:
+                best[medicine_id] = (priority, keys[i])
+
+        ranked = sorted(best.items(), key=lambda item: (item[1][0], len(item[1][1]), item[1][1]))
+        medicine_ids = [medicine_id for medicine_id, _ in ranked[:limit]]
+        if not medicine_ids:
+            return []
+        stock = self._current_stock(medicine_ids)
+        return [
+            dict(entries[medicine_id], stock_quantity=stock[medicine_id])
+            for medicine_id in medicine_ids if medicine_id in stock
+        ]
+
+
+typeahead_index = TypeaheadIndex()
+
+
+class VariantMap:
+    """
+    Normalized medicine name -> all packaging variants (serialized), filled
+    lazily per name and dropped wholesale whenever the catalogue version
+    moves, so repeat pack-size lookups are a dictionary hit.
+    """
+
+    def __init__(self):
+        self._variants = {}
+        self._version = -1
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(name: str) -> str:
+        return (name or "").strip().replace("\ufeff", "").lower()
+
+    def get(self, name: str, loader) -> List[dict]:
+        """`loader(name)` returns the variant dicts on a miss"""
+        key = self.key(name)
+        version = catalogue_cache.version
+        with self._lock:
+            if self._version != version:
+                self._variants = {}
+                self._version = version
+            variants = self._variants.get(key)
+        if variants is not None:
+            return variants
+
+        variants = loader(key)
+        with self._lock:
+            if self._version == version:
+                self._variants[key] = variants
+        return variants
+
+    def __len__(self) -> int:
+        return len(self._variants)
+
+
+variant_map = VariantMap()
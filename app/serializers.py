@@ -0,0 +1,51 @@
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+from typing import Any, List
+from app import schemas
+import json
+import os
+
+try:
+    import orjson
+except ImportError:  # optional speed-up, stdlib json is the fallback
+    orjson = None
+
+# Opt-in: hot list/detail endpoints bypass FastAPI's response_model
+# validation + jsonable_encoder and serialize with a precompiled adapter
+FAST_JSON_ENABLED = os.getenv("FAST_JSON_RESPONSES", "false").lower() in ("1", "true", "yes")
+
+
+class FastJSONResponse(JSONResponse):
+    """JSON response that accepts pre-rendered bytes or renders with orjson"""
+
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, (bytes, bytearray)):
+            return bytes(content)
+        if orjson is not None:
+            return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+        return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class CompiledSerializer:
+    """
+    Wraps a pydantic TypeAdapter built once at import time, so the core
+    validator/serializer for a response schema is compiled exactly once
+    instead of being rebuilt by FastAPI's per-route field machinery.
+    """
+
+    def __init__(self, schema_type):
+        self.adapter = TypeAdapter(schema_type)
+
+    def to_python(self, obj) -> Any:
+        return self.adapter.dump_python(self.adapter.validate_python(obj, from_attributes=True), mode="json")
+
+    def to_json(self, obj) -> bytes:
+        return self.adapter.dump_json(self.adapter.validate_python(obj, from_attributes=True))
+
+    def response(self, obj, **kwargs) -> FastJSONResponse:
+        return FastJSONResponse(self.to_json(obj), **kwargs)
+
+
+medicine_list_serializer = CompiledSerializer(List[schemas.MedicineResponse])
+medicine_search_serializer = CompiledSerializer(schemas.MedicineSearchResponse)
+order_list_serializer = CompiledSerializer(List[schemas.OrderResponse])
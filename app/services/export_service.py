@@ -0,0 +1,145 @@
+from sqlalchemy import select
+from app import models
+from app.database import SessionLocal
+from datetime import date, datetime, timedelta
+from typing import Optional
+import csv
+import io
+import json
+
+# Rows fetched per round trip from the server-side cursor
+EXPORT_BATCH_SIZE = 1000
+
+# Column layout of every export: (header, SQL column)
+ORDER_COLUMNS = [
+    ("order_number", models.Order.order_number),
+    ("order_date", models.Order.order_date),
+    ("status", models.Order.status),
+    ("customer_name", models.Customer.name),
+    ("customer_phone", models.Customer.phone),
+    ("order_source", models.Order.order_source),
+    ("language_used", models.Order.language_used),
+    ("total_amount", models.Order.total_amount),
+    ("discount_amount", models.Order.discount_amount),
+    ("tax_amount", models.Order.tax_amount),
+    ("final_amount", models.Order.final_amount),
+    ("completed_at", models.Order.completed_at),
+]
+
+CUSTOMER_COLUMNS = [
+    ("id", models.Customer.id),
+    ("name", models.Customer.name),
+    ("phone", models.Customer.phone),
+    ("email", models.Customer.email),
+    ("address", models.Customer.address),
+    ("is_regular", models.Customer.is_regular),
+    ("customer_id", models.Customer.customer_id),
+    ("total_orders", models.Customer.total_orders),
+    ("total_amount_spent", models.Customer.total_amount_spent),
+    ("created_at", models.Customer.created_at),
+]
+
+MEDICINE_COLUMNS = [
+    ("id", models.Medicine.id),
+    ("name", models.Medicine.name),
+    ("name_hindi", models.Medicine.name_hindi),
+    ("generic_name", models.Medicine.generic_name),
+    ("company", models.Medicine.company),
+    ("category", models.Medicine.category),
+    ("price_per_unit", models.Medicine.price_per_unit),
+    ("mrp", models.Medicine.mrp),
+    ("stock_quantity", models.Medicine.stock_quantity),
+    ("reorder_level", models.Medicine.reorder_level),
+    ("default_packaging", models.Medicine.default_packaging),
+    ("units_per_package", models.Medicine.units_per_package),
+    ("prescription_required", models.Medicine.prescription_required),
+    ("batch_number", models.Medicine.batch_number),
+    ("expiry_date", models.Medicine.expiry_date),
+    ("rack_location", models.Medicine.rack_location),
+    ("created_at", models.Medicine.created_at),
+]
+
+EXPORT_FORMATS = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+}
+
+
+class ExportService:
+
+    @staticmethod
+    def orders_query(start_date: Optional[date] = None, end_date: Optional[date] = None):
+        stmt = (
+            select(*[col for _, col in ORDER_COLUMNS])
+            .join(models.Customer, models.Order.customer_id == models.Customer.id)
+            .order_by(models.Order.order_date, models.Order.id)
+        )
+        return ExportService._date_range(stmt, models.Order.order_date, start_date, end_date)
+
+    @staticmethod
+    def customers_query(start_date: Optional[date] = None, end_date: Optional[date] = None):
+        stmt = select(*[col for _, col in CUSTOMER_COLUMNS]).order_by(models.Customer.id)
+        return ExportService._date_range(stmt, models.Customer.created_at, start_date, end_date)
+
+    @staticmethod
+    def medicines_query(start_date: Optional[date] = None, end_date: Optional[date] = None):
+        stmt = select(*[col for _, col in MEDICINE_COLUMNS]).order_by(models.Medicine.id)
+        return ExportService._date_range(stmt, models.Medicine.created_at, start_date, end_date)
+
+    @staticmethod
+    def _date_range(stmt, column, start_date: Optional[date], end_date: Optional[date]):
+        """Filter on an inclusive [start_date, end_date] calendar range"""
+        if start_date:
+            stmt = stmt.where(column >= datetime.combine(start_date, datetime.min.time()))
+        if end_date:
+            stmt = stmt.where(column < datetime.combine(end_date + timedelta(days=1), datetime.min.time()))
+        return stmt
+
+    @staticmethod
+    def _format_value(value):
+        if isinstance(value, datetime):
+            return value.isoformat()
+        return value
+
+    @staticmethod
+    def iter_rows(stmt, session_factory=SessionLocal):
+        """
+        Yield plain row tuples from a server-side cursor.
+        The session is owned by the generator so it stays open for the
+        whole response body and is closed as soon as streaming stops.
+        """
+        db = session_factory()
+        try:
+            result = db.execute(
+                stmt.execution_options(stream_results=True, yield_per=EXPORT_BATCH_SIZE)
+            )
+            for partition in result.partitions():
+                yield partition
+        finally:
+            db.close()
+
+    @staticmethod
+    def stream(stmt, columns, fmt: str, session_factory=SessionLocal):
+        """Encode streamed rows as CSV or NDJSON, one chunk per cursor batch"""
+        headers = [name for name, _ in columns]
+        fmt_value = ExportService._format_value
+
+        if fmt == "csv":
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(headers)
+            yield buffer.getvalue()
+            for partition in ExportService.iter_rows(stmt, session_factory):
+                buffer.seek(0)
+                buffer.truncate()
+                writer.writerows(partition)
+                yield buffer.getvalue()
+        else:
+            for partition in ExportService.iter_rows(stmt, session_factory):
+                yield "".join(
+                    json.dumps(
+                        {name: fmt_value(value) for name, value in zip(headers, row)},
+                        ensure_ascii=False
+                    ) + "\n"
+                    for row in partition
+                )
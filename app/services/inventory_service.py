@@ -0,0 +1,239 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import func, case, or_, select, exists, literal, union_all
+from sqlalchemy.exc import IntegrityError
+from app import models
+from datetime import date, datetime, timedelta
+from typing import Optional
+import json
+
+# status filter -> SQL condition; the stock gap form matches ix_medicines_stock_gap
+STOCK_STATUS_FILTERS = {
+    "low_stock": lambda: (models.Medicine.stock_quantity - models.Medicine.reorder_level) <= 0,
+    "out_of_stock": lambda: models.Medicine.stock_quantity <= 0,
+    "in_stock": lambda: models.Medicine.stock_quantity > 0,
+}
+
+SORT_COLUMNS = {
+    "name": models.Medicine.name,
+    "stock": models.Medicine.stock_quantity,
+    "expiry": models.Medicine.expiry_date,
+    "category": models.Medicine.category,
+    "rack": models.Medicine.rack_location,
+    "price": models.Medicine.price_per_unit,
+}
+
+
+class InventoryService:
+
+    @staticmethod
+    def list_medicines(
+        db: Session,
+        status: Optional[str] = None,
+        category: Optional[str] = None,
+        rack: Optional[str] = None,
+        expiring_within_days: Optional[int] = None,
+        prescription_required: Optional[bool] = None,
+        q: Optional[str] = None,
+        sort: str = "name",
+        skip: int = 0,
+        limit: int = 50,
+    ):
+        """
+        Filtered, sorted page of medicines. The total and the low / out of
+        stock counts over the whole filtered set ride along on every row as
+        window aggregates, so one round trip returns the page and its counts.
+        """
+        if status and status not in STOCK_STATUS_FILTERS:
+            raise ValueError(f"Unknown status filter: {status}")
+        descending = sort.startswith("-")
+        sort_column = SORT_COLUMNS.get(sort.lstrip("-"))
+        if sort_column is None:
+            raise ValueError(f"Unknown sort field: {sort}")
+
+        filters = []
+        if status:
+            filters.append(STOCK_STATUS_FILTERS[status]())
+        if category:
+            filters.append(models.Medicine.category == category)
+        if rack:
+            filters.append(models.Medicine.rack_location == rack)
+        if expiring_within_days is not None:
+            filters.append(models.Medicine.expiry_date.isnot(None))
+            filters.append(models.Medicine.expiry_date <= datetime.now() + timedelta(days=expiring_within_days))
+        if prescription_required is not None:
+            filters.append(models.Medicine.prescription_required == prescription_required)
+        if q:
+            filters.append(or_(
+                models.Medicine.name.ilike(f"%{q}%"),
+                models.Medicine.generic_name.ilike(f"%{q}%"),
+                models.Medicine.category.ilike(f"%{q}%"),
+            ))
+
+        total = func.count().over().label("total")
+        low_stock = func.sum(
+            case((STOCK_STATUS_FILTERS["low_stock"](), 1), else_=0)
+        ).over().label("low_stock")
+        out_of_stock = func.sum(
+            case((STOCK_STATUS_FILTERS["out_of_stock"](), 1), else_=0)
+        ).over().label("out_of_stock")
+
+        order = sort_column.desc() if descending else sort_column.asc()
+        rows = (
+            db.query(models.Medicine, total, low_stock, out_of_stock)
+            .filter(*filters)
+            .order_by(order, models.Medicine.id)
+            .offset(skip)
+            .limit(limit)
+            .all()
+        )
+
+        if rows:
+            _, total_count, low_count, out_count = rows[0]
+        elif skip:
+            # Page past the end: counts still describe the filtered set
+            total_count, low_count, out_count = (
+                db.query(
+                    func.count(),
+                    func.coalesce(func.sum(case((STOCK_STATUS_FILTERS["low_stock"](), 1), else_=0)), 0),
+                    func.coalesce(func.sum(case((STOCK_STATUS_FILTERS["out_of_stock"](), 1), else_=0)), 0),
+                )
+                .select_from(models.Medicine)
+                .filter(*filters)
+                .one()
+            )
+        else:
+            total_count = low_count = out_count = 0
+
+        return {
+            "items": [row[0] for row in rows],
+            "total": total_count,
+            "low_stock": low_count or 0,
+            "out_of_stock": out_count or 0,
+        }
+
+    @staticmethod
+    def expiring(db: Session, days: int = 30, include_expired: bool = True) -> dict:
+        """
+        Stock expiring within `days`, per medicine, with quantity / value /
+        cost at risk summed in SQL. Batches are authoritative; medicines
+        without any batch rows fall back to their own expiry_date and stock.
+        """
+        now = datetime.now()
+        horizon = now + timedelta(days=days)
+        Batch = models.MedicineBatch
+        Medicine = models.Medicine
+
+        batch_filters = [Batch.quantity > 0, Batch.expiry_date.isnot(None), Batch.expiry_date <= horizon]
+        medicine_filters = [
+            Medicine.stock_quantity > 0,
+            Medicine.expiry_date.isnot(None),
+            Medicine.expiry_date <= horizon,
+            ~exists().where(Batch.medicine_id == Medicine.id),
+        ]
+        if not include_expired:
+            batch_filters.append(Batch.expiry_date >= now)
+            medicine_filters.append(Medicine.expiry_date >= now)
+
+        from_batches = (
+            select(
+                Medicine.id.label("medicine_id"),
+                Medicine.name.label("name"),
+                Medicine.rack_location.label("rack_location"),
+                func.count(Batch.id).label("batch_count"),
+                func.min(Batch.expiry_date).label("earliest_expiry"),
+                func.sum(Batch.quantity).label("quantity_at_risk"),
+                func.sum(Batch.quantity * Medicine.price_per_unit).label("value_at_risk"),
+                func.sum(Batch.quantity * func.coalesce(Batch.purchase_price, 0.0)).label("cost_at_risk"),
+            )
+            .join(Medicine, Medicine.id == Batch.medicine_id)
+            .where(*batch_filters)
+            .group_by(Medicine.id, Medicine.name, Medicine.rack_location)
+        )
+        from_medicines = select(
+            Medicine.id,
+            Medicine.name,
+            Medicine.rack_location,
+            literal(0),
+            Medicine.expiry_date,
+            Medicine.stock_quantity,
+            Medicine.stock_quantity * Medicine.price_per_unit,
+            literal(0.0),
+        ).where(*medicine_filters)
+
+        at_risk = union_all(from_batches, from_medicines).subquery()
+        rows = db.execute(
+            select(
+                at_risk,
+                func.sum(at_risk.c.quantity_at_risk).over().label("total_quantity"),
+                func.sum(at_risk.c.value_at_risk).over().label("total_value"),
+                func.sum(at_risk.c.cost_at_risk).over().label("total_cost"),
+            ).order_by(at_risk.c.earliest_expiry, at_risk.c.medicine_id)
+        ).all()
+
+        items = [
+            {
+                "medicine_id": row.medicine_id,
+                "name": row.name,
+                "rack_location": row.rack_location,
+                "batch_count": row.batch_count,
+                "earliest_expiry": row.earliest_expiry,
+                "quantity_at_risk": row.quantity_at_risk,
+                "value_at_risk": round(row.value_at_risk or 0.0, 2),
+                "cost_at_risk": round(row.cost_at_risk or 0.0, 2),
+            }
+            for row in rows
+        ]
+        first = rows[0] if rows else None
+        return {
+            "window_days": days,
+            "generated_at": now,
+            "items": items,
+            "total_quantity_at_risk": first.total_quantity if first else 0,
+            "total_value_at_risk": round(first.total_value or 0.0, 2) if first else 0.0,
+            "total_cost_at_risk": round(first.total_cost or 0.0, 2) if first else 0.0,
+        }
+
+    @staticmethod
+    def generate_expiry_report(db: Session, days: int, report_date: date = None) -> models.ExpiryReport:
+        """Compute the expiry radar and store it as the report for `report_date` (idempotent)"""
+        report_date = report_date or date.today()
+        existing = db.query(models.ExpiryReport).filter(
+            models.ExpiryReport.report_date == report_date,
+            models.ExpiryReport.window_days == days
+        ).first()
+        if existing:
+            return existing
+
+        payload = InventoryService.expiring(db, days)
+        report = models.ExpiryReport(
+            report_date=report_date,
+            window_days=days,
+            payload=json.dumps(payload, default=lambda v: v.isoformat())
+        )
+        db.add(report)
+        try:
+            db.commit()
+        except IntegrityError:
+            # Another worker stored the same report first
+            db.rollback()
+            return db.query(models.ExpiryReport).filter(
+                models.ExpiryReport.report_date == report_date,
+                models.ExpiryReport.window_days == days
+            ).first()
+        db.refresh(report)
+        return report
+
+    @staticmethod
+    def latest_expiry_report(db: Session, days: int) -> dict:
+        """
+        Today's precomputed report if the nightly job has stored one, else
+        the live radar. A read never stores a report: that is the
+        scheduler's job, so GETs stay read-only.
+        """
+        report = db.query(models.ExpiryReport).filter(
+            models.ExpiryReport.report_date == date.today(),
+            models.ExpiryReport.window_days == days
+        ).first()
+        if report is None:
+            return InventoryService.expiring(db, days)
+        return json.loads(report.payload)
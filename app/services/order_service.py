@@ -1,23 +1,37 @@
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, joinedload, selectinload
 from app import models, schemas
-from datetime import datetime
-from sqlalchemy import func
-from app.services.invoice_service import InvoiceGenerator
+from datetime import date, datetime, timedelta
+from sqlalchemy import bindparam, case, func, or_, update
+from sqlalchemy.dialects import postgresql, sqlite
+from app.cache import catalogue_cache, customer_ids
+from app.phones import normalize_phone
+from app.services.stock_service import StockService
+from app.stock_holds import stock_holds
+from collections import defaultdict
+from typing import List, Optional
 import os
+import secrets
+
+# Target status -> statuses an order may move to it from
+ORDER_TRANSITIONS = {
+    "confirmed": ("pending",),
+    "completed": ("confirmed",),
+    "cancelled": ("pending", "confirmed"),
+}
 
 class OrderService:
     
     @staticmethod
     def generate_order_number():
-        """Generate unique order number"""
+        """Generate unique order number (random suffix: several orders can land in the same second)"""
         timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-        return f"ORD-{timestamp}"
+        return f"ORD-{timestamp}-{secrets.token_hex(3).upper()}"
     
     @staticmethod
     def generate_invoice_number():
         """Generate unique invoice number"""
         timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-        return f"INV-{timestamp}"
+        return f"INV-{timestamp}-{secrets.token_hex(3).upper()}"
 
     @staticmethod
     def search_medicine(db: Session, query: str, limit: int = 10):
@@ -35,11 +49,13 @@ class OrderService:
 
     @staticmethod
     def get_medicines_by_name(db: Session, name: str):
-        clean_name = name.strip().replace("\ufeff", "")
+        # Lower-case the literal in Python so the comparison is against
+        # lower(name) alone and can use ix_medicines_name_lower
+        clean_name = name.strip().replace("\ufeff", "").lower()
 
         variants = (
             db.query(models.Medicine)
-            .filter(func.lower(models.Medicine.name) == func.lower(clean_name))
+            .filter(func.lower(models.Medicine.name) == clean_name)
             .order_by(models.Medicine.default_packaging)
             .all()
         )
@@ -47,36 +63,177 @@ class OrderService:
         return variants
 
     @staticmethod
-    def get_or_create_customer(db: Session, name: str, phone: str, address: str = None):
-        """Get existing customer or create new one"""
-        # Check if customer exists
-        customer = db.query(models.Customer).filter(
-            models.Customer.phone == phone
-        ).first()
-        
-        if customer:
-            # Update name and address if provided
-            if name and name != customer.name:
-                customer.name = name
-            if address:
-                customer.address = address
-            db.commit()
-            db.refresh(customer)
-            return customer
-        
-        # Create new customer
-        new_customer = models.Customer(
-            name=name,
-            phone=phone,
-            address=address
+    def upsert_customer(db: Session, name: str, phone: str, address: str = None) -> int:
+        """
+        Customer id for `phone` (normalized, see app.phones), creating the
+        customer or updating the name and address given (last caller wins)
+        in one INSERT ... ON CONFLICT.
+        Runs in the caller's transaction; callers put the id in
+        `customer_ids` once it commits. Known callers whose details haven't
+        changed skip the database.
+        """
+        phone = normalize_phone(phone)
+        cached = customer_ids.get(phone)
+        if cached is not None:
+            customer_id, cached_name, cached_address = cached
+            if (not name or name == cached_name) and (not address or address == cached_address):
+                return customer_id
+
+        customers = models.Customer.__table__
+        insert = postgresql.insert if db.get_bind().dialect.name == "postgresql" else sqlite.insert
+        stmt = insert(customers).values(name=name, phone=phone, address=address)
+        new_name = func.coalesce(func.nullif(stmt.excluded.name, ""), customers.c.name)
+        new_address = func.coalesce(func.nullif(stmt.excluded.address, ""), customers.c.address)
+        changed = or_(customers.c.name.is_distinct_from(new_name),
+                      customers.c.address.is_distinct_from(new_address))
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[customers.c.phone],
+            set_={
+                "name": new_name,
+                "address": new_address,
+                "version_id": customers.c.version_id + case((changed, 1), else_=0),
+                "updated_at": case((changed, func.now()), else_=customers.c.updated_at),
+            },
+        ).returning(customers.c.id)
+        return db.execute(stmt).scalar_one()
+    
+    @staticmethod
+    def add_customer_stats(db: Session, customer_id: int, orders: int, amount: float):
+        """Relative increment so concurrent orders for one customer never conflict"""
+        customers = models.Customer.__table__
+        db.execute(
+            update(customers)
+            .where(customers.c.id == customer_id)
+            .values(
+                total_orders=func.coalesce(customers.c.total_orders, 0) + orders,
+                total_amount_spent=func.coalesce(customers.c.total_amount_spent, 0.0) + amount,
+                version_id=customers.c.version_id + 1
+            )
         )
-        db.add(new_customer)
+
+    @staticmethod
+    def change_status(db: Session, new_status: str, order_ids: Optional[List[int]] = None,
+                      order_date: Optional[date] = None, expected_version: Optional[int] = None) -> List[int]:
+        """
+        Move orders to `new_status` in one UPDATE ... RETURNING, touching only
+        orders whose current status allows it. Cancelling puts their stock
+        back and takes them out of the customers' totals; completing stamps
+        completed_at. Returns the ids that changed. Caller commits.
+        """
+        allowed_from = ORDER_TRANSITIONS.get(new_status)
+        if not allowed_from:
+            raise ValueError(f"Orders cannot be moved to '{new_status}'")
+
+        orders = models.Order.__table__
+        stmt = update(orders).where(orders.c.status.in_(allowed_from))
+        if order_ids is not None:
+            stmt = stmt.where(orders.c.id.in_(order_ids))
+        if order_date is not None:
+            day_start = datetime.combine(order_date, datetime.min.time())
+            stmt = stmt.where(orders.c.order_date >= day_start, orders.c.order_date < day_start + timedelta(days=1))
+        if expected_version is not None:
+            stmt = stmt.where(orders.c.version_id == expected_version)
+        values = {"status": new_status, "version_id": orders.c.version_id + 1}
+        if new_status == "completed":
+            values["completed_at"] = func.now()
+        changed = db.execute(
+            stmt.values(**values).returning(orders.c.id, orders.c.customer_id, orders.c.final_amount)
+        ).all()
+
+        if new_status == "cancelled" and changed:
+            StockService.restore(db, [row.id for row in changed])
+            # Fast-ack orders count towards customer totals only once invoiced
+            billed = {order_id for (order_id,) in db.query(models.Invoice.order_id).filter(
+                models.Invoice.order_id.in_([row.id for row in changed]))}
+            per_customer = defaultdict(lambda: [0, 0.0])
+            for row in changed:
+                if row.id not in billed:
+                    continue
+                per_customer[row.customer_id][0] += 1
+                per_customer[row.customer_id][1] += row.final_amount or 0.0
+            customers = models.Customer.__table__
+            if per_customer:
+                db.execute(
+                    update(customers)
+                    .where(customers.c.id == bindparam("c_id"))
+                    .values(
+                        total_orders=customers.c.total_orders - bindparam("orders"),
+                        total_amount_spent=customers.c.total_amount_spent - bindparam("amount"),
+                        version_id=customers.c.version_id + 1
+                    ),
+                    [{"c_id": customer_id, "orders": n, "amount": amount}
+                     for customer_id, (n, amount) in per_customer.items()]
+                )
+        return [row.id for row in changed]
+
+    @staticmethod
+    def add_invoice(db: Session, order: models.Order) -> models.Invoice:
+        """Unpaid invoice for the order's totals (caller commits)"""
+        invoice = models.Invoice(
+            invoice_number=OrderService.generate_invoice_number(),
+            order_id=order.id,
+            subtotal=order.total_amount,
+            discount=order.discount_amount,
+            tax_rate=0.0,  # You can add GST calculation here
+            tax_amount=order.tax_amount,
+            total_amount=order.final_amount,
+            payment_status="unpaid"
+        )
+        db.add(invoice)
+        return invoice
+
+    @staticmethod
+    def render_invoice_pdf(db: Session, order: models.Order, invoice: models.Invoice) -> str:
+        """Write the invoice PDF and store its path"""
+        pdf_dir = "invoices"
+        os.makedirs(pdf_dir, exist_ok=True)
+        pdf_path = os.path.join(pdf_dir, f"{invoice.invoice_number}.pdf")
+
+        from app.services.invoice_service import InvoiceGenerator  # ReportLab loads on first PDF
+
+        invoice_generator = InvoiceGenerator()
+        invoice_generator.generate_invoice_pdf(order, invoice, pdf_path)
+        
+        invoice.pdf_path = pdf_path
         db.commit()
-        db.refresh(new_customer)
-        return new_customer
-    
+        return pdf_path
+
     @staticmethod
-    def create_order_from_ai_agent(db: Session, order_data: schemas.AIAgentOrderRequest):
+    def finalize_order(db: Session, order_id: int) -> Optional[models.Invoice]:
+        """
+        Second half of a fast-ack order: invoice plus customer stats in one
+        commit, then the PDF. Safe to re-run after a failure at any step
+        (the invoice is the marker that stats were added). Cancelled orders
+        that never got an invoice are left alone; returns None for them.
+        """
+        order = (
+            db.query(models.Order)
+            .options(
+                joinedload(models.Order.customer),
+                joinedload(models.Order.invoice),
+                selectinload(models.Order.order_items).joinedload(models.OrderItem.medicine),
+            )
+            .filter(models.Order.id == order_id)
+            .with_for_update(of=models.Order)
+            .first()
+        )
+        if order is None:
+            raise ValueError(f"Order {order_id} not found")
+        invoice = order.invoice
+        if invoice is None:
+            if order.status == "cancelled":
+                db.rollback()
+                return None
+            invoice = OrderService.add_invoice(db, order)
+            OrderService.add_customer_stats(db, order.customer_id, 1, order.final_amount)
+            db.commit()
+        if not invoice.pdf_path:
+            OrderService.render_invoice_pdf(db, order, invoice)
+        return invoice
+
+    @staticmethod
+    def create_order_from_ai_agent(db: Session, order_data: schemas.AIAgentOrderRequest,
+                                   call_id: Optional[str] = None, defer_finalize: bool = False):
         """
         Process order from AI voice agent
         1. Find/create customer
@@ -84,20 +241,26 @@ class OrderService:
         3. Create order with items
         4. Generate invoice
         5. Return order details
+
+        Stock held for other calls is not available; the holds of `call_id`
+        itself are used up by the order and released once it commits.
+        With `defer_finalize` the call stops after step 3 and the caller
+        queues finalize_order() for the rest.
         """
         try:
             # Get or create customer
-            customer = OrderService.get_or_create_customer(
+            phone = normalize_phone(order_data.customer_phone)
+            customer_id = OrderService.upsert_customer(
                 db,
                 name=order_data.customer_name,
-                phone=order_data.customer_phone,
+                phone=phone,
                 address=order_data.customer_address
             )
             
             # Create order
             order = models.Order(
                 order_number=OrderService.generate_order_number(),
-                customer_id=customer.id,
+                customer_id=customer_id,
                 order_source="ai-agent",
                 language_used=order_data.language,
                 status="pending"
@@ -105,9 +268,8 @@ class OrderService:
             db.add(order)
             db.flush()  # Get order ID
             
-            # Process medicines and create order items
-            total_amount = 0.0
-            order_items = []
+            # Resolve medicine names first, then lock the matched rows
+            resolved = []
             missing_medicines = []
             
             for med_request in order_data.medicines:
@@ -115,6 +277,11 @@ class OrderService:
                 quantity = med_request.get("quantity", 1)
                 packaging = med_request.get("packaging", "strip")
                 
+                # Already resolved earlier in the call (Vapi call cache)
+                if med_request.get("medicine_id"):
+                    resolved.append((med_name, med_request["medicine_id"], quantity, packaging))
+                    continue
+                
                 # Search for medicine
                 medicines = OrderService.search_medicine(db, med_name, limit=1)
                 
@@ -122,12 +289,29 @@ class OrderService:
                     missing_medicines.append(med_name)
                     continue
                 
-                medicine = medicines[0]
+                resolved.append((med_name, medicines[0].id, quantity, packaging))
+            
+            locked = StockService.lock_medicines(db, [medicine_id for _, medicine_id, _, _ in resolved])
+            sellable = StockService.sellable_quantities(db, locked.values())
+            
+            # Process medicines and create order items
+            total_amount = 0.0
+            order_items = []
+            requested = defaultdict(int)
+            
+            for med_name, medicine_id, quantity, packaging in resolved:
+                medicine = locked.get(medicine_id)
+                if medicine is None:
+                    missing_medicines.append(med_name)
+                    continue
                 
-                # Check stock
-                if medicine.stock_quantity < quantity:
+                # Check stock (across all lines for the same medicine, excluding expired
+                # batches, net of other calls' holds)
+                available = stock_holds.available(db.connection(), medicine_id, sellable[medicine_id], call_id)
+                if available < requested[medicine_id] + quantity:
                     missing_medicines.append(f"{med_name} (insufficient stock)")
                     continue
+                requested[medicine_id] += quantity
                 
                 # Calculate price
                 item_total = medicine.price_per_unit * quantity
@@ -144,9 +328,6 @@ class OrderService:
                 db.add(order_item)
                 order_items.append(order_item)
                 
-                # Update stock
-                medicine.stock_quantity -= quantity
-                
                 total_amount += item_total
             
             # Check if we have any items
@@ -158,6 +339,10 @@ class OrderService:
                     "missing_medicines": missing_medicines
                 }
             
+            # Update stock: totals plus FEFO batch allocation
+            db.flush()
+            StockService.consume(db, order_items)
+            
             # Calculate totals
             discount = 0.0
             tax_rate = 0.0  # You can add GST calculation here
@@ -170,46 +355,39 @@ class OrderService:
             order.final_amount = final_amount
             order.status = "confirmed"
             
-            # Create invoice
-            invoice = models.Invoice(
-                invoice_number=OrderService.generate_invoice_number(),
-                order_id=order.id,
-                subtotal=total_amount,
-                discount=discount,
-                tax_rate=tax_rate,
-                tax_amount=tax_amount,
-                total_amount=final_amount,
-                payment_status="unpaid"
-            )
-            db.add(invoice)
-            
-            # Update customer stats
-            customer.total_orders += 1
-            customer.total_amount_spent += final_amount
-            
-            db.commit()
-            db.refresh(order)
-            db.refresh(invoice)
+            # The call's holds on what it just bought go in the same transaction
+            stock_holds.release(db.connection(), call_id, requested.keys(), converted=True)
             
-            # Generate PDF
-            pdf_dir = "invoices"
-            os.makedirs(pdf_dir, exist_ok=True)
-            pdf_filename = f"{invoice.invoice_number}.pdf"
-            pdf_path = os.path.join(pdf_dir, pdf_filename)
-            
-            invoice_generator = InvoiceGenerator()
-            invoice_generator.generate_invoice_pdf(order, invoice, pdf_path)
-            
-            # Update invoice with PDF path
-            invoice.pdf_path = pdf_path
-            db.commit()
+            if defer_finalize:
+                # Fast-ack: stock is taken and the order number is final; the
+                # invoice, PDF and customer stats follow in finalize_order(),
+                # queued by this worker, which claims the order for it
+                order.finalize_claimed_at = datetime.now()
+                db.commit()
+                catalogue_cache.bump()
+                customer_ids.put(phone, customer_id,
+                                 order_data.customer_name, order_data.customer_address)
+                invoice_number = pdf_path = None
+            else:
+                invoice = OrderService.add_invoice(db, order)
+                OrderService.add_customer_stats(db, customer_id, 1, final_amount)
+                
+                db.commit()
+                catalogue_cache.bump()
+                customer_ids.put(phone, customer_id,
+                                 order_data.customer_name, order_data.customer_address)
+                db.refresh(order)
+                db.refresh(invoice)
+                
+                pdf_path = OrderService.render_invoice_pdf(db, order, invoice)
+                invoice_number = invoice.invoice_number
             
             response = {
                 "success": True,
                 "message": "Order created successfully! आर्डर सफलतापूर्वक बन गया!",
                 "order_id": order.id,
                 "order_number": order.order_number,
-                "invoice_number": invoice.invoice_number,
+                "invoice_number": invoice_number,
                 "total_amount": final_amount,
                 "invoice_pdf_url": pdf_path
             }
@@ -231,17 +409,18 @@ class OrderService:
         """Create order from manual entry or web interface"""
         try:
             # Get or create customer
-            customer = OrderService.get_or_create_customer(
+            phone = normalize_phone(order_data.customer_phone)
+            customer_id = OrderService.upsert_customer(
                 db,
                 name=order_data.customer_name,
-                phone=order_data.customer_phone,
+                phone=phone,
                 address=order_data.customer_address
             )
             
             # Create order
             order = models.Order(
                 order_number=OrderService.generate_order_number(),
-                customer_id=customer.id,
+                customer_id=customer_id,
                 order_source=order_data.order_source,
                 language_used=order_data.language_used,
                 notes=order_data.notes,
@@ -252,17 +431,21 @@ class OrderService:
             
             # Process items
             total_amount = 0.0
+            order_items = []
+            requested = defaultdict(int)
+            medicines = StockService.lock_medicines(db, [item.medicine_id for item in order_data.items])
+            sellable = StockService.sellable_quantities(db, medicines.values())
             
             for item_data in order_data.items:
-                medicine = db.query(models.Medicine).filter(
-                    models.Medicine.id == item_data.medicine_id
-                ).first()
+                medicine = medicines.get(item_data.medicine_id)
                 
                 if not medicine:
                     db.rollback()
                     raise ValueError(f"Medicine ID {item_data.medicine_id} not found")
                 
-                if medicine.stock_quantity < item_data.quantity:
+                requested[medicine.id] += item_data.quantity
+                # Expired batches and units held for an ongoing voice call are not for sale here
+                if stock_holds.available(db.connection(), medicine.id, sellable[medicine.id]) < requested[medicine.id]:
                     db.rollback()
                     raise ValueError(f"Insufficient stock for {medicine.name}")
                 
@@ -277,10 +460,14 @@ class OrderService:
                     total_price=item_total
                 )
                 db.add(order_item)
+                order_items.append(order_item)
                 
-                medicine.stock_quantity -= item_data.quantity
                 total_amount += item_total
             
+            # Update stock: totals plus FEFO batch allocation
+            db.flush()
+            StockService.consume(db, order_items)
+            
             # Calculate totals
             discount = 0.0
             tax_rate = 0.0
@@ -293,38 +480,19 @@ class OrderService:
             order.final_amount = final_amount
             order.status = "confirmed"
             
-            # Create invoice
-            invoice = models.Invoice(
-                invoice_number=OrderService.generate_invoice_number(),
-                order_id=order.id,
-                subtotal=total_amount,
-                discount=discount,
-                tax_rate=tax_rate,
-                tax_amount=tax_amount,
-                total_amount=final_amount,
-                payment_status="unpaid"
-            )
-            db.add(invoice)
+            invoice = OrderService.add_invoice(db, order)
             
             # Update customer stats
-            customer.total_orders += 1
-            customer.total_amount_spent += final_amount
+            OrderService.add_customer_stats(db, customer_id, 1, final_amount)
             
             db.commit()
+            catalogue_cache.bump()
+            customer_ids.put(phone, customer_id,
+                             order_data.customer_name, order_data.customer_address)
             db.refresh(order)
             db.refresh(invoice)
             
-            # Generate PDF
-            pdf_dir = "invoices"
-            os.makedirs(pdf_dir, exist_ok=True)
-            pdf_filename = f"{invoice.invoice_number}.pdf"
-            pdf_path = os.path.join(pdf_dir, pdf_filename)
-            
-            invoice_generator = InvoiceGenerator()
-            invoice_generator.generate_invoice_pdf(order, invoice, pdf_path)
-            
-            invoice.pdf_path = pdf_path
-            db.commit()
+            OrderService.render_invoice_pdf(db, order, invoice)
             
             return order
             
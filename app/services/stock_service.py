@@ -0,0 +1,445 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import select, update, insert, bindparam, case, func, or_, exists, literal
+from app import models
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+from typing import Dict, Iterable, List, Optional
+
+medicines_table = models.Medicine.__table__
+batches_table = models.MedicineBatch.__table__
+movements_table = models.StockMovement.__table__
+order_items_table = models.OrderItem.__table__
+allocations_table = models.OrderItemBatch.__table__
+snapshots_table = models.StockSnapshot.__table__
+
+
+class StockService:
+    """
+    All stock mutations go through here. Medicine.stock_quantity is the
+    running total (kept incrementally with relative UPDATEs, never by
+    aggregating batches), MedicineBatch rows hold the per-batch split and
+    every change is also appended to the StockMovement ledger in the same
+    transaction.
+    """
+
+    @staticmethod
+    def lock_medicines(db: Session, medicine_ids: Iterable[int]) -> Dict[int, models.Medicine]:
+        """Load and row-lock the medicines an order touches, in id order to avoid deadlocks"""
+        ids = sorted(set(medicine_ids))
+        if not ids:
+            return {}
+        medicines = (
+            db.query(models.Medicine)
+            .filter(models.Medicine.id.in_(ids))
+            .order_by(models.Medicine.id)
+            .with_for_update()
+            .all()
+        )
+        return {m.id: m for m in medicines}
+
+    @staticmethod
+    def adjust_totals(db: Session, deltas: Dict[int, int]):
+        """stock_quantity = stock_quantity + :delta for many medicines in one executemany (bumps version_id)"""
+        params = [{"m_id": medicine_id, "delta": delta} for medicine_id, delta in deltas.items() if delta]
+        if not params:
+            return
+        db.execute(
+            update(medicines_table)
+            .where(medicines_table.c.id == bindparam("m_id"))
+            .values(
+                stock_quantity=medicines_table.c.stock_quantity + bindparam("delta"),
+                version_id=medicines_table.c.version_id + 1
+            ),
+            params
+        )
+
+    @staticmethod
+    def fefo_candidates(db: Session, demand: Dict[int, int]):
+        """
+        Batches that FEFO would draw from to cover `demand` (medicine_id ->
+        units), with each batch's cumulative supply range [start, end) in
+        first-expiry-first-out order. Computed in one windowed SELECT;
+        expired and empty batches are skipped, undated batches go last.
+        """
+        if not demand:
+            return []
+        order = (
+            models.MedicineBatch.expiry_date.is_(None),
+            models.MedicineBatch.expiry_date,
+            models.MedicineBatch.id,
+        )
+        cumulative = func.sum(models.MedicineBatch.quantity).over(
+            partition_by=models.MedicineBatch.medicine_id, order_by=order
+        )
+        supply = (
+            select(
+                models.MedicineBatch.id,
+                models.MedicineBatch.medicine_id,
+                (cumulative - models.MedicineBatch.quantity).label("supply_start"),
+                cumulative.label("supply_end"),
+            )
+            .where(
+                models.MedicineBatch.medicine_id.in_(list(demand)),
+                models.MedicineBatch.quantity > 0,
+                or_(models.MedicineBatch.expiry_date.is_(None), models.MedicineBatch.expiry_date >= datetime.now()),
+            )
+            .subquery()
+        )
+        needed = case(demand, value=supply.c.medicine_id, else_=0)
+        return db.execute(
+            select(supply)
+            .where(supply.c.supply_start < needed)
+            .order_by(supply.c.medicine_id, supply.c.supply_start)
+        ).all()
+
+    @staticmethod
+    def sellable_quantities(db: Session, medicines: Iterable[models.Medicine]) -> Dict[int, int]:
+        """
+        Units consume() can actually draw, per medicine: stock_quantity less
+        what sits in expired batches, i.e. the live batches plus the
+        unbatched remainder. Expired units stay on the shelf (and in the
+        total) until written off, but they are never sold.
+        """
+        sellable = {m.id: m.stock_quantity or 0 for m in medicines}
+        if not sellable:
+            return {}
+        expired = db.execute(
+            select(models.MedicineBatch.medicine_id, func.sum(models.MedicineBatch.quantity))
+            .where(
+                models.MedicineBatch.medicine_id.in_(list(sellable)),
+                models.MedicineBatch.quantity > 0,
+                models.MedicineBatch.expiry_date < datetime.now(),
+            )
+            .group_by(models.MedicineBatch.medicine_id)
+        ).all()
+        for medicine_id, quantity in expired:
+            sellable[medicine_id] -= quantity
+        return sellable
+
+    @staticmethod
+    def consume(db: Session, order_items: List[models.OrderItem]):
+        """
+        Take stock for flushed order items: decrement the medicine totals,
+        allocate FEFO across batches and record which batches each item
+        consumed. Three statements regardless of how many lines the order has.
+        Units not covered by dated batches come from unbatched (legacy) stock.
+        """
+        demand = defaultdict(int)
+        item_ranges = defaultdict(list)  # medicine_id -> [(item, start, end)]
+        for item in order_items:
+            start = demand[item.medicine_id]
+            demand[item.medicine_id] += item.quantity
+            item_ranges[item.medicine_id].append((item, start, demand[item.medicine_id]))
+
+        StockService.adjust_totals(db, {medicine_id: -qty for medicine_id, qty in demand.items()})
+
+        batch_takes = defaultdict(int)
+        allocations = []
+        for batch in StockService.fefo_candidates(db, demand):
+            for item, start, end in item_ranges[batch.medicine_id]:
+                take = min(end, batch.supply_end) - max(start, batch.supply_start)
+                if take > 0:
+                    batch_takes[batch.id] += take
+                    allocations.append({"order_item_id": item.id, "batch_id": batch.id, "quantity": take})
+
+        if batch_takes:
+            db.execute(
+                update(batches_table)
+                .where(batches_table.c.id == bindparam("b_id"))
+                .values(quantity=batches_table.c.quantity - bindparam("take")),
+                [{"b_id": batch_id, "take": take} for batch_id, take in batch_takes.items()]
+            )
+            db.execute(insert(models.OrderItemBatch.__table__), allocations)
+
+        # Ledger: one sale row per batch drawn, plus the unbatched remainder
+        item_allocations = defaultdict(list)
+        for allocation in allocations:
+            item_allocations[allocation["order_item_id"]].append(allocation)
+        movements = []
+        for item in order_items:
+            reference = f"order:{item.order_id}"
+            for allocation in item_allocations[item.id]:
+                movements.append(StockService.movement(
+                    item.medicine_id, models.MovementType.SALE, -allocation["quantity"],
+                    batch_id=allocation["batch_id"], reference=reference
+                ))
+            remainder = item.quantity - sum(a["quantity"] for a in item_allocations[item.id])
+            if remainder:
+                movements.append(StockService.movement(
+                    item.medicine_id, models.MovementType.SALE, -remainder, reference=reference
+                ))
+        StockService.record_movements(db, movements)
+        return allocations
+
+    @staticmethod
+    def restore(db: Session, order_ids: List[int]):
+        """
+        Put the stock of cancelled orders back: one correlated UPDATE for the
+        medicine totals, one for the batches they were drawn from, and the
+        matching return rows in the ledger.
+        """
+        if not order_ids:
+            return
+        in_orders = order_items_table.c.order_id.in_(order_ids)
+
+        returned = (
+            select(func.sum(order_items_table.c.quantity))
+            .where(in_orders, order_items_table.c.medicine_id == medicines_table.c.id)
+            .scalar_subquery()
+        )
+        db.execute(
+            update(medicines_table)
+            .where(medicines_table.c.id.in_(select(order_items_table.c.medicine_id).where(in_orders)))
+            .values(
+                stock_quantity=medicines_table.c.stock_quantity + returned,
+                version_id=medicines_table.c.version_id + 1
+            )
+        )
+
+        allocated = allocations_table.join(
+            order_items_table, allocations_table.c.order_item_id == order_items_table.c.id
+        )
+        returned_to_batch = (
+            select(func.sum(allocations_table.c.quantity))
+            .select_from(allocated)
+            .where(in_orders, allocations_table.c.batch_id == batches_table.c.id)
+            .scalar_subquery()
+        )
+        db.execute(
+            update(batches_table)
+            .where(batches_table.c.id.in_(select(allocations_table.c.batch_id).select_from(allocated).where(in_orders)))
+            .values(quantity=batches_table.c.quantity + returned_to_batch)
+        )
+
+        rows = db.execute(
+            select(
+                order_items_table.c.id,
+                order_items_table.c.order_id,
+                order_items_table.c.medicine_id,
+                order_items_table.c.quantity,
+                allocations_table.c.batch_id,
+                allocations_table.c.quantity.label("batch_quantity"),
+            )
+            .select_from(order_items_table.outerjoin(
+                allocations_table, allocations_table.c.order_item_id == order_items_table.c.id
+            ))
+            .where(in_orders)
+            .order_by(order_items_table.c.id)
+        ).all()
+        movements = []
+        unbatched = {}
+        for row in rows:
+            reference = f"order:{row.order_id}"
+            if row.id not in unbatched:
+                unbatched[row.id] = (row.medicine_id, reference, row.quantity)
+            if row.batch_id is not None:
+                movements.append(StockService.movement(
+                    row.medicine_id, models.MovementType.RETURN, row.batch_quantity,
+                    batch_id=row.batch_id, reference=reference
+                ))
+                medicine_id, reference, left = unbatched[row.id]
+                unbatched[row.id] = (medicine_id, reference, left - row.batch_quantity)
+        for medicine_id, reference, left in unbatched.values():
+            movements.append(StockService.movement(
+                medicine_id, models.MovementType.RETURN, left, reference=reference
+            ))
+        StockService.record_movements(db, movements)
+
+    @staticmethod
+    def add_batch(db: Session, medicine_id: int, quantity: int, batch_number: str = None,
+                  expiry_date: datetime = None, purchase_price: float = None) -> models.MedicineBatch:
+        batch = models.MedicineBatch(
+            medicine_id=medicine_id,
+            batch_number=batch_number,
+            expiry_date=expiry_date,
+            quantity=quantity,
+            purchase_price=purchase_price
+        )
+        db.add(batch)
+        db.flush()
+        StockService.adjust_totals(db, {medicine_id: quantity})
+        StockService.record_movements(db, [StockService.movement(
+            medicine_id, models.MovementType.RESTOCK, quantity, batch_id=batch.id, reference=f"batch:{batch.id}"
+        )])
+        return batch
+
+    @staticmethod
+    def receive(db: Session, receipt: models.GoodsReceipt, lines):
+        """
+        Book a distributor bill into stock: lines with a batch number or
+        expiry become batches (one INSERT ... RETURNING), the medicine totals get
+        relative increments aggregated per medicine (one executemany), and
+        one ledger row per line is appended. Concurrent sales are never
+        overwritten because no absolute stock value is written.
+        """
+        medicine_ids = {line.medicine_id for line in lines}
+        found = set(db.execute(
+            select(medicines_table.c.id).where(medicines_table.c.id.in_(medicine_ids))
+        ).scalars())
+        missing = sorted(medicine_ids - found)
+        if missing:
+            raise ValueError(f"Unknown medicine id(s): {', '.join(map(str, missing))}")
+
+        batch_rows = [
+            {
+                "medicine_id": line.medicine_id,
+                "receipt_id": receipt.id,
+                "batch_number": line.batch_number,
+                "expiry_date": line.expiry_date,
+                "quantity": line.quantity,
+                "purchase_price": line.purchase_price,
+            }
+            for line in lines if line.batch_number or line.expiry_date
+        ]
+        # Multi-row INSERT ... RETURNING id, ids in the order of batch_rows
+        batch_ids = []
+        if batch_rows:
+            batch_ids = list(db.execute(
+                insert(batches_table).returning(batches_table.c.id, sort_by_parameter_order=True),
+                batch_rows
+            ).scalars())
+
+        line_batches = []
+        next_batch = iter(batch_ids)
+        for line in lines:
+            batch_id = next(next_batch) if line.batch_number or line.expiry_date else None
+            line_batches.append((line, batch_id))
+
+        increments = defaultdict(int)
+        for line in lines:
+            increments[line.medicine_id] += line.quantity
+        StockService.adjust_totals(db, increments)
+
+        reference = f"receipt:{receipt.id}"
+        StockService.record_movements(db, [
+            StockService.movement(
+                line.medicine_id, models.MovementType.RESTOCK, line.quantity,
+                batch_id=batch_id, reference=reference
+            )
+            for line, batch_id in line_batches
+        ])
+
+        receipt.line_count = len(lines)
+        receipt.total_quantity = sum(increments.values())
+        receipt.total_cost = round(sum(line.quantity * (line.purchase_price or 0.0) for line in lines), 2)
+
+    @staticmethod
+    def adjust(db: Session, medicine_id: int, quantity: int, movement_type: str = models.MovementType.ADJUSTMENT,
+               batch_id: int = None, reference: str = None, note: str = None):
+        """Apply a signed manual change (count correction, return, expiry write-off) and log it"""
+        StockService.adjust_totals(db, {medicine_id: quantity})
+        if batch_id is not None:
+            db.execute(
+                update(batches_table)
+                .where(batches_table.c.id == batch_id)
+                .values(quantity=batches_table.c.quantity + quantity)
+            )
+        StockService.record_movements(db, [StockService.movement(
+            medicine_id, movement_type, quantity, batch_id=batch_id, reference=reference, note=note
+        )])
+
+    # ----- ledger -----
+
+    @staticmethod
+    def movement(medicine_id: int, movement_type: str, quantity: int, batch_id: int = None,
+                 reference: str = None, note: str = None) -> dict:
+        return {
+            "medicine_id": medicine_id,
+            "batch_id": batch_id,
+            "movement_type": getattr(movement_type, "value", movement_type),
+            "quantity": quantity,
+            "reference": reference,
+            "note": note,
+        }
+
+    @staticmethod
+    def record_movements(db: Session, movements: List[dict]):
+        """Append ledger rows in one multi-row INSERT, stamped with a single timestamp"""
+        movements = [m for m in movements if m["quantity"]]
+        if not movements:
+            return
+        now = datetime.now()
+        db.execute(insert(movements_table), [dict(m, created_at=now) for m in movements])
+
+    @staticmethod
+    def take_snapshot(db: Session, snapshot_date: date) -> int:
+        """
+        Store every medicine's stock as of the end of `snapshot_date`: the
+        running total minus whatever moved after midnight. One INSERT ...
+        SELECT; medicines already snapshotted for that day are skipped, so
+        reruns are harmless.
+        """
+        boundary = datetime.combine(snapshot_date + timedelta(days=1), time.min)
+        moved_since = (
+            select(func.coalesce(func.sum(movements_table.c.quantity), 0))
+            .where(
+                movements_table.c.medicine_id == medicines_table.c.id,
+                movements_table.c.created_at >= boundary,
+            )
+            .scalar_subquery()
+        )
+        already_taken = exists().where(
+            snapshots_table.c.medicine_id == medicines_table.c.id,
+            snapshots_table.c.snapshot_date == snapshot_date,
+        )
+        result = db.execute(
+            insert(snapshots_table).from_select(
+                ["medicine_id", "snapshot_date", "quantity"],
+                select(
+                    medicines_table.c.id,
+                    literal(snapshot_date, type_=snapshots_table.c.snapshot_date.type),
+                    medicines_table.c.stock_quantity - moved_since,
+                ).where(~already_taken)
+            )
+        )
+        db.commit()
+        return result.rowcount
+
+    @staticmethod
+    def _moved_between(db: Session, medicine_id: int, start: datetime, end: datetime) -> int:
+        return db.execute(
+            select(func.coalesce(func.sum(movements_table.c.quantity), 0)).where(
+                movements_table.c.medicine_id == medicine_id,
+                movements_table.c.created_at >= start,
+                movements_table.c.created_at < end,
+            )
+        ).scalar()
+
+    @staticmethod
+    def stock_at(db: Session, medicine_id: int, at: datetime) -> Optional[dict]:
+        """
+        Stock of a medicine at any moment, from the closest known point (the
+        snapshot before, the snapshot after, or the live total) plus the
+        ledger rows between it and `at` - never a scan of the full history.
+        """
+        current = db.execute(
+            select(medicines_table.c.stock_quantity).where(medicines_table.c.id == medicine_id)
+        ).scalar()
+        if current is None:
+            return None
+
+        # (point in time, stock at that point, snapshot date)
+        anchors = [(datetime.now(), current, None)]
+        before = db.execute(
+            select(snapshots_table.c.snapshot_date, snapshots_table.c.quantity)
+            .where(snapshots_table.c.medicine_id == medicine_id, snapshots_table.c.snapshot_date < at.date())
+            .order_by(snapshots_table.c.snapshot_date.desc())
+            .limit(1)
+        ).first()
+        after = db.execute(
+            select(snapshots_table.c.snapshot_date, snapshots_table.c.quantity)
+            .where(snapshots_table.c.medicine_id == medicine_id, snapshots_table.c.snapshot_date >= at.date())
+            .order_by(snapshots_table.c.snapshot_date)
+            .limit(1)
+        ).first()
+        for snapshot in (before, after):
+            if snapshot is not None:
+                boundary = datetime.combine(snapshot.snapshot_date + timedelta(days=1), time.min)
+                anchors.append((boundary, snapshot.quantity, snapshot.snapshot_date))
+
+        point, quantity, snapshot_date = min(anchors, key=lambda anchor: abs(anchor[0] - at))
+        if point <= at:
+            quantity += StockService._moved_between(db, medicine_id, point, at)
+        else:
+            quantity -= StockService._moved_between(db, medicine_id, at, point)
+        return {"medicine_id": medicine_id, "at": at, "quantity": quantity, "snapshot_date": snapshot_date}
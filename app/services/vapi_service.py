@@ -0,0 +1,260 @@
+from sqlalchemy.orm import Session
+from app import models, schemas
+from app.cache import call_cache
+from app.database import VoiceSessionLocal
+from app.lanes import voice_tool_limiter
+from app.logging_config import tool_call_id_var
+from app.order_pipeline import order_finalizer
+from app.phones import normalize_phone
+from app.services.order_service import OrderService
+from app.stock_holds import stock_holds
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional
+import anyio
+import asyncio
+import json
+import logging
+import os
+import re
+
+vapi_logger = logging.getLogger("app.vapi")
+
+# Reply as soon as stock is reserved; invoice, PDF and stats are finished by the order pipeline
+VAPI_FAST_ACK = os.getenv("VAPI_FAST_ACK", "false").lower() in ("1", "true", "yes")
+
+PACKAGING_TYPES = ["strip", "bottle", "box", "loose", "tube", "vial"]
+
+
+class VapiService:
+    """
+    Tool-call handlers for the Vapi voice assistant. Each handler takes the
+    function arguments of one tool call (plus the Vapi call id, for the
+    per-call cache and stock holds) and returns the sentence the assistant
+    should speak.
+    """
+
+    @staticmethod
+    def call_id(message: dict) -> Optional[str]:
+        call = message.get("call") or {}
+        return call.get("id") if isinstance(call, dict) else None
+
+    # ----- argument cleanup -----
+
+    @staticmethod
+    def tool_call_arguments(tool_call: dict) -> dict:
+        args = tool_call.get("function", {}).get("arguments", {})
+        if isinstance(args, str):
+            try:
+                args = json.loads(args)
+            except ValueError:
+                args = {}
+        return args or {}
+
+    @staticmethod
+    def parse_quantity(raw) -> int:
+        qty_match = re.search(r'\d+', str(raw if raw is not None else "1"))
+        return int(qty_match.group()) if qty_match else 1
+
+    @staticmethod
+    def parse_packaging(raw) -> str:
+        raw_pack = str(raw or "strip").lower()
+        for vp in PACKAGING_TYPES:
+            if vp in raw_pack:
+                return vp
+        return "strip"
+
+    @staticmethod
+    def find_medicine(db: Session, name: str) -> Optional[models.Medicine]:
+        """Best match across English, Hindi and generic names (same pick as order placement)"""
+        medicines = OrderService.search_medicine(db, name, limit=1)
+        return medicines[0] if medicines else None
+
+    @staticmethod
+    def resolve(db: Session, name: str, call_id: Optional[str]) -> Optional[dict]:
+        """Name -> {medicine_id, name, stock_quantity}, from the call cache when this call already asked"""
+        entry = call_cache.get(call_id, name)
+        if entry is not None:
+            return entry
+        medicine = VapiService.find_medicine(db, name)
+        if medicine is None:
+            return None
+        call_cache.put(call_id, name, medicine.id, medicine.name, medicine.stock_quantity)
+        return {"medicine_id": medicine.id, "name": medicine.name, "stock_quantity": medicine.stock_quantity}
+
+    @staticmethod
+    def resolve_current(db: Session, names: List[str], call_id: Optional[str]) -> Dict[str, Optional[dict]]:
+        """
+        Like resolve() for several names, but cached resolutions get their
+        stock re-read (one query by primary key for all of them) since an
+        order is about to be placed on it.
+        """
+        resolved = {name: call_cache.get(call_id, name) for name in names}
+        cached_ids = {entry["medicine_id"] for entry in resolved.values() if entry is not None}
+        stock = dict(
+            db.query(models.Medicine.id, models.Medicine.stock_quantity)
+            .filter(models.Medicine.id.in_(cached_ids))
+            .all()
+        ) if cached_ids else {}
+        for name, entry in resolved.items():
+            if entry is not None and entry["medicine_id"] in stock:
+                resolved[name] = dict(entry, stock_quantity=stock[entry["medicine_id"]])
+                call_cache.put(call_id, name, entry["medicine_id"], entry["name"], stock[entry["medicine_id"]])
+            else:
+                # Not looked up yet this call, or the medicine has since been removed
+                medicine = VapiService.find_medicine(db, name)
+                resolved[name] = None
+                if medicine is not None:
+                    call_cache.put(call_id, name, medicine.id, medicine.name, medicine.stock_quantity)
+                    resolved[name] = {
+                        "medicine_id": medicine.id, "name": medicine.name, "stock_quantity": medicine.stock_quantity}
+        return resolved
+
+    # ----- tool handlers -----
+
+    @staticmethod
+    def place_order(db: Session, function_args: dict, call_id: Optional[str] = None) -> str:
+        raw_medicines = [m for m in function_args.get("medicines", []) if m.get("name", "").strip()]
+        resolved = VapiService.resolve_current(db, [m["name"].strip() for m in raw_medicines], call_id)
+        cleaned_medicines = []
+        out_of_stock = []
+
+        for m in raw_medicines:
+            med_name = m.get("name", "").strip()
+
+            found = resolved[med_name]
+            if not found or stock_holds.available(
+                    db.connection(), found["medicine_id"], found["stock_quantity"], call_id) <= 0:
+                vapi_logger.debug("Stock check failed", extra={"medicine": med_name})
+                out_of_stock.append(med_name)
+                continue
+
+            vapi_logger.debug("Stock check ok", extra={"medicine": med_name, "stock": found["stock_quantity"]})
+            cleaned_medicines.append({
+                "medicine_id": found["medicine_id"],
+                "name": med_name,
+                "quantity": VapiService.parse_quantity(m.get("quantity", "1")),
+                "packaging": VapiService.parse_packaging(m.get("packaging", "strip"))
+            })
+
+        if not cleaned_medicines:
+            vapi_logger.info("All medicines out of stock", extra={"out_of_stock": out_of_stock})
+            return "Sorry, ye medicines stock mein nahi hain: {}. Koi aur medicine chahiye?".format(
+                ", ".join(out_of_stock))
+
+        customer_name = function_args.get("customer_name", "").strip() or "Customer"
+        vapi_logger.info("Placing order", extra={"item_count": len(cleaned_medicines)})
+
+        order_request = schemas.AIAgentOrderRequest(
+            customer_name=customer_name,
+            customer_phone=normalize_phone(function_args.get("customer_phone", "0000000000")),
+            customer_address=function_args.get("customer_address", None) or None,
+            medicines=cleaned_medicines,
+            language=function_args.get("language", "hindi") or "hindi"
+        )
+
+        result = OrderService.create_order_from_ai_agent(
+            db, order_request, call_id=call_id, defer_finalize=VAPI_FAST_ACK)
+        if VAPI_FAST_ACK and result.get("success"):
+            order_finalizer.submit(result["order_id"])
+        vapi_logger.info("Order result", extra={
+            "success": result.get("success"), "order_number": result.get("order_number")})
+
+        if result.get("success"):
+            skipped = ""
+            if out_of_stock:
+                skipped = " Note: {} stock mein nahi tha.".format(", ".join(out_of_stock))
+            return "Order placed! Order number {}. Total {} rupees. Shukriya!{}".format(
+                result.get("order_number"), result.get("total_amount"), skipped)
+        return "Sorry order nahi hua. {}".format(result.get("message"))
+
+    @staticmethod
+    def check_stock(db: Session, args: dict, call_id: Optional[str] = None) -> str:
+        medicine_name = args.get("medicine_name", "").strip()
+        if not medicine_name:
+            return "Nahi hai."
+
+        medicine = VapiService.resolve(db, medicine_name, call_id)
+        if not medicine:
+            return "Nahi hai."
+
+        # Keep what was promised aside until the caller orders (or the hold times out)
+        qty_requested = VapiService.parse_quantity(args.get("quantity", 1))
+        available = stock_holds.reserve(
+            db.connection(), call_id, {medicine["medicine_id"]: qty_requested}).get(medicine["medicine_id"], 0)
+        db.commit()
+        result_msg = "Nahi hai." if available <= 0 else "Haa."
+        vapi_logger.debug("Stock check", extra={
+            "medicine": medicine["name"], "available": available, "result": result_msg})
+        return result_msg
+
+    @staticmethod
+    def check_stock_bulk(db: Session, args: dict, call_id: Optional[str] = None) -> str:
+        medicines_list = args.get("medicines", [])
+        if not medicines_list:
+            return "No medicines in the order. Koi medicine nahi bataya."
+
+        requested = []
+        wanted = defaultdict(int)
+        for item in medicines_list:
+            med_name = item.get("name", "").strip()
+            qty_requested = VapiService.parse_quantity(item.get("quantity", 1))
+            med = VapiService.resolve(db, med_name, call_id)
+            requested.append((med_name, qty_requested, med))
+            if med:
+                wanted[med["medicine_id"]] += qty_requested
+
+        # One check-and-hold for the whole list, medicines locked in id order
+        stock = stock_holds.reserve(db.connection(), call_id, wanted)
+        db.commit()
+
+        available = []
+        unavailable = []
+        for med_name, qty_requested, med in requested:
+            if not med:
+                unavailable.append(f"{med_name} (not found)")
+                continue
+            in_stock = stock.get(med["medicine_id"], 0)
+            if in_stock <= 0:
+                unavailable.append(f"{med['name']} (out of stock)")
+            elif in_stock < qty_requested:
+                available.append(f"{med['name']} (only {in_stock} available, you asked for {qty_requested})")
+            else:
+                available.append(f"{med['name']} x{qty_requested} ✓")
+
+        if not unavailable:
+            return "Sab haa."
+        return f"{', '.join(unavailable)} nahi hai."
+
+    # ----- dispatch -----
+
+    @staticmethod
+    async def run_tool_calls(tool_calls: List[dict], handler: Callable[[Session, dict, Optional[str]], str],
+                             error_result: str, call_id: Optional[str] = None) -> dict:
+        """
+        Run every tool call of a message concurrently, each in a worker
+        thread with its own session from the voice pool, and answer them all in one
+        `results` array (same order, one entry per toolCallId). A failing
+        call gets `error_result` without affecting the others.
+        """
+        async def run_one(index: int, tool_call: dict) -> dict:
+            tool_call_id = tool_call.get("id") or f"tool-{index + 1}"
+            args = VapiService.tool_call_arguments(tool_call)
+
+            def work() -> str:
+                tool_call_id_var.set(tool_call_id)
+                db = VoiceSessionLocal()
+                try:
+                    return handler(db, args, call_id)
+                except Exception:
+                    db.rollback()
+                    vapi_logger.exception("Vapi tool call failed")
+                    return error_result
+                finally:
+                    db.close()
+
+            # Voice lane's own thread budget, not the pool shared with back-office routes
+            result = await anyio.to_thread.run_sync(work, limiter=voice_tool_limiter())
+            return {"toolCallId": tool_call_id, "result": result}
+
+        results = await asyncio.gather(*(run_one(i, tool_call) for i, tool_call in enumerate(tool_calls)))
+        return {"results": list(results)}
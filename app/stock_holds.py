@@ -0,0 +1,211 @@
+from collections import defaultdict
+from datetime import datetime, timedelta
+from sqlalchemy import bindparam, delete, func, insert, select, update
+from sqlalchemy.engine import Connection
+from app import models
+from app.database import engine
+from typing import Dict, Iterable, Optional
+import logging
+import os
+import threading
+
+logger = logging.getLogger("app.stock_holds")
+
+holds_table = models.StockHold.__table__
+medicines_table = models.Medicine.__table__
+
+
+class StockHoldBook:
+    """
+    Short-lived stock reservations made for a voice call, kept in the
+    stock_holds table so every worker sees the holds made through any other.
+
+    When check-stock says "Haa." the units are held for that call id until
+    the order is placed, the hold times out, or the call asks again (one
+    row per call and medicine, replaced in place). medicines.held_quantity
+    is the running total of a medicine's hold rows, moved by the same
+    delta in the same transaction as every row change, so
+    available-to-promise is `stock - held_quantity + own hold`: two lookups
+    by key, no scan over the holds.
+
+    Every method works on the caller's connection (`db.connection()`), in
+    the caller's transaction, which the caller commits. An order therefore
+    checks and releases holds under the row locks it already has, and no
+    request needs a second pooled connection. Expired holds keep counting
+    until the sweeper deletes them, at most `sweep_interval` seconds late.
+    """
+
+    def __init__(self, ttl: float, sweep_interval: float):
+        self.ttl = ttl
+        self.sweep_interval = sweep_interval
+        self._stop = threading.Event()
+        self._thread = None
+        # Per-worker counters, and the gauges as of the last sweep, for /metrics
+        self.created = 0
+        self.expired = 0
+        self.converted = 0
+        self._active = {"calls": 0, "holds": 0, "units_held": 0}
+
+    @staticmethod
+    def _adjust_held(conn: Connection, deltas: Dict[int, int]):
+        params = [{"m_id": medicine_id, "delta": delta} for medicine_id, delta in deltas.items() if delta]
+        if params:
+            conn.execute(
+                update(medicines_table)
+                .where(medicines_table.c.id == bindparam("m_id"))
+                .values(held_quantity=medicines_table.c.held_quantity + bindparam("delta")),
+                params
+            )
+
+    # ----- public API -----
+
+    def _set(self, conn: Connection, call_id: str, medicine_id: int, quantity: int, previous: Optional[int],
+             expires_at: datetime):
+        self._adjust_held(conn, {medicine_id: quantity - (previous or 0)})
+        if previous is None:
+            conn.execute(insert(holds_table).values(
+                call_id=call_id, medicine_id=medicine_id, quantity=quantity, expires_at=expires_at))
+        else:
+            conn.execute(
+                update(holds_table)
+                .where(holds_table.c.call_id == call_id, holds_table.c.medicine_id == medicine_id)
+                .values(quantity=quantity, expires_at=expires_at))
+        self.created += 1
+
+    def _own(self, conn: Connection, call_id: str, medicine_ids: Iterable[int]) -> Dict[int, int]:
+        return dict(conn.execute(
+            select(holds_table.c.medicine_id, holds_table.c.quantity).where(
+                holds_table.c.call_id == call_id, holds_table.c.medicine_id.in_(list(medicine_ids)))
+        ).all())
+
+    def hold(self, conn: Connection, call_id: Optional[str], medicine_id: int, quantity: int):
+        """Reserve `quantity` units for the call (replacing its previous hold on this medicine)"""
+        if not call_id or quantity <= 0:
+            return
+        previous = self._own(conn, call_id, [medicine_id]).get(medicine_id)
+        self._set(conn, call_id, medicine_id, quantity, previous,
+                  datetime.now() + timedelta(seconds=self.ttl))
+
+    def reserve(self, conn: Connection, call_id: Optional[str], wanted: Dict[int, int]) -> Dict[int, int]:
+        """
+        Check-and-hold for check-stock: lock the medicines in id order (like
+        StockService.lock_medicines), hold min(wanted, available) of each
+        for the call and return what was available before the hold.
+        """
+        ids = sorted(wanted)
+        if not ids:
+            return {}
+        rows = conn.execute(
+            select(medicines_table.c.id, medicines_table.c.stock_quantity, medicines_table.c.held_quantity)
+            .where(medicines_table.c.id.in_(ids))
+            .order_by(medicines_table.c.id)
+            .with_for_update()
+        ).all()
+        own = self._own(conn, call_id, ids) if call_id else {}
+        expires_at = datetime.now() + timedelta(seconds=self.ttl)
+        available = {}
+        for medicine_id, stock_quantity, held_quantity in rows:
+            available[medicine_id] = stock_quantity - held_quantity + own.get(medicine_id, 0)
+            quantity = min(wanted[medicine_id], available[medicine_id])
+            if call_id and quantity > 0:
+                self._set(conn, call_id, medicine_id, quantity, own.get(medicine_id), expires_at)
+        return available
+
+    def held_by_others(self, conn: Connection, medicine_id: int, call_id: Optional[str] = None) -> int:
+        held = conn.execute(
+            select(medicines_table.c.held_quantity).where(medicines_table.c.id == medicine_id)
+        ).scalar() or 0
+        if call_id:
+            held -= self._own(conn, call_id, [medicine_id]).get(medicine_id, 0)
+        return held
+
+    def available(self, conn: Connection, medicine_id: int, stock_quantity: int,
+                  call_id: Optional[str] = None) -> int:
+        """Stock this call may still promise: on-hand stock minus what other calls hold"""
+        return stock_quantity - self.held_by_others(conn, medicine_id, call_id)
+
+    def release(self, conn: Connection, call_id: Optional[str], medicine_ids: Optional[Iterable[int]] = None,
+                converted: bool = False) -> int:
+        """Drop a call's holds (all of them, or just these medicines), e.g. in the transaction placing its order"""
+        if not call_id:
+            return 0
+        stmt = delete(holds_table).where(holds_table.c.call_id == call_id)
+        if medicine_ids is not None:
+            stmt = stmt.where(holds_table.c.medicine_id.in_(list(medicine_ids)))
+        released = self._delete(conn, stmt)
+        if converted:
+            self.converted += released
+        return released
+
+    def _delete(self, conn: Connection, stmt) -> int:
+        """Run a DELETE on stock_holds and take the deleted units off the medicine totals"""
+        rows = conn.execute(stmt.returning(holds_table.c.medicine_id, holds_table.c.quantity)).all()
+        deltas = defaultdict(int)
+        for medicine_id, quantity in rows:
+            deltas[medicine_id] -= quantity
+        self._adjust_held(conn, deltas)
+        return len(rows)
+
+    def sweep(self) -> int:
+        """Delete expired holds and refresh the gauges; returns how many expired"""
+        now = datetime.now()
+        with engine.begin() as conn:
+            # Medicine rows first, in id order, the same lock order as an order placing
+            expired = select(holds_table.c.medicine_id).where(holds_table.c.expires_at <= now)
+            medicine_ids = conn.execute(
+                select(medicines_table.c.id)
+                .where(medicines_table.c.id.in_(expired))
+                .order_by(medicines_table.c.id)
+                .with_for_update()
+            ).scalars().all()
+            swept = self._delete(conn, delete(holds_table).where(
+                holds_table.c.expires_at <= now, holds_table.c.medicine_id.in_(medicine_ids))) if medicine_ids else 0
+            calls, holds, units = conn.execute(
+                select(
+                    func.count(func.distinct(holds_table.c.call_id)),
+                    func.count(),
+                    func.coalesce(func.sum(holds_table.c.quantity), 0),
+                )
+            ).one()
+        self.expired += swept
+        self._active = {"calls": calls, "holds": holds, "units_held": int(units)}
+        return swept
+
+    def stats(self) -> dict:
+        """Counters for this worker; active holds as of the last sweep (no query per scrape)"""
+        return dict(
+            self._active,
+            created=self.created,
+            expired=self.expired,
+            converted=self.converted,
+            ttl_seconds=self.ttl,
+        )
+
+    # ----- sweeper -----
+
+    def _sweep_loop(self):
+        while not self._stop.wait(self.sweep_interval):
+            try:
+                self.sweep()
+            except Exception:
+                # The next sweep gets them
+                logger.exception("stock hold sweep failed")
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._sweep_loop, name="stock-hold-sweeper", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+
+stock_holds = StockHoldBook(
+    ttl=float(os.getenv("STOCK_HOLD_TTL", "300")),
+    sweep_interval=float(os.getenv("STOCK_HOLD_SWEEP_INTERVAL", "5"))
+)
@@ -0,0 +1,75 @@
+from app import metrics
+from app.database import engine, voice_engine
+from sqlalchemy import text
+import logging
+import os
+import time
+
+logger = logging.getLogger("app.warmup")
+
+# Comma-separated steps run at startup, before the worker takes traffic; empty to skip
+WARMUP_STEPS = tuple(s.strip() for s in os.getenv("WARMUP_STEPS", "db,auth,search,pdf").split(",") if s.strip())
+
+warmup_seconds = metrics.registry.gauge(
+    "warmup_seconds", "Time the startup warm-up spent per step", ("step",))
+
+
+def _warm_db():
+    # One pooled connection per engine: connect + dialect setup off the first request
+    for bind in (engine, voice_engine):
+        with bind.connect() as conn:
+            conn.execute(text("SELECT 1"))
+
+
+def _warm_auth():
+    from jose import jwt
+    from app.auth import pwd_context
+
+    pwd_context().handler("bcrypt").get_backend()
+    jwt.decode(jwt.encode({}, "warmup", algorithm="HS256"), "warmup", algorithms=["HS256"])
+
+
+def _warm_search():
+    from app.search_index import typeahead_index
+
+    typeahead_index.ensure_current()
+
+
+def _warm_pdf():
+    from reportlab.lib.styles import getSampleStyleSheet
+    import app.services.invoice_service  # noqa: F401
+
+    getSampleStyleSheet()
+
+
+STEPS = {
+    "db": _warm_db,
+    "auth": _warm_auth,
+    "search": _warm_search,
+    "pdf": _warm_pdf,
+}
+
+
+def warm_up(steps=WARMUP_STEPS) -> dict:
+    """
+    Load what the app imports lazily (ReportLab, passlib/bcrypt, python-jose)
+    and open the DB pools, so the first requests don't pay for it. A failing
+    step is logged and skipped: the request that needs it loads it anyway.
+    """
+    timings = {}
+    for step in steps:
+        work = STEPS.get(step)
+        if work is None:
+            logger.warning("unknown warm-up step %s", step)
+            continue
+        started = time.perf_counter()
+        try:
+            work()
+        except Exception:
+            logger.exception("warm-up step %s failed", step)
+            continue
+        timings[step] = round(time.perf_counter() - started, 4)
+        warmup_seconds.set(timings[step], step=step)
+    if timings:
+        logger.info("Warm-up done", extra={"timings": timings})
+    return timings
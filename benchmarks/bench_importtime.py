@@ -0,0 +1,95 @@
+"""
+Benchmark: cold import of main.py, i.e. how long a new worker takes
+before it can run its startup hooks.
+
+Each run imports main in a fresh interpreter under `python -X importtime`
+against a throwaway SQLite database, and reports the median total plus
+the slowest modules:
+
+    python benchmarks/bench_importtime.py [--runs 5] [--top 15] [--max-ms 2500]
+
+It fails (exit 1) when a module that must load lazily (ReportLab,
+passlib, python-jose, Alembic) is imported by main, or when the median
+import time exceeds --max-ms.
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Loaded on first use or by app.warmup, never by `import main`
+LAZY_MODULES = ("reportlab", "passlib", "jose", "alembic")
+
+IMPORT_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+PROBE = (
+    "import json, sys\n"
+    "import main\n"
+    "print(json.dumps(sorted({m.split('.')[0] for m in sys.modules} & set(%r))))\n"
+)
+
+
+def import_once(db_file: str):
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{db_file}")
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", PROBE % (LAZY_MODULES,)],
+        cwd=ROOT, env=env, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        raise SystemExit(f"import main failed:\n{proc.stderr[-2000:]}")
+
+    modules = {}
+    for line in proc.stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            modules[name] = (int(cumulative_us), len(indent) // 2)
+    loaded = json.loads(proc.stdout.strip().splitlines()[-1])
+    return modules, loaded
+
+
+def main_bench():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--max-ms", type=float, default=None, help="fail if the median import exceeds this")
+    args = parser.parse_args()
+
+    db_file = os.path.join(tempfile.mkdtemp(prefix="bench_importtime_"), "bench.db")
+    import_once(db_file)  # first run compiles .pyc files; not measured
+
+    totals, per_module, loaded = [], {}, set()
+    for _ in range(args.runs):
+        modules, lazy_loaded = import_once(db_file)
+        totals.append(modules["main"][0] / 1000)
+        loaded.update(lazy_loaded)
+        for name, (cumulative_us, depth) in modules.items():
+            # Top-level imports of main only, so nested modules aren't counted twice
+            if depth == 1:
+                per_module.setdefault(name, []).append(cumulative_us / 1000)
+
+    median = statistics.median(totals)
+    print(f"import main: median {median:.1f} ms, min {min(totals):.1f} ms over {args.runs} runs\n")
+    print(f"{'module':<40}{'cumulative ms':>14}")
+    slowest = sorted(per_module.items(), key=lambda item: statistics.median(item[1]), reverse=True)
+    for name, times in slowest[:args.top]:
+        print(f"{name:<40}{statistics.median(times):>14.1f}")
+
+    failed = False
+    if loaded:
+        print(f"\nFAIL: imported eagerly by main: {', '.join(sorted(loaded))}")
+        failed = True
+    if args.max_ms is not None and median > args.max_ms:
+        print(f"\nFAIL: median import {median:.1f} ms over the {args.max_ms:.0f} ms budget")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main_bench()
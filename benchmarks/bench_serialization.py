@@ -0,0 +1,143 @@
+"""
+Benchmark: stdlib/response_model serialization vs the precompiled
+TypeAdapter fast path (FAST_JSON_RESPONSES) on the hot read endpoints.
+
+Runs fully in-process against a throwaway SQLite database:
+
+    python benchmarks/bench_serialization.py [--requests 200] [--medicines 100] [--orders 100] [--rounds 5]
+
+get_medicines is measured on the catalogue cache-miss path (the cache is
+invalidated before every request), otherwise both modes would just be
+replaying cached bytes. App and request logging is silenced so only the
+results table is printed.
+
+GET /api/orders/{id} has no fast path (it measured no faster), so its
+"fast" column comes from a copy of the route registered here that
+serializes the same query with a compiled TypeAdapter; rerun this to
+check that it still doesn't pay off.
+"""
+import argparse
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+DB_FILE = os.path.join(tempfile.mkdtemp(prefix="bench_serialization_"), "bench.db")
+os.environ["DATABASE_URL"] = f"sqlite:///{DB_FILE}"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi import Depends  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+from sqlalchemy.orm import Session, joinedload  # noqa: E402
+
+import main  # noqa: E402
+from app import models, schemas, serializers  # noqa: E402
+from app.auth import create_access_token, get_current_user  # noqa: E402
+from app.cache import catalogue_cache  # noqa: E402
+from app.database import SessionLocal, get_db  # noqa: E402
+from app.schema_version import upgrade_to_head  # noqa: E402
+
+# main configures JSON logging at import; keep it (and httpx's per-request lines) off the table
+logging.disable(logging.WARNING)
+
+
+order_serializer = serializers.CompiledSerializer(schemas.OrderResponse)
+
+
+@main.app.get("/bench/orders/{order_id}")
+def get_order_compiled(order_id: int, db: Session = Depends(get_db), _=Depends(get_current_user)):
+    """GET /api/orders/{id} as it was with the compiled serializer, for comparison"""
+    order = (
+        db.query(models.Order)
+        .options(
+            joinedload(models.Order.invoice),
+            joinedload(models.Order.order_items).joinedload(models.OrderItem.medicine),
+            joinedload(models.Order.customer)
+        )
+        .filter(models.Order.id == order_id)
+        .first()
+    )
+    return order_serializer.response(order, headers={"ETag": main._version_etag(order.version_id)})
+
+
+def seed(medicine_count: int, order_count: int) -> str:
+    db = SessionLocal()
+    try:
+        user = models.User(name="Bench", email="bench@example.com", password_hash="x", role="admin")
+        db.add(user)
+        medicines = [
+            models.Medicine(
+                name=f"Medicine {i}", name_hindi=f"दवा {i}", generic_name=f"Generic {i}",
+                company="Bench Pharma", price_per_unit=2.5 + i, mrp=3.0 + i,
+                stock_quantity=1000, category="Bench", rack_location=f"R{i % 20}"
+            )
+            for i in range(medicine_count)
+        ]
+        db.add_all(medicines)
+        customer = models.Customer(name="Bench Customer", phone="+910000000000")
+        db.add(customer)
+        db.flush()
+        for i in range(order_count):
+            order = models.Order(order_number=f"ORD-BENCH-{i}", customer_id=customer.id, status="confirmed")
+            db.add(order)
+            db.flush()
+            for j in range(3):
+                med = medicines[(i + j) % medicine_count]
+                db.add(models.OrderItem(order_id=order.id, medicine_id=med.id, quantity=2,
+                                        price_per_unit=med.price_per_unit, total_price=med.price_per_unit * 2))
+            db.add(models.Invoice(invoice_number=f"INV-BENCH-{i}", order_id=order.id,
+                                  subtotal=10.0, total_amount=10.0))
+        db.commit()
+        return create_access_token({"sub": str(user.id)})
+    finally:
+        db.close()
+
+
+def measure(client: TestClient, path: str, headers: dict, requests: int, bust_cache: bool) -> float:
+    client.get(path, headers=headers)  # warm up
+    start = time.perf_counter()
+    for _ in range(requests):
+        if bust_cache:
+            catalogue_cache.bump()
+        response = client.get(path, headers=headers)
+        assert response.status_code == 200, response.text
+    return requests / (time.perf_counter() - start)
+
+
+def main_bench():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--medicines", type=int, default=100)
+    parser.add_argument("--orders", type=int, default=100)
+    parser.add_argument("--rounds", type=int, default=5,
+                        help="alternating baseline/fast rounds per endpoint; the median of each is reported")
+    args = parser.parse_args()
+
+    upgrade_to_head()
+    token = seed(args.medicines, args.orders)
+    headers = {"Authorization": f"Bearer {token}"}
+    client = TestClient(main.app)
+
+    # (name, baseline path, fast path, bust the catalogue cache)
+    cases = [
+        ("get_medicines", f"/api/medicines?limit={args.medicines}", None, True),
+        ("get_orders", f"/api/orders?limit={args.orders}", None, False),
+        ("get_order", "/api/orders/1", "/bench/orders/1", False),
+    ]
+
+    print(f"{'endpoint':<16}{'baseline req/s':>16}{'fast req/s':>14}{'speedup':>10}")
+    for name, path, fast_path, bust_cache in cases:
+        baselines, fasts = [], []
+        for _ in range(args.rounds):
+            serializers.FAST_JSON_ENABLED = False
+            baselines.append(measure(client, path, headers, args.requests, bust_cache))
+            serializers.FAST_JSON_ENABLED = True
+            fasts.append(measure(client, fast_path or path, headers, args.requests, bust_cache))
+        baseline, fast = statistics.median(baselines), statistics.median(fasts)
+        print(f"{name:<16}{baseline:>16.1f}{fast:>14.1f}{fast / baseline:>9.2f}x")
+
+
+if __name__ == "__main__":
+    main_bench()
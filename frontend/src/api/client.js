@@ -34,9 +34,14 @@ export const api = {
   // Medicines
   getMedicines: (skip = 0, limit = 100) => client.get(`/api/medicines?skip=${skip}&limit=${limit}`),
   searchMedicines: (query, limit = 10) => client.post("/api/medicines/search", { query, limit }),
+  typeaheadMedicines: (q, limit = 10) => client.get("/api/medicines/typeahead", { params: { q, limit } }),
   createMedicine: (data) => client.post("/api/medicines", data),
-  updateMedicine: (id, data) => client.put(`/api/medicines/${id}`, data),
-  deleteMedicine: (id) => client.delete(`/api/medicines/${id}`),
+  // version: the medicine's version_id when the form was opened; a stale one gets a 409
+  updateMedicine: (id, data, version) =>
+    client.put(`/api/medicines/${id}`, data, version ? { headers: { "If-Match": `"${version}"` } } : undefined),
+  deleteMedicine: (id, version) =>
+    client.delete(`/api/medicines/${id}`, version ? { headers: { "If-Match": `"${version}"` } } : undefined),
+  listInventory: (params) => client.get("/api/inventory/medicines", { params }),
   getMedicinesByName: (name) => client.get(`/api/medicines/by-name`, { params: { name } }),
 
   // Orders
@@ -44,6 +49,9 @@ export const api = {
   getMyOrders: () => client.get("/api/orders/my"),
   getOrder: (id) => client.get(`/api/orders/${id}`),
   createOrder: (data) => client.post("/api/orders", data),
+  updateOrderStatus: (id, status, version) =>
+    client.put(`/api/orders/${id}/status`, { status }, version ? { headers: { "If-Match": `"${version}"` } } : undefined),
+  bulkUpdateOrderStatus: (data) => client.put("/api/orders/bulk-status", data),
 
   // Dashboard
   getDashboardStats: () => client.get("/api/dashboard/stats"),
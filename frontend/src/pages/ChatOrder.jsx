@@ -98,8 +98,11 @@ export default function ChatOrder() {
 
     try {
       // Extract medicine names from the message
-      const res = await api.searchMedicines(text, 5);
-      const medicines = res.data.medicines;
+      let medicines = (await api.typeaheadMedicines(text, 5)).data;
+      if (medicines.length === 0) {
+        // Not a name prefix (e.g. a full sentence) - fall back to substring search
+        medicines = (await api.searchMedicines(text, 5)).data.medicines;
+      }
 
       let reply;
       if (medicines.length === 0) {
@@ -4,11 +4,12 @@ import { api } from "../api/client";
 
 export default function LowStock() {
   const [medicines, setMedicines] = useState([]);
+  const [total, setTotal] = useState(0);
   const [loading, setLoading] = useState(true);
 
   useEffect(() => {
-    api.getMedicines(0, 500)
-      .then((r) => setMedicines(r.data.filter((m) => m.stock_quantity < 5)))
+    api.listInventory({ status: "low_stock", sort: "stock", limit: 200 })
+      .then((r) => { setMedicines(r.data.items); setTotal(r.data.total); })
       .catch(console.error)
       .finally(() => setLoading(false));
   }, []);
@@ -25,7 +26,7 @@ export default function LowStock() {
         <AlertTriangle size={22} className="text-amber-500" />
         <h1 className="text-2xl font-bold text-slate-800">Low Stock</h1>
         <span className="bg-amber-100 text-amber-700 text-xs font-medium px-2.5 py-0.5 rounded-full">
-          {medicines.length} medicines
+          {total} medicines
         </span>
       </div>
 
@@ -84,10 +84,10 @@ export default function ManualOrder() {
       return;
     }
     try {
-      const res = await api.searchMedicines(query, 8);
+      const res = await api.typeaheadMedicines(query, 8);
       setRows((r) => r.map((row) =>
         row.id === rowId
-          ? { ...row, suggestions: res.data.medicines, showSuggestions: true, loadingSuggestions: false }
+          ? { ...row, suggestions: res.data, showSuggestions: true, loadingSuggestions: false }
           : row
       ));
     } catch {
@@ -3,6 +3,8 @@ import { Plus, Search, Edit2, Trash2, X, AlertTriangle } from "lucide-react";
 import { api } from "../api/client";
 import { useAuth } from "../context/AuthContext";
 
+const PAGE_SIZE = 50;
+
 const EMPTY_FORM = {
   name: "", name_hindi: "", generic_name: "", company: "", category: "",
   price_per_unit: "", mrp: "", stock_quantity: "", reorder_level: "10",
@@ -14,34 +16,29 @@ export default function Medicines() {
   const isAdmin = user?.role === "admi";
 
   const [medicines, setMedicines] = useState([]);
-  const [filtered, setFiltered] = useState([]);
+  const [total, setTotal] = useState(0);
+  const [skip, setSkip] = useState(0);
   const [search, setSearch] = useState("");
   const [loading, setLoading] = useState(true);
   const [modal, setModal] = useState(null); // null | "add" | "edit"
   const [form, setForm] = useState(EMPTY_FORM);
   const [editId, setEditId] = useState(null);
+  const [editVersion, setEditVersion] = useState(null);
   const [saving, setSaving] = useState(false);
   const [error, setError] = useState("");
 
-  const load = () => {
-    setLoading(true);
-    api.getMedicines(0, 500)
-      .then((r) => { setMedicines(r.data); setFiltered(r.data); })
+  // Filtering and paging happen server-side; only the visible page is fetched
+  const load = (q = search, offset = skip) => {
+    api.listInventory({ q: q.trim() || undefined, skip: offset, limit: PAGE_SIZE })
+      .then((r) => { setMedicines(r.data.items); setTotal(r.data.total); setSkip(offset); })
       .catch(console.error)
       .finally(() => setLoading(false));
   };
 
-  useEffect(load, []);
-
   useEffect(() => {
-    if (!search.trim()) { setFiltered(medicines); return; }
-    const q = search.toLowerCase();
-    setFiltered(medicines.filter((m) =>
-      m.name.toLowerCase().includes(q) ||
-      (m.generic_name || "").toLowerCase().includes(q) ||
-      (m.category || "").toLowerCase().includes(q)
-    ));
-  }, [search, medicines]);
+    const timer = setTimeout(() => load(search, 0), 300);
+    return () => clearTimeout(timer);
+  }, [search]);
 
   const openAdd = () => { setForm(EMPTY_FORM); setEditId(null); setError(""); setModal("add"); };
   const openEdit = (m) => {
@@ -54,6 +51,7 @@ export default function Medicines() {
       batch_number: m.batch_number || "", rack_location: m.rack_location || "",
     });
     setEditId(m.id);
+    setEditVersion(m.version_id);
     setError("");
     setModal("edit");
   };
@@ -75,21 +73,22 @@ export default function Medicines() {
       if (modal === "add") {
         await api.createMedicine(payload);
       } else {
-        await api.updateMedicine(editId, payload);
+        await api.updateMedicine(editId, payload, editVersion);
       }
       setModal(null);
       load();
     } catch (err) {
+      if (err.response?.status === 409) load();
       setError(err.response?.data?.detail || "Save failed.");
     } finally {
       setSaving(false);
     }
   };
 
-  const handleDelete = async (id, name) => {
-    if (!window.confirm(`Delete "${name}"?`)) return;
+  const handleDelete = async (m) => {
+    if (!window.confirm(`Delete "${m.name}"?`)) return;
     try {
-      await api.deleteMedicine(id);
+      await api.deleteMedicine(m.id, m.version_id);
       load();
     } catch (err) {
       alert(err.response?.data?.detail || "Delete failed.");
@@ -133,10 +132,10 @@ export default function Medicines() {
               </tr>
             </thead>
             <tbody className="divide-y divide-slate-50">
-              {filtered.length === 0 && (
+              {medicines.length === 0 && (
                 <tr><td colSpan={7} className="px-4 py-10 text-center text-slate-400">No medicines found.</td></tr>
               )}
-              {filtered.map((m) => (
+              {medicines.map((m) => (
                 <tr key={m.id} className="hover:bg-slate-50 transition-colors">
                   <td className="px-4 py-3">
                     <p className="font-medium text-slate-800">{m.name}</p>
@@ -158,7 +157,7 @@ export default function Medicines() {
                         <Edit2 size={15} />
                       </button>
                       {isAdmin && (
-                        <button onClick={() => handleDelete(m.id, m.name)} className="text-red-500 hover:text-red-700">
+                        <button onClick={() => handleDelete(m)} className="text-red-500 hover:text-red-700">
                           <Trash2 size={15} />
                         </button>
                       )}
@@ -169,8 +168,16 @@ export default function Medicines() {
             </tbody>
           </table>
         </div>
-        <div className="px-4 py-3 border-t border-slate-100 text-xs text-slate-400">
-          {filtered.length} of {medicines.length} medicines
+        <div className="px-4 py-3 border-t border-slate-100 text-xs text-slate-400 flex items-center justify-between">
+          <span>
+            {total === 0 ? 0 : skip + 1}–{skip + medicines.length} of {total} medicines
+          </span>
+          <div className="flex gap-2">
+            <button className="btn-secondary text-xs px-3 py-1" disabled={skip === 0}
+              onClick={() => load(search, Math.max(0, skip - PAGE_SIZE))}>Previous</button>
+            <button className="btn-secondary text-xs px-3 py-1" disabled={skip + PAGE_SIZE >= total}
+              onClick={() => load(search, skip + PAGE_SIZE)}>Next</button>
+          </div>
         </div>
       </div>
 
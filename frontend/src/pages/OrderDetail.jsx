@@ -19,6 +19,7 @@ export default function OrderDetail() {
   const [order, setOrder] = useState(null);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState("");
+  const [updating, setUpdating] = useState(false);
 
   useEffect(() => {
     api.getOrder(id)
@@ -27,6 +28,20 @@ export default function OrderDetail() {
       .finally(() => setLoading(false));
   }, [id]);
 
+  const changeStatus = async (status) => {
+    if (status === "cancelled" && !window.confirm("Cancel this order and return its items to stock?")) return;
+    setUpdating(true);
+    try {
+      const r = await api.updateOrderStatus(order.id, status, order.version_id);
+      setOrder(r.data);
+    } catch (err) {
+      alert(err.response?.data?.detail || "Status update failed.");
+      if (err.response?.status === 409) api.getOrder(id).then((r) => setOrder(r.data));
+    } finally {
+      setUpdating(false);
+    }
+  };
+
 /*  const handlePrint = async () => {
   if (!order?.id) {
     alert("Order not found.");
@@ -101,6 +116,17 @@ const handlePrint = () => {
         <div className="ml-auto flex items-center gap-3">
           {statusBadge(order.status)}
 
+          {order.status === "confirmed" && (
+            <button onClick={() => changeStatus("completed")} disabled={updating} className="btn-primary text-sm">
+              Mark Completed
+            </button>
+          )}
+          {(order.status === "pending" || order.status === "confirmed") && (
+            <button onClick={() => changeStatus("cancelled")} disabled={updating} className="btn-secondary text-sm text-red-600">
+              Cancel Order
+            </button>
+          )}
+
           <button
             onClick={handlePrint}
             className="btn-secondary flex items-center gap-2 text-sm"
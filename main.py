@@ -1,23 +1,57 @@
 from fastapi import FastAPI, Depends, HTTPException, status, Request
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, Response
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy.orm import Session
-from sqlalchemy.orm import joinedload
+from sqlalchemy.orm import joinedload, selectinload
+from sqlalchemy.orm.exc import StaleDataError
+from sqlalchemy.exc import IntegrityError
 from fastapi.responses import StreamingResponse
 import io
+import json
+import logging
+import time
 from sqlalchemy.orm import joinedload
-from app.services.invoice_service import InvoiceGenerator
-from typing import List
+from app.services.inventory_service import InventoryService, STOCK_STATUS_FILTERS
+from app.services.stock_service import StockService
+from app.services.export_service import ExportService, EXPORT_FORMATS, ORDER_COLUMNS, CUSTOMER_COLUMNS, MEDICINE_COLUMNS
+from datetime import date, datetime
+from typing import List, Optional
 import os
 
-from app.database import engine, get_db
-from app import models, schemas
-from app.services.order_service import OrderService
-from app.auth import verify_password, get_password_hash, create_access_token, get_current_user, require_roles
+from app.database import (
+    engine, voice_engine, replica_engine, get_db, get_read_db, read_session_factory, replica_guard,
+    request_write_marker, WriteMarker, LAST_WRITE_COOKIE, READ_YOUR_WRITES_SECONDS
+)
+from app import models, schemas, serializers
+from app.cache import catalogue_cache, call_cache, customer_ids
+from app.phones import normalize_phone
+from app.search_index import typeahead_index, variant_map, normalize as normalize_name
+from app.logging_config import setup_logging, shutdown_logging, log_payload, new_request_id, request_id_var, tool_call_id_var, dropped_records
+from app import metrics
+from app.scheduler import scheduler, SCHEDULER_ENABLED
+from app.stock_holds import stock_holds
+from app.order_pipeline import order_finalizer
+from app.rate_limit import WebhookLimiter
+from app.lanes import LaneMiddleware, lane_stats, size_thread_pool
+from app.invalidation import cache_bus
+from app.schema_version import check_schema_version
+from app.warmup import warm_up
+from app.services.order_service import OrderService, ORDER_TRANSITIONS
+from app.services.vapi_service import VapiService
+from app.auth import (
+    verify_password, get_password_hash, create_access_token, get_current_user, get_token_user_id, load_active_user,
+    require_roles
+)
+
+setup_logging()
+logger = logging.getLogger("app")
+vapi_logger = logging.getLogger("app.vapi")
 
-# Create tables
-models.Base.metadata.create_all(bind=engine)
+metrics.instrument_engine(engine)
+metrics.instrument_engine(voice_engine)
+if replica_engine is not None:
+    metrics.instrument_engine(replica_engine)
 
 app = FastAPI(
     title="Medical Shop Management API",
@@ -31,7 +65,167 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Request-ID"],
 )
+# Lanes sit inside the rate limiter (shed requests never queue for a slot),
+# both inside the metrics / request-id middlewares so they still show up there
+app.add_middleware(LaneMiddleware)
+app.add_middleware(WebhookLimiter)
+
+
+@app.exception_handler(StaleDataError)
+async def stale_data_handler(request: Request, exc: StaleDataError):
+    # A version-checked UPDATE/DELETE matched no row: someone else wrote first
+    return JSONResponse(status_code=409, content={"detail": "This record was changed by someone else; reload and try again"})
+
+
+@app.middleware("http")
+async def correlation_id_middleware(request: Request, call_next):
+    request_id = request.headers.get("x-request-id") or new_request_id()
+    token = request_id_var.set(request_id)
+    try:
+        response = await call_next(request)
+    finally:
+        request_id_var.reset(token)
+    response.headers["X-Request-ID"] = request_id
+    return response
+
+
+@app.middleware("http")
+async def read_your_writes_middleware(request: Request, call_next):
+    # A client that just committed something reads from the primary for a
+    # while, so it never sees a replica that hasn't caught up with it yet
+    marker = WriteMarker()
+    token = request_write_marker.set(marker)
+    try:
+        response = await call_next(request)
+    finally:
+        request_write_marker.reset(token)
+    if marker.wrote and replica_guard is not None:
+        response.set_cookie(LAST_WRITE_COOKIE, str(time.time()), max_age=int(READ_YOUR_WRITES_SECONDS) + 1,
+                            httponly=True, samesite="lax")
+    return response
+
+
+@app.middleware("http")
+async def metrics_middleware(request: Request, call_next):
+    method = request.method
+    route = metrics.route_template(app, request.scope)
+    stats = metrics.RequestDBStats()
+    token = metrics.request_db_stats.set(stats)
+    metrics.http_requests_in_flight.inc(method=method, route=route)
+    started = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        metrics.http_requests_in_flight.dec(method=method, route=route)
+        metrics.http_request_duration_seconds.observe(time.perf_counter() - started, method=method, route=route)
+        metrics.http_requests_total.inc(method=method, route=route, status=status_code)
+        metrics.db_statements_per_request.observe(stats.statements, method=method, route=route)
+        metrics.db_time_per_request_seconds.observe(stats.seconds, method=method, route=route)
+        metrics.request_db_stats.reset(token)
+
+
+def _runtime_metrics():
+    cache = catalogue_cache.stats()
+    yield ("catalogue_cache_hits_total", "counter", "Catalogue cache hits", {}, cache["hits"])
+    yield ("catalogue_cache_misses_total", "counter", "Catalogue cache misses", {}, cache["misses"])
+    yield ("catalogue_cache_not_modified_total", "counter", "Catalogue 304 responses", {}, cache["not_modified"])
+    yield ("catalogue_cache_evictions_total", "counter", "Catalogue cache evictions", {}, cache["evictions"])
+    yield ("catalogue_cache_entries", "gauge", "Cached catalogue responses", {}, cache["entries"])
+    yield ("catalogue_cache_bytes", "gauge", "Bytes held by the catalogue cache", {}, cache["bytes"])
+    yield ("catalogue_version", "gauge", "Current catalogue version", {}, cache["version"])
+    calls = call_cache.stats()
+    yield ("vapi_call_cache_hits_total", "counter", "Medicine names answered from the per-call cache", {}, calls["hits"])
+    yield ("vapi_call_cache_misses_total", "counter", "Medicine names resolved from the database", {}, calls["misses"])
+    yield ("vapi_call_cache_calls", "gauge", "Vapi calls with cached lookups", {}, calls["calls"])
+    customers = customer_ids.stats()
+    yield ("customer_cache_hits_total", "counter", "Order customers looked up in the phone cache and found", {},
+           customers["hits"])
+    yield ("customer_cache_misses_total", "counter", "Order customers not in the phone cache", {}, customers["misses"])
+    holds = stock_holds.stats()
+    yield ("stock_holds_active", "gauge", "Active stock holds for voice calls", {}, holds["holds"])
+    yield ("stock_holds_units", "gauge", "Stock units currently held for voice calls", {}, holds["units_held"])
+    yield ("stock_holds_created_total", "counter", "Stock holds created by check-stock", {}, holds["created"])
+    yield ("stock_holds_expired_total", "counter", "Stock holds released by timeout", {}, holds["expired"])
+    yield ("stock_holds_converted_total", "counter", "Stock holds used up by a placed order", {}, holds["converted"])
+    if replica_guard is not None:
+        replica = replica_guard.stats()
+        yield ("replica_healthy", "gauge", "1 while the read replica is within the lag limit", {},
+               1 if replica["healthy"] else 0)
+        if replica["lag_seconds"] is not None:
+            yield ("replica_lag_seconds", "gauge", "Last measured replica lag", {}, replica["lag_seconds"])
+        yield ("read_queries_routed_total", "counter", "Read-only requests by the database serving them",
+               {"target": "replica"}, replica["replica_reads"])
+        yield ("read_queries_routed_total", "counter", "Read-only requests by the database serving them",
+               {"target": "primary"}, replica["primary_reads"])
+    bus = cache_bus.stats()
+    yield ("cache_invalidations_published_total", "counter", "Cache invalidations sent to other workers", {},
+           bus["published"])
+    yield ("cache_invalidations_received_total", "counter", "Cache invalidations applied from other workers", {},
+           bus["received"])
+    pipeline = order_finalizer.stats()
+    yield ("order_finalize_queued", "gauge", "Fast-ack orders waiting for finalization", {}, pipeline["queued"])
+    yield ("order_finalize_done_total", "counter", "Fast-ack orders finalized", {}, pipeline["finalized"])
+    yield ("order_finalize_retries_total", "counter", "Order finalization retries", {}, pipeline["retried"])
+    yield ("order_finalize_dead_letters_total", "counter", "Orders moved to the dead-letter table", {},
+           pipeline["dead_lettered"])
+    yield ("variant_map_names", "gauge", "Medicine names held in the packaging variant map", {}, len(variant_map))
+    yield ("log_records_dropped_total", "counter", "Log records dropped because the queue was full", {},
+           dropped_records())
+    pool = engine.pool
+    if hasattr(pool, "checkedout"):
+        yield ("db_pool_checked_out", "gauge", "DB connections currently checked out", {}, pool.checkedout())
+    voice_pool = voice_engine.pool
+    if hasattr(voice_pool, "checkedout"):
+        yield ("voice_db_pool_checked_out", "gauge", "Voice-lane DB connections currently checked out", {},
+               voice_pool.checkedout())
+    replica_pool = replica_engine.pool if replica_engine is not None else None
+    if hasattr(replica_pool, "checkedout"):
+        yield ("replica_db_pool_checked_out", "gauge", "Read-replica DB connections currently checked out", {},
+               replica_pool.checkedout())
+
+
+metrics.registry.add_collector(_runtime_metrics)
+
+
+# Tables come from migrations (alembic upgrade head); startup only checks the version
+@app.on_event("startup")
+def verify_schema():
+    check_schema_version()
+
+
+@app.on_event("startup")
+async def start_lanes():
+    size_thread_pool()
+
+
+@app.on_event("startup")
+def start_scheduler():
+    cache_bus.start()
+    stock_holds.start()
+    order_finalizer.recover()
+    order_finalizer.start()
+    if SCHEDULER_ENABLED:
+        scheduler.start()
+
+
+# Runs last: the server starts accepting connections once every startup hook is done
+@app.on_event("startup")
+def warm_up_worker():
+    warm_up()
+
+
+@app.on_event("shutdown")
+def flush_logs():
+    scheduler.stop()
+    stock_holds.stop()
+    order_finalizer.stop()
+    cache_bus.stop()
+    shutdown_logging()
 
 
 
@@ -43,6 +237,10 @@ def root():
 def health_check():
     return {"status": "healthy"}
 
+@app.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics():
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
 # ===== VAPI WEBHOOK =====
 # ===================================================
 # REPLACE your existing vapi_webhook function in main.py
@@ -59,13 +257,10 @@ def health_check():
 # ===================================================
 
 @app.post("/api/vapi/webhook")
-async def vapi_webhook(request: Request, db: Session = Depends(get_db)):
+async def vapi_webhook(request: Request):
     try:
-        import re
-        from sqlalchemy import or_
-
         body = await request.json()
-        print("Vapi webhook received:", body)
+        log_payload(vapi_logger, "Vapi webhook received", body)
 
         # ── Detect payload format ─────────────────────────────
         message = body.get("message", {})
@@ -76,121 +271,28 @@ async def vapi_webhook(request: Request, db: Session = Depends(get_db)):
             tool_calls = message.get("toolCalls", [])
             if not tool_calls:
                 return {"results": [{"toolCallId": "none", "result": "No order data"}]}
-            tool_call = tool_calls[0]
-            tool_call_id = tool_call.get("id", "tool-1")
-            function_args = tool_call.get("function", {}).get("arguments", {})
 
         # FORMAT 2: {"customer_name": "...", "medicines": [...]} (flat format)
         elif "medicines" in body or "customer_name" in body:
-            print("Detected flat payload format from Vapi")
-            tool_call_id = "tool-1"
-            function_args = body  # the body itself is the args
+            vapi_logger.debug("Detected flat payload format from Vapi")
+            tool_calls = [{"id": "tool-1", "function": {"arguments": body}}]  # the body itself is the args
 
         else:
-            print("Unknown format, ignoring:", msg_type)
+            vapi_logger.info("Ignoring Vapi message", extra={"msg_type": msg_type})
             return {"status": "received"}
 
-        # ── Extract raw data ──────────────────────────────────
-        raw_medicines = function_args.get("medicines", [])
-        cleaned_medicines = []
-        out_of_stock = []
-
-        for m in raw_medicines:
-            med_name = m.get("name", "").strip()
-            if not med_name:
-                continue
-
-            # ── STOCK CHECK ───────────────────────────────────
-            found = db.query(models.Medicine).filter(
-                or_(
-                    models.Medicine.name.ilike(f"%{med_name}%"),
-                    models.Medicine.name_hindi.ilike(f"%{med_name}%"),
-                    models.Medicine.generic_name.ilike(f"%{med_name}%")
-                )
-            ).first()
-
-            if not found or found.stock_quantity <= 0:
-                print(f"Stock check FAILED: {med_name} -> out of stock or not found")
-                out_of_stock.append(med_name)
-                continue
-
-            print(f"Stock check OK: {med_name} -> qty={found.stock_quantity}")
-
-            # ── Clean quantity ────────────────────────────────
-            raw_qty = str(m.get("quantity", "1"))
-            qty_match = re.search(r'\d+', raw_qty)
-            qty = int(qty_match.group()) if qty_match else 1
-
-            # ── Clean packaging ───────────────────────────────
-            raw_pack = str(m.get("packaging", "strip")).lower()
-            packaging = "strip"
-            for vp in ["strip", "bottle", "box", "loose", "tube", "vial"]:
-                if vp in raw_pack:
-                    packaging = vp
-                    break
-
-            cleaned_medicines.append({
-                "name": med_name,
-                "quantity": qty,
-                "packaging": packaging
-            })
-
-        # ── If ALL medicines out of stock ─────────────────────
-        if not cleaned_medicines:
-            msg = "Sorry, ye medicines stock mein nahi hain: {}. Koi aur medicine chahiye?".format(
-                ", ".join(out_of_stock))
-            print("All medicines out of stock:", out_of_stock)
-            return {"results": [{"toolCallId": tool_call_id, "result": msg}]}
-
-        # ── Clean phone ───────────────────────────────────────
-        raw_phone = str(function_args.get("customer_phone", "0000000000"))
-        digits_only = re.sub(r'\D', '', raw_phone)
-        if len(digits_only) == 10:
-            phone = "+91" + digits_only
-        elif len(digits_only) > 10:
-            phone = "+" + digits_only
-        else:
-            phone = "+91" + digits_only.zfill(10)
-
-        # ── Clean name ────────────────────────────────────────
-        customer_name = function_args.get("customer_name", "").strip() or "Customer"
-
-        print(f"Placing order -> name={customer_name}, phone={phone}, medicines={cleaned_medicines}")
-
-        order_request = schemas.AIAgentOrderRequest(
-            customer_name=customer_name,
-            customer_phone=phone,
-            customer_address=function_args.get("customer_address", None) or None,
-            medicines=cleaned_medicines,
-            language=function_args.get("language", "hindi") or "hindi"
-        )
+        return await VapiService.run_tool_calls(
+            tool_calls, VapiService.place_order, "Error processing order. Please call again.",
+            call_id=VapiService.call_id(message))
 
-        result = OrderService.create_order_from_ai_agent(db, order_request)
-        print("Order result:", result)
-
-        if result.get("success"):
-            skipped = ""
-            if out_of_stock:
-                skipped = " Note: {} stock mein nahi tha.".format(", ".join(out_of_stock))
-            msg = "Order placed! Order number {}. Total {} rupees. Shukriya!{}".format(
-                result.get("order_number"), result.get("total_amount"), skipped)
-        else:
-            msg = "Sorry order nahi hua. {}".format(result.get("message"))
-
-        return {"results": [{"toolCallId": tool_call_id, "result": msg}]}
-
-    except Exception as e:
-        print("Vapi webhook error:", str(e))
-        import traceback
-        traceback.print_exc()
+    except Exception:
+        vapi_logger.exception("Vapi webhook error")
         return {"results": [{"toolCallId": "error", "result": "Error processing order. Please call again."}]}
-# ADD THIS SECTION TO YOUR main.py
-# Place it right after the existing VAPI WEBHOOK section
-# ===================================================
+
 
 # ===== VAPI STOCK CHECK TOOL =====
 @app.post("/api/vapi/check-stock")
-async def vapi_check_stock(request: Request, db: Session = Depends(get_db)):
+async def vapi_check_stock(request: Request):
     """
     Vapi calls this endpoint mid-call as a Tool Call.
     It checks if a medicine is in stock and returns
@@ -198,7 +300,7 @@ async def vapi_check_stock(request: Request, db: Session = Depends(get_db)):
     """
     try:
         body = await request.json()
-        print("Vapi check-stock received:", body)
+        log_payload(vapi_logger, "Vapi check-stock received", body)
 
         message = body.get("message", {})
         msg_type = message.get("type", "")
@@ -210,61 +312,11 @@ async def vapi_check_stock(request: Request, db: Session = Depends(get_db)):
         if not tool_calls:
             return {"results": [{"toolCallId": "none", "result": "No medicine name provided."}]}
 
-        tool_call = tool_calls[0]
-        tool_call_id = tool_call.get("id", "tool-1")
-        args = tool_call.get("function", {}).get("arguments", {})
-
-        medicine_name = args.get("medicine_name", "").strip()
-
-        if not medicine_name:
-            return {
-                "results": [{
-                    "toolCallId": tool_call_id,
-                    "result": "Nahi hai."
-                }]
-            }
-
-        # Search for the medicine (handles Hindi + English names)
-        from sqlalchemy import or_
-        medicines = db.query(models.Medicine).filter(
-            or_(
-                models.Medicine.name.ilike(f"%{medicine_name}%"),
-                models.Medicine.name_hindi.ilike(f"%{medicine_name}%"),
-                models.Medicine.generic_name.ilike(f"%{medicine_name}%")
-            )
-        ).all()
-
-        if not medicines:
-            return {
-                "results": [{
-                    "toolCallId": tool_call_id,
-                    "result": "Nahi hai."
-                }]
-            }
-
-        # Found the medicine - check stock
-        medicine = medicines[0]  # Best match
-        stock = medicine.stock_quantity
-        name_display = medicine.name
-
-        if stock <= 0:
-            result_msg = "Nahi hai."
-        else:
-            result_msg = "Haa."
-
-        print(f"Stock check: {name_display} -> qty={stock} -> {result_msg}")
+        return await VapiService.run_tool_calls(
+            tool_calls, VapiService.check_stock, "Nahi hai.", call_id=VapiService.call_id(message))
 
-        return {
-            "results": [{
-                "toolCallId": tool_call_id,
-                "result": result_msg
-            }]
-        }
-
-    except Exception as e:
-        print("Stock check error:", str(e))
-        import traceback
-        traceback.print_exc()
+    except Exception:
+        vapi_logger.exception("Stock check error")
         return {
             "results": [{
                 "toolCallId": "error",
@@ -275,7 +327,7 @@ async def vapi_check_stock(request: Request, db: Session = Depends(get_db)):
 
 # ===== VAPI BULK STOCK CHECK (check multiple medicines at once) =====
 @app.post("/api/vapi/check-stock-bulk")
-async def vapi_check_stock_bulk(request: Request, db: Session = Depends(get_db)):
+async def vapi_check_stock_bulk(request: Request):
     """
     Check stock for multiple medicines at once.
     Vapi can call this after collecting the full order
@@ -293,62 +345,12 @@ async def vapi_check_stock_bulk(request: Request, db: Session = Depends(get_db))
         if not tool_calls:
             return {"results": [{"toolCallId": "none", "result": "No medicines provided."}]}
 
-        tool_call = tool_calls[0]
-        tool_call_id = tool_call.get("id", "tool-1")
-        args = tool_call.get("function", {}).get("arguments", {})
-
-        medicines_list = args.get("medicines", [])
-
-        if not medicines_list:
-            return {
-                "results": [{
-                    "toolCallId": tool_call_id,
-                    "result": "No medicines in the order. Koi medicine nahi bataya."
-                }]
-            }
-
-        from sqlalchemy import or_
-        available = []
-        unavailable = []
-
-        for item in medicines_list:
-            med_name = item.get("name", "").strip()
-            qty_requested = item.get("quantity", 1)
-
-            results = db.query(models.Medicine).filter(
-                or_(
-                    models.Medicine.name.ilike(f"%{med_name}%"),
-                    models.Medicine.name_hindi.ilike(f"%{med_name}%"),
-                    models.Medicine.generic_name.ilike(f"%{med_name}%")
-                )
-            ).all()
-
-            if not results:
-                unavailable.append(f"{med_name} (not found)")
-            else:
-                med = results[0]
-                if med.stock_quantity <= 0:
-                    unavailable.append(f"{med.name} (out of stock)")
-                elif med.stock_quantity < qty_requested:
-                    available.append(f"{med.name} (only {med.stock_quantity} available, you asked for {qty_requested})")
-                else:
-                    available.append(f"{med.name} x{qty_requested} ✓")
-
-        if not unavailable:
-            result_msg = "Sab haa."
-        else:
-            unavail_str = ', '.join(unavailable)
-            result_msg = f"{unavail_str} nahi hai."
-
-        return {
-            "results": [{
-                "toolCallId": tool_call_id,
-                "result": result_msg
-            }]
-        }
+        return await VapiService.run_tool_calls(
+            tool_calls, VapiService.check_stock_bulk, "Stock check mein error hua. Please try again.",
+            call_id=VapiService.call_id(message))
 
-    except Exception as e:
-        print("Bulk stock check error:", str(e))
+    except Exception:
+        vapi_logger.exception("Bulk stock check error")
         return {
             "results": [{
                 "toolCallId": "error",
@@ -371,49 +373,211 @@ def create_medicine(medicine: schemas.MedicineCreate, db: Session = Depends(get_
                     _=Depends(require_roles("shopkeeper", "admin"))):
     db_medicine = models.Medicine(**medicine.dict())
     db.add(db_medicine)
+    db.flush()
+    # Opening balance, so the ledger adds up to stock_quantity from day one
+    StockService.record_movements(db, [StockService.movement(
+        db_medicine.id, models.MovementType.ADJUSTMENT, db_medicine.stock_quantity or 0, reference="opening"
+    )])
     db.commit()
+    catalogue_cache.bump(names=True)
     db.refresh(db_medicine)
     return db_medicine
 
+def _serialize_medicines(medicines) -> list:
+    return [schemas.MedicineResponse.model_validate(m).model_dump(mode="json") for m in medicines]
+
+def _medicine_list_json(medicines) -> bytes:
+    if serializers.FAST_JSON_ENABLED:
+        return serializers.medicine_list_serializer.to_json(medicines)
+    return json.dumps(_serialize_medicines(medicines)).encode()
+
 @app.get("/api/medicines", response_model=List[schemas.MedicineResponse])
-def get_medicines(skip: int = 0, limit: int = 100, db: Session = Depends(get_db),
-                  _=Depends(get_current_user)):
-    return db.query(models.Medicine).offset(skip).limit(limit).all()
+def get_medicines(request: Request, skip: int = 0, limit: int = 100, db: Session = Depends(get_db),
+                  user_id: int = Depends(get_token_user_id)):
+    def build():
+        medicines = db.query(models.Medicine).offset(skip).limit(limit).all()
+        return _medicine_list_json(medicines)
+    return catalogue_cache.cached_response(
+        request, ("list", skip, limit), build, authorize=lambda: load_active_user(db, user_id))
+
+@app.get("/api/medicines/typeahead", response_model=List[schemas.MedicineTypeaheadItem])
+def medicine_typeahead(request: Request, q: str, limit: int = 10, db: Session = Depends(get_db),
+                       user_id: int = Depends(get_token_user_id)):
+    """Prefix search over names, Hindi names and generics, served from memory"""
+    prefix = normalize_name(q)
+    limit = max(1, min(limit, 50))
+
+    def build():
+        return json.dumps(typeahead_index.search(prefix, limit), ensure_ascii=False).encode()
+    return catalogue_cache.cached_response(
+        request, ("typeahead", prefix, limit), build, cache_control="private, max-age=30",
+        authorize=lambda: load_active_user(db, user_id))
+
+@app.get("/api/medicines/by-name", response_model=List[schemas.MedicineResponse])
+def get_medicines_by_name(name: str, db: Session = Depends(get_db),
+                          _=Depends(get_current_user)):
+    """All packaging variants of a medicine, matched case-insensitively on the exact name"""
+    variants = variant_map.get(
+        name, lambda key: _serialize_medicines(OrderService.get_medicines_by_name(db, key)))
+    return serializers.FastJSONResponse(variants)
+
+def _version_etag(version_id: int) -> str:
+    return f'"{version_id}"'
+
+def _check_if_match(request: Request, version_id: int):
+    """409 unless If-Match (when sent) names the row version the client last saw"""
+    if_match = request.headers.get("if-match")
+    if not if_match or if_match.strip() == "*":
+        return
+    tags = [tag.strip().removeprefix("W/") for tag in if_match.split(",")]
+    if _version_etag(version_id) not in tags:
+        raise HTTPException(status_code=409, detail="This record was changed by someone else; reload and try again")
 
 @app.get("/api/medicines/{medicine_id}", response_model=schemas.MedicineResponse)
-def get_medicine(medicine_id: int, db: Session = Depends(get_db),
+def get_medicine(medicine_id: int, response: Response, db: Session = Depends(get_db),
                  _=Depends(get_current_user)):
     medicine = db.query(models.Medicine).filter(models.Medicine.id == medicine_id).first()
     if not medicine:
         raise HTTPException(status_code=404, detail="Medicine not found")
+    response.headers["ETag"] = _version_etag(medicine.version_id)
     return medicine
 
 @app.put("/api/medicines/{medicine_id}", response_model=schemas.MedicineResponse)
-def update_medicine(medicine_id: int, medicine_update: schemas.MedicineUpdate, db: Session = Depends(get_db),
-                    _=Depends(require_roles("shopkeeper", "admin"))):
+def update_medicine(medicine_id: int, medicine_update: schemas.MedicineUpdate, request: Request, response: Response,
+                    db: Session = Depends(get_db), _=Depends(require_roles("shopkeeper", "admin"))):
+    """
+    No row lock: the UPDATE is conditional on the version read here, so a
+    sale or another edit landing in between turns this into a 409 instead
+    of being overwritten.
+    """
     medicine = db.query(models.Medicine).filter(models.Medicine.id == medicine_id).first()
     if not medicine:
         raise HTTPException(status_code=404, detail="Medicine not found")
-    for key, value in medicine_update.dict(exclude_unset=True).items():
+    _check_if_match(request, medicine.version_id)
+    changes = medicine_update.dict(exclude_unset=True)
+    if changes.get("stock_quantity") is not None:
+        # Record a manual count in the ledger as the difference from the version read
+        StockService.record_movements(db, [StockService.movement(
+            medicine_id, models.MovementType.ADJUSTMENT, changes["stock_quantity"] - medicine.stock_quantity,
+            reference="manual-edit"
+        )])
+    for key, value in changes.items():
         setattr(medicine, key, value)
     db.commit()
+    # A stock-only edit leaves the typeahead index alone
+    catalogue_cache.bump(names=bool(changes.keys() - {"stock_quantity"}))
     db.refresh(medicine)
+    response.headers["ETag"] = _version_etag(medicine.version_id)
     return medicine
 
+MEDICINE_IN_USE = "Medicine has orders or stock history and can't be deleted; adjust its stock to 0 instead"
+
 @app.delete("/api/medicines/{medicine_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_medicine(medicine_id: int, db: Session = Depends(get_db),
+def delete_medicine(medicine_id: int, request: Request, db: Session = Depends(get_db),
                     _=Depends(require_roles("admin"))):
     medicine = db.query(models.Medicine).filter(models.Medicine.id == medicine_id).first()
     if not medicine:
         raise HTTPException(status_code=404, detail="Medicine not found")
+    _check_if_match(request, medicine.version_id)
+    # Sales and the stock ledger reference the medicine; keep that history intact
+    has_history = db.query(
+        db.query(models.OrderItem.id).filter(models.OrderItem.medicine_id == medicine_id).exists()
+    ).scalar() or db.query(
+        db.query(models.StockMovement.id).filter(models.StockMovement.medicine_id == medicine_id).exists()
+    ).scalar()
+    if has_history:
+        raise HTTPException(status_code=409, detail=MEDICINE_IN_USE)
+    # Nightly snapshots of a medicine that never had stock are all zeros, and holds are short-lived
+    db.query(models.StockSnapshot).filter(models.StockSnapshot.medicine_id == medicine_id).delete()
+    db.query(models.StockHold).filter(models.StockHold.medicine_id == medicine_id).delete()
     db.delete(medicine)
+    try:
+        db.commit()
+    except IntegrityError:
+        # Sold or restocked between the check and the delete
+        db.rollback()
+        raise HTTPException(status_code=409, detail=MEDICINE_IN_USE)
+    catalogue_cache.bump(names=True)
+
+@app.get("/api/medicines/{medicine_id}/batches", response_model=List[schemas.MedicineBatchResponse])
+def get_medicine_batches(medicine_id: int, include_empty: bool = False, db: Session = Depends(get_db),
+                         _=Depends(require_roles("shopkeeper", "admin"))):
+    query = db.query(models.MedicineBatch).filter(models.MedicineBatch.medicine_id == medicine_id)
+    if not include_empty:
+        query = query.filter(models.MedicineBatch.quantity > 0)
+    return query.order_by(models.MedicineBatch.expiry_date, models.MedicineBatch.id).all()
+
+@app.post("/api/medicines/{medicine_id}/batches", response_model=schemas.MedicineBatchResponse,
+          status_code=status.HTTP_201_CREATED)
+def add_medicine_batch(medicine_id: int, batch: schemas.MedicineBatchCreate, db: Session = Depends(get_db),
+                       _=Depends(require_roles("shopkeeper", "admin"))):
+    """Add stock as a new batch; the medicine's stock total is incremented, not overwritten"""
+    if not db.query(models.Medicine.id).filter(models.Medicine.id == medicine_id).first():
+        raise HTTPException(status_code=404, detail="Medicine not found")
+    db_batch = StockService.add_batch(db, medicine_id, **batch.dict())
+    db.commit()
+    catalogue_cache.bump()
+    db.refresh(db_batch)
+    return db_batch
+
+@app.post("/api/medicines/{medicine_id}/stock-adjustments", response_model=schemas.StockMovementResponse,
+          status_code=status.HTTP_201_CREATED)
+def adjust_medicine_stock(medicine_id: int, adjustment: schemas.StockAdjustmentCreate, db: Session = Depends(get_db),
+                          _=Depends(require_roles("shopkeeper", "admin"))):
+    """Count corrections, customer returns and expiry write-offs, applied as relative changes"""
+    medicine = StockService.lock_medicines(db, [medicine_id]).get(medicine_id)
+    if not medicine:
+        raise HTTPException(status_code=404, detail="Medicine not found")
+    if medicine.stock_quantity + adjustment.quantity < 0:
+        raise HTTPException(status_code=400, detail=f"Only {medicine.stock_quantity} units in stock")
+    if adjustment.batch_id is not None:
+        batch = db.query(models.MedicineBatch).filter(
+            models.MedicineBatch.id == adjustment.batch_id,
+            models.MedicineBatch.medicine_id == medicine_id
+        ).with_for_update().first()
+        if not batch:
+            raise HTTPException(status_code=404, detail="Batch not found")
+        if batch.quantity + adjustment.quantity < 0:
+            raise HTTPException(status_code=400, detail=f"Only {batch.quantity} units left in this batch")
+    StockService.adjust(db, medicine_id, adjustment.quantity, adjustment.movement_type,
+                        batch_id=adjustment.batch_id, reference="manual", note=adjustment.note)
+    # Still holding the row lock, so the newest movement is the one just written
+    movement = db.query(models.StockMovement).filter(
+        models.StockMovement.medicine_id == medicine_id
+    ).order_by(models.StockMovement.id.desc()).first()
     db.commit()
+    catalogue_cache.bump()
+    return movement
+
+@app.get("/api/medicines/{medicine_id}/stock-movements", response_model=List[schemas.StockMovementResponse])
+def get_stock_movements(medicine_id: int, before_id: Optional[int] = None, limit: int = 100,
+                        db: Session = Depends(get_db), _=Depends(require_roles("shopkeeper", "admin"))):
+    """Newest first; pass the last id seen as `before_id` for the next page"""
+    query = db.query(models.StockMovement).filter(models.StockMovement.medicine_id == medicine_id)
+    if before_id is not None:
+        query = query.filter(models.StockMovement.id < before_id)
+    return query.order_by(models.StockMovement.id.desc()).limit(max(1, min(limit, 500))).all()
+
+@app.get("/api/medicines/{medicine_id}/stock-at", response_model=schemas.StockAtResponse)
+def get_stock_at(medicine_id: int, at: datetime, db: Session = Depends(get_db),
+                 _=Depends(require_roles("shopkeeper", "admin"))):
+    """Stock on hand at a past moment, from the nearest daily snapshot plus ledger rows"""
+    result = StockService.stock_at(db, medicine_id, at.replace(tzinfo=None))
+    if result is None:
+        raise HTTPException(status_code=404, detail="Medicine not found")
+    return result
 
 @app.post("/api/medicines/search", response_model=schemas.MedicineSearchResponse)
-def search_medicines(search_request: schemas.MedicineSearchRequest, db: Session = Depends(get_db),
-                     _=Depends(get_current_user)):
-    medicines = OrderService.search_medicine(db, search_request.query, search_request.limit)
-    return {"medicines": medicines, "total": len(medicines)}
+def search_medicines(request: Request, search_request: schemas.MedicineSearchRequest, db: Session = Depends(get_db),
+                     user_id: int = Depends(get_token_user_id)):
+    def build():
+        medicines = OrderService.search_medicine(db, search_request.query, search_request.limit)
+        if serializers.FAST_JSON_ENABLED:
+            return serializers.medicine_search_serializer.to_json({"medicines": medicines, "total": len(medicines)})
+        return json.dumps({"medicines": _serialize_medicines(medicines), "total": len(medicines)}).encode()
+    return catalogue_cache.cached_response(
+        request, ("search", search_request.query, search_request.limit), build,
+        authorize=lambda: load_active_user(db, user_id))
 
 
 
@@ -421,10 +585,11 @@ def search_medicines(search_request: schemas.MedicineSearchRequest, db: Session
 @app.post("/api/customers", response_model=schemas.CustomerResponse, status_code=status.HTTP_201_CREATED)
 def create_customer(customer: schemas.CustomerCreate, db: Session = Depends(get_db),
                     _=Depends(require_roles("shopkeeper", "admin"))):
-    existing = db.query(models.Customer).filter(models.Customer.phone == customer.phone).first()
+    phone = normalize_phone(customer.phone)
+    existing = db.query(models.Customer).filter(models.Customer.phone == phone).first()
     if existing:
         raise HTTPException(status_code=400, detail="Customer with this phone already exists")
-    db_customer = models.Customer(**customer.dict())
+    db_customer = models.Customer(**dict(customer.dict(), phone=phone))
     db.add(db_customer)
     db.commit()
     db.refresh(db_customer)
@@ -446,7 +611,7 @@ def get_customer(customer_id: int, db: Session = Depends(get_db),
 @app.get("/api/customers/phone/{phone}", response_model=schemas.CustomerResponse)
 def get_customer_by_phone(phone: str, db: Session = Depends(get_db),
                           _=Depends(require_roles("shopkeeper", "admin"))):
-    customer = db.query(models.Customer).filter(models.Customer.phone == phone).first()
+    customer = db.query(models.Customer).filter(models.Customer.phone == normalize_phone(phone)).first()
     if not customer:
         raise HTTPException(status_code=404, detail="Customer not found")
     return customer
@@ -463,12 +628,41 @@ def create_order(order: schemas.OrderCreate, db: Session = Depends(get_db),
         raise HTTPException(status_code=500, detail="Error creating order: {}".format(str(e)))
 
 @app.get("/api/orders", response_model=List[schemas.OrderResponse])
-def get_orders(skip: int = 0, limit: int = 100, db: Session = Depends(get_db),
+def get_orders(skip: int = 0, limit: int = 100, db: Session = Depends(get_read_db),
                _=Depends(require_roles("shopkeeper", "admin"))):
-    return db.query(models.Order).order_by(models.Order.order_date.desc()).offset(skip).limit(limit).all()
+    orders = (
+        db.query(models.Order)
+        .options(
+            selectinload(models.Order.customer),
+            selectinload(models.Order.invoice),
+            selectinload(models.Order.order_items).selectinload(models.OrderItem.medicine)
+        )
+        .order_by(models.Order.order_date.desc())
+        .offset(skip)
+        .limit(limit)
+        .all()
+    )
+    if serializers.FAST_JSON_ENABLED:
+        return serializers.order_list_serializer.response(orders)
+    return orders
+
+@app.put("/api/orders/bulk-status", response_model=schemas.BulkOrderStatusResult)
+def bulk_update_order_status(update: schemas.BulkOrderStatusUpdate, db: Session = Depends(get_db),
+                             _=Depends(require_roles("shopkeeper", "admin"))):
+    """Change many orders at once (e.g. complete a whole day) with a single UPDATE"""
+    try:
+        updated = OrderService.change_status(db, update.status.value, order_ids=update.order_ids,
+                                             order_date=update.order_date)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    db.commit()
+    if update.status == schemas.OrderStatusEnum.CANCELLED and updated:
+        catalogue_cache.bump()
+    skipped = sorted(set(update.order_ids or ()) - set(updated))
+    return {"status": update.status.value, "updated": sorted(updated), "skipped": skipped}
 
 @app.get("/api/orders/my", response_model=List[schemas.OrderResponse])
-def get_my_orders(db: Session = Depends(get_db),
+def get_my_orders(db: Session = Depends(get_read_db),
                   current_user: models.User = Depends(require_roles("customer"))):
     """Customer's own orders matched by phone."""
     if not current_user.phone:
@@ -485,6 +679,7 @@ def get_my_orders(db: Session = Depends(get_db),
 @app.get("/api/orders/{order_id}", response_model=schemas.OrderResponse)
 def get_order(
     order_id: int,
+    response: Response,
     db: Session = Depends(get_db),
     _=Depends(get_current_user)
 ):
@@ -503,8 +698,38 @@ def get_order(
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
 
+    # No fast path here: for a single order the compiled serializer measured no faster
+    response.headers["ETag"] = _version_etag(order.version_id)
     return order
 
+@app.put("/api/orders/{order_id}/status", response_model=schemas.OrderResponse)
+def update_order_status(order_id: int, update: schemas.OrderStatusUpdate, request: Request, response: Response,
+                        db: Session = Depends(get_db), _=Depends(require_roles("shopkeeper", "admin"))):
+    """
+    pending -> confirmed -> completed, or pending/confirmed -> cancelled.
+    Cancelling returns the items to stock. Honours If-Match.
+    """
+    order = db.query(models.Order).filter(models.Order.id == order_id).first()
+    if not order:
+        raise HTTPException(status_code=404, detail="Order not found")
+    _check_if_match(request, order.version_id)
+    new_status = update.status.value
+    if order.status not in ORDER_TRANSITIONS.get(new_status, ()):
+        raise HTTPException(status_code=400, detail=f"Cannot change order from '{order.status}' to '{new_status}'")
+    try:
+        changed = OrderService.change_status(db, new_status, order_ids=[order_id],
+                                             expected_version=order.version_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not changed:
+        db.rollback()
+        raise HTTPException(status_code=409, detail="This record was changed by someone else; reload and try again")
+    db.commit()
+    if new_status == "cancelled":
+        catalogue_cache.bump()
+    db.expire_all()
+    return get_order(order_id, response, db)
+
 @app.get("/api/orders/number/{order_number}", response_model=schemas.OrderResponse)
 def get_order_by_number(order_number: str, db: Session = Depends(get_db),
                         _=Depends(get_current_user)):
@@ -544,6 +769,8 @@ def download_invoice(invoice_id: int, db: Session = Depends(get_db)):
 
     # Generate PDF in memory
     buffer = io.BytesIO()
+    from app.services.invoice_service import InvoiceGenerator  # ReportLab loads on first PDF
+
     invoice_generator = InvoiceGenerator()
     invoice_generator.generate_invoice_pdf(order, invoice, buffer)
 
@@ -559,14 +786,13 @@ def download_invoice(invoice_id: int, db: Session = Depends(get_db)):
 
 # ===== DASHBOARD =====
 @app.get("/api/dashboard/stats")
-def get_dashboard_stats(db: Session = Depends(get_db),
+def get_dashboard_stats(db: Session = Depends(get_read_db),
                         _=Depends(require_roles("shopkeeper", "admin"))):
     from datetime import datetime
     total_orders = db.query(models.Order).count()
     total_customers = db.query(models.Customer).count()
     total_medicines = db.query(models.Medicine).count()
-    low_stock = db.query(models.Medicine).filter(
-        models.Medicine.stock_quantity <= models.Medicine.reorder_level).count()
+    low_stock = db.query(models.Medicine).filter(STOCK_STATUS_FILTERS["low_stock"]()).count()
     today_orders = db.query(models.Order).filter(
         models.Order.order_date >= datetime.now().date()).count()
     revenue_sum = sum([inv[0] for inv in db.query(models.Invoice).with_entities(
@@ -576,7 +802,7 @@ def get_dashboard_stats(db: Session = Depends(get_db),
             "today_orders": today_orders, "total_revenue": revenue_sum}
 
 @app.get("/api/dashboard/my-stats")
-def get_my_stats(db: Session = Depends(get_db),
+def get_my_stats(db: Session = Depends(get_read_db),
                  current_user: models.User = Depends(require_roles("customer"))):
     """Customer's own stats matched by phone."""
     if current_user.phone:
@@ -592,12 +818,144 @@ def get_my_stats(db: Session = Depends(get_db),
     return {"total_orders": 0, "pending_orders": 0, "total_spent": 0.0}
 
 @app.get("/api/dashboard/low-stock")
-def get_low_stock_medicines(db: Session = Depends(get_db),
+def get_low_stock_medicines(db: Session = Depends(get_read_db),
                             _=Depends(require_roles("shopkeeper", "admin"))):
-    return db.query(models.Medicine).filter(
-        models.Medicine.stock_quantity <= models.Medicine.reorder_level).all()
+    return db.query(models.Medicine).filter(STOCK_STATUS_FILTERS["low_stock"]()).all()
+
+# ===== INVENTORY =====
+@app.get("/api/inventory/medicines", response_model=schemas.MedicineListResponse)
+def list_inventory(status: Optional[str] = None, category: Optional[str] = None, rack: Optional[str] = None,
+                   expiring_within_days: Optional[int] = None, prescription_required: Optional[bool] = None,
+                   q: Optional[str] = None, sort: str = "name", skip: int = 0, limit: int = 50,
+                   db: Session = Depends(get_read_db), _=Depends(get_current_user)):
+    try:
+        return InventoryService.list_medicines(
+            db, status=status, category=category, rack=rack,
+            expiring_within_days=expiring_within_days, prescription_required=prescription_required,
+            q=q, sort=sort, skip=max(skip, 0), limit=max(1, min(limit, 200))
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/api/inventory/expiring", response_model=schemas.ExpiryReportResponse)
+def get_expiring_stock(days: int = 30, include_expired: bool = True,
+                       db: Session = Depends(get_db), _=Depends(get_current_user)):
+    """Live view of stock expiring within `days`, with quantity and value at risk"""
+    return InventoryService.expiring(db, days=max(0, min(days, 365)), include_expired=include_expired)
+
+@app.get("/api/inventory/expiry-report", response_model=schemas.ExpiryReportResponse)
+def get_expiry_report(days: int = 30, db: Session = Depends(get_db), _=Depends(get_current_user)):
+    """Today's expiry report, precomputed overnight by the scheduler (live if it hasn't run yet)"""
+    return InventoryService.latest_expiry_report(db, days=max(0, min(days, 365)))
+
+@app.post("/api/inventory/receipts", response_model=schemas.GoodsReceiptDetailResponse,
+          status_code=status.HTTP_201_CREATED)
+def create_goods_receipt(receipt: schemas.GoodsReceiptCreate, db: Session = Depends(get_db),
+                         _=Depends(require_roles("shopkeeper", "admin"))):
+    """Receive a distributor bill: every line is a relative stock increment, all in one transaction"""
+    db_receipt = models.GoodsReceipt(
+        supplier_name=receipt.supplier_name,
+        bill_number=receipt.bill_number,
+        bill_date=receipt.bill_date,
+        notes=receipt.notes
+    )
+    db.add(db_receipt)
+    db.flush()
+    try:
+        StockService.receive(db, db_receipt, receipt.lines)
+    except ValueError as e:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=str(e))
+    db.commit()
+    catalogue_cache.bump()
+    db.refresh(db_receipt)
+    return db_receipt
+
+@app.get("/api/inventory/receipts", response_model=List[schemas.GoodsReceiptResponse])
+def get_goods_receipts(skip: int = 0, limit: int = 50, db: Session = Depends(get_db),
+                       _=Depends(require_roles("shopkeeper", "admin"))):
+    return db.query(models.GoodsReceipt).order_by(models.GoodsReceipt.id.desc()).offset(skip).limit(limit).all()
+
+@app.get("/api/inventory/receipts/{receipt_id}", response_model=schemas.GoodsReceiptDetailResponse)
+def get_goods_receipt(receipt_id: int, db: Session = Depends(get_db),
+                      _=Depends(require_roles("shopkeeper", "admin"))):
+    receipt = db.query(models.GoodsReceipt).options(selectinload(models.GoodsReceipt.batches)).filter(
+        models.GoodsReceipt.id == receipt_id
+    ).first()
+    if not receipt:
+        raise HTTPException(status_code=404, detail="Receipt not found")
+    return receipt
+
+# ===== EXPORTS =====
+def _export_response(request: Request, stmt, columns, fmt: str, filename: str):
+    if fmt not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail="Unsupported export format: {}".format(fmt))
+    return StreamingResponse(
+        ExportService.stream(stmt, columns, fmt, session_factory=read_session_factory(request)),
+        media_type=EXPORT_FORMATS[fmt],
+        headers={"Content-Disposition": f"attachment; filename={filename}.{fmt}"}
+    )
+
+@app.get("/api/export/orders")
+def export_orders(request: Request, format: str = "csv",
+                  start_date: Optional[date] = None, end_date: Optional[date] = None,
+                  _=Depends(require_roles("shopkeeper", "admin"))):
+    return _export_response(request, ExportService.orders_query(start_date, end_date), ORDER_COLUMNS, format, "orders")
+
+@app.get("/api/export/customers")
+def export_customers(request: Request, format: str = "csv",
+                     start_date: Optional[date] = None, end_date: Optional[date] = None,
+                     _=Depends(require_roles("shopkeeper", "admin"))):
+    return _export_response(request, ExportService.customers_query(start_date, end_date), CUSTOMER_COLUMNS,
+                            format, "customers")
+
+@app.get("/api/export/medicines")
+def export_medicines(request: Request, format: str = "csv",
+                     start_date: Optional[date] = None, end_date: Optional[date] = None,
+                     _=Depends(require_roles("shopkeeper", "admin"))):
+    return _export_response(request, ExportService.medicines_query(start_date, end_date), MEDICINE_COLUMNS,
+                            format, "medicines")
 
 # ===== ADMIN ROUTES =====
+@app.get("/api/admin/cache-stats")
+def get_cache_stats(_=Depends(require_roles("admin"))):
+    return {"catalogue": catalogue_cache.stats(), "vapi_calls": call_cache.stats(), "customers": customer_ids.stats(),
+            "stock_holds": stock_holds.stats(), "order_pipeline": order_finalizer.stats(),
+            "invalidation_bus": cache_bus.stats()}
+
+@app.get("/api/admin/lanes")
+def get_lanes(_=Depends(require_roles("admin"))):
+    return lane_stats()
+
+@app.get("/api/admin/dead-letters", response_model=List[schemas.DeadLetterResponse])
+def get_dead_letters(include_resolved: bool = False, db: Session = Depends(get_db),
+                     _=Depends(require_roles("admin"))):
+    query = db.query(models.DeadLetter)
+    if not include_resolved:
+        query = query.filter(models.DeadLetter.resolved_at.is_(None))
+    return query.order_by(models.DeadLetter.id.desc()).all()
+
+@app.post("/api/admin/dead-letters/{dead_letter_id}/retry", response_model=schemas.DeadLetterResponse)
+def retry_dead_letter(dead_letter_id: int, db: Session = Depends(get_db),
+                      _=Depends(require_roles("admin"))):
+    """Run a dead-lettered order finalization again, in this request"""
+    dead_letter = db.query(models.DeadLetter).filter(models.DeadLetter.id == dead_letter_id).first()
+    if not dead_letter:
+        raise HTTPException(status_code=404, detail="Dead letter not found")
+    if dead_letter.resolved_at is None:
+        try:
+            OrderService.finalize_order(db, dead_letter.order_id)
+        except Exception as exc:
+            db.rollback()
+            dead_letter.attempts += 1
+            dead_letter.last_error = repr(exc)
+            db.commit()
+            raise HTTPException(status_code=500, detail=f"Finalization failed again: {exc}")
+        dead_letter.resolved_at = datetime.now()
+        db.commit()
+        db.refresh(dead_letter)
+    return dead_letter
+
 @app.get("/api/admin/users", response_model=List[schemas.UserAdminResponse])
 def get_all_users(db: Session = Depends(get_db),
                   _=Depends(require_roles("admin"))):
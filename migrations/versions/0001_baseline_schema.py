@@ -0,0 +1,159 @@
+"""baseline schema
+
+Revision ID: 0001
+Revises: 
+Create Date: 2026-10-19 07:10:05
+
+The tables as the app created them with create_all before migrations
+existed. Databases made that way are marked with `alembic stamp 0001`
+and then upgraded like any other.
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0001'
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('customers',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=200), nullable=False),
+    sa.Column('phone', sa.String(length=20), nullable=False),
+    sa.Column('email', sa.String(length=100), nullable=True),
+    sa.Column('address', sa.Text(), nullable=True),
+    sa.Column('is_regular', sa.Boolean(), nullable=True),
+    sa.Column('customer_id', sa.String(length=50), nullable=True),
+    sa.Column('total_orders', sa.Integer(), nullable=True),
+    sa.Column('total_amount_spent', sa.Float(), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('customer_id')
+    )
+    op.create_index('ix_customers_id', 'customers', ['id'], unique=False)
+    op.create_index('ix_customers_phone', 'customers', ['phone'], unique=True)
+    op.create_table('medicines',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=200), nullable=False),
+    sa.Column('name_hindi', sa.String(length=200), nullable=True),
+    sa.Column('generic_name', sa.String(length=200), nullable=True),
+    sa.Column('company', sa.String(length=200), nullable=True),
+    sa.Column('composition', sa.Text(), nullable=True),
+    sa.Column('price_per_unit', sa.Float(), nullable=False),
+    sa.Column('mrp', sa.Float(), nullable=False),
+    sa.Column('stock_quantity', sa.Integer(), nullable=True),
+    sa.Column('reorder_level', sa.Integer(), nullable=True),
+    sa.Column('default_packaging', sa.String(length=50), nullable=True),
+    sa.Column('units_per_package', sa.Integer(), nullable=True),
+    sa.Column('category', sa.String(length=100), nullable=True),
+    sa.Column('prescription_required', sa.Boolean(), nullable=True),
+    sa.Column('batch_number', sa.String(length=100), nullable=True),
+    sa.Column('expiry_date', sa.DateTime(), nullable=True),
+    sa.Column('rack_location', sa.String(length=50), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_medicines_id', 'medicines', ['id'], unique=False)
+    op.create_index('ix_medicines_name', 'medicines', ['name'], unique=False)
+    op.create_table('users',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=200), nullable=False),
+    sa.Column('email', sa.String(length=100), nullable=False),
+    sa.Column('phone', sa.String(length=20), nullable=True),
+    sa.Column('password_hash', sa.String(length=255), nullable=False),
+    sa.Column('is_active', sa.Boolean(), nullable=True),
+    sa.Column('role', sa.String(length=20), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_users_email', 'users', ['email'], unique=True)
+    op.create_index('ix_users_id', 'users', ['id'], unique=False)
+    op.create_table('orders',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('order_number', sa.String(length=50), nullable=False),
+    sa.Column('customer_id', sa.Integer(), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=True),
+    sa.Column('total_amount', sa.Float(), nullable=True),
+    sa.Column('discount_amount', sa.Float(), nullable=True),
+    sa.Column('tax_amount', sa.Float(), nullable=True),
+    sa.Column('final_amount', sa.Float(), nullable=True),
+    sa.Column('order_source', sa.String(length=50), nullable=True),
+    sa.Column('language_used', sa.String(length=20), nullable=True),
+    sa.Column('notes', sa.Text(), nullable=True),
+    sa.Column('prescription_image', sa.String(length=500), nullable=True),
+    sa.Column('order_date', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+    sa.Column('completed_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True),
+    sa.ForeignKeyConstraint(['customer_id'], ['customers.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_orders_id', 'orders', ['id'], unique=False)
+    op.create_index('ix_orders_order_number', 'orders', ['order_number'], unique=True)
+    op.create_table('invoices',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('invoice_number', sa.String(length=50), nullable=False),
+    sa.Column('order_id', sa.Integer(), nullable=False),
+    sa.Column('subtotal', sa.Float(), nullable=False),
+    sa.Column('discount', sa.Float(), nullable=True),
+    sa.Column('tax_rate', sa.Float(), nullable=True),
+    sa.Column('tax_amount', sa.Float(), nullable=True),
+    sa.Column('total_amount', sa.Float(), nullable=False),
+    sa.Column('payment_method', sa.String(length=50), nullable=True),
+    sa.Column('payment_status', sa.String(length=20), nullable=True),
+    sa.Column('pdf_path', sa.String(length=500), nullable=True),
+    sa.Column('sent_via_whatsapp', sa.Boolean(), nullable=True),
+    sa.Column('sent_via_email', sa.Boolean(), nullable=True),
+    sa.Column('sent_via_sms', sa.Boolean(), nullable=True),
+    sa.Column('invoice_date', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+    sa.ForeignKeyConstraint(['order_id'], ['orders.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('order_id')
+    )
+    op.create_index('ix_invoices_id', 'invoices', ['id'], unique=False)
+    op.create_index('ix_invoices_invoice_number', 'invoices', ['invoice_number'], unique=True)
+    op.create_table('order_items',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('order_id', sa.Integer(), nullable=False),
+    sa.Column('medicine_id', sa.Integer(), nullable=False),
+    sa.Column('quantity', sa.Integer(), nullable=False),
+    sa.Column('packaging_type', sa.String(length=50), nullable=True),
+    sa.Column('price_per_unit', sa.Float(), nullable=False),
+    sa.Column('total_price', sa.Float(), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+    sa.ForeignKeyConstraint(['medicine_id'], ['medicines.id'], ),
+    sa.ForeignKeyConstraint(['order_id'], ['orders.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_order_items_id', 'order_items', ['id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_order_items_id', table_name='order_items')
+    op.drop_table('order_items')
+    op.drop_index('ix_invoices_invoice_number', table_name='invoices')
+    op.drop_index('ix_invoices_id', table_name='invoices')
+    op.drop_table('invoices')
+    op.drop_index('ix_orders_order_number', table_name='orders')
+    op.drop_index('ix_orders_id', table_name='orders')
+    op.drop_table('orders')
+    op.drop_index('ix_users_id', table_name='users')
+    op.drop_index('ix_users_email', table_name='users')
+    op.drop_table('users')
+    op.drop_index('ix_medicines_name', table_name='medicines')
+    op.drop_index('ix_medicines_id', table_name='medicines')
+    op.drop_table('medicines')
+    op.drop_index('ix_customers_phone', table_name='customers')
+    op.drop_index('ix_customers_id', table_name='customers')
+    op.drop_table('customers')
@@ -0,0 +1,58 @@
+"""catalogue indexes
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-19 09:20:44
+
+Indexes behind the catalogue reads: lower(name) for exact name lookups,
+the stock gap expression for the low-stock filter, and the listing
+filters (stock, category, expiry, rack). Built CONCURRENTLY on Postgres,
+like 0006.
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0002'
+down_revision: Union[str, None] = '0001'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+INDEXES = [
+    ('ix_medicines_name_lower', [sa.text('lower(name)')]),
+    ('ix_medicines_stock_gap', [sa.text('(stock_quantity - reorder_level)')]),
+    ('ix_medicines_stock_quantity', ['stock_quantity']),
+    ('ix_medicines_category', ['category']),
+    ('ix_medicines_expiry_date', ['expiry_date']),
+    ('ix_medicines_rack_location', ['rack_location']),
+]
+
+
+def _is_postgres() -> bool:
+    return op.get_context().dialect.name == 'postgresql'
+
+
+def upgrade() -> None:
+    if _is_postgres():
+        # CREATE INDEX CONCURRENTLY can't run inside a transaction
+        with op.get_context().autocommit_block():
+            for name, columns in INDEXES:
+                op.create_index(name, 'medicines', columns, unique=False,
+                                postgresql_concurrently=True, if_not_exists=True)
+    else:
+        for name, columns in INDEXES:
+            op.create_index(name, 'medicines', columns, unique=False, if_not_exists=True)
+
+
+def downgrade() -> None:
+    if _is_postgres():
+        with op.get_context().autocommit_block():
+            for name, _ in reversed(INDEXES):
+                op.drop_index(name, table_name='medicines', postgresql_concurrently=True, if_exists=True)
+    else:
+        for name, _ in reversed(INDEXES):
+            op.drop_index(name, table_name='medicines', if_exists=True)
@@ -0,0 +1,123 @@
+"""stock batches, receipts and ledger
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-19 09:21:12
+
+Batch-level stock with FEFO allocations, goods receipts, the nightly
+expiry report, and the append-only stock ledger with its daily
+snapshots.
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0003'
+down_revision: Union[str, None] = '0002'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('goods_receipts',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('supplier_name', sa.String(length=200), nullable=False),
+    sa.Column('bill_number', sa.String(length=100), nullable=True),
+    sa.Column('bill_date', sa.DateTime(), nullable=True),
+    sa.Column('notes', sa.Text(), nullable=True),
+    sa.Column('line_count', sa.Integer(), nullable=True),
+    sa.Column('total_quantity', sa.Integer(), nullable=True),
+    sa.Column('total_cost', sa.Float(), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_goods_receipts_id', 'goods_receipts', ['id'], unique=False)
+    op.create_table('medicine_batches',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('medicine_id', sa.Integer(), nullable=False),
+    sa.Column('receipt_id', sa.Integer(), nullable=True),
+    sa.Column('batch_number', sa.String(length=100), nullable=True),
+    sa.Column('expiry_date', sa.DateTime(), nullable=True),
+    sa.Column('quantity', sa.Integer(), nullable=False),
+    sa.Column('purchase_price', sa.Float(), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True),
+    sa.ForeignKeyConstraint(['medicine_id'], ['medicines.id'], ),
+    sa.ForeignKeyConstraint(['receipt_id'], ['goods_receipts.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_medicine_batches_expiry', 'medicine_batches', ['expiry_date'], unique=False)
+    op.create_index('ix_medicine_batches_id', 'medicine_batches', ['id'], unique=False)
+    op.create_index('ix_medicine_batches_medicine_expiry', 'medicine_batches', ['medicine_id', 'expiry_date'], unique=False)
+    op.create_index('ix_medicine_batches_receipt_id', 'medicine_batches', ['receipt_id'], unique=False)
+    op.create_table('order_item_batches',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('order_item_id', sa.Integer(), nullable=False),
+    sa.Column('batch_id', sa.Integer(), nullable=False),
+    sa.Column('quantity', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['batch_id'], ['medicine_batches.id'], ),
+    sa.ForeignKeyConstraint(['order_item_id'], ['order_items.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_order_item_batches_batch_id', 'order_item_batches', ['batch_id'], unique=False)
+    op.create_index('ix_order_item_batches_id', 'order_item_batches', ['id'], unique=False)
+    op.create_index('ix_order_item_batches_order_item_id', 'order_item_batches', ['order_item_id'], unique=False)
+    op.create_table('expiry_reports',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('report_date', sa.Date(), nullable=False),
+    sa.Column('window_days', sa.Integer(), nullable=False),
+    sa.Column('payload', sa.Text(), nullable=False),
+    sa.Column('generated_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('report_date', 'window_days', name='uq_expiry_reports_date_window')
+    )
+    op.create_index('ix_expiry_reports_id', 'expiry_reports', ['id'], unique=False)
+    op.create_table('stock_movements',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('medicine_id', sa.Integer(), nullable=False),
+    sa.Column('batch_id', sa.Integer(), nullable=True),
+    sa.Column('movement_type', sa.String(length=20), nullable=False),
+    sa.Column('quantity', sa.Integer(), nullable=False),
+    sa.Column('reference', sa.String(length=100), nullable=True),
+    sa.Column('note', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+    sa.ForeignKeyConstraint(['batch_id'], ['medicine_batches.id'], ),
+    sa.ForeignKeyConstraint(['medicine_id'], ['medicines.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_stock_movements_created', 'stock_movements', ['created_at'], unique=False)
+    op.create_index('ix_stock_movements_medicine_created', 'stock_movements', ['medicine_id', 'created_at'], unique=False)
+    op.create_table('stock_snapshots',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('medicine_id', sa.Integer(), nullable=False),
+    sa.Column('snapshot_date', sa.Date(), nullable=False),
+    sa.Column('quantity', sa.Integer(), nullable=False),
+    sa.Column('taken_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+    sa.ForeignKeyConstraint(['medicine_id'], ['medicines.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('medicine_id', 'snapshot_date', name='uq_stock_snapshots_medicine_date')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('stock_snapshots')
+    op.drop_index('ix_stock_movements_medicine_created', table_name='stock_movements')
+    op.drop_index('ix_stock_movements_created', table_name='stock_movements')
+    op.drop_table('stock_movements')
+    op.drop_index('ix_expiry_reports_id', table_name='expiry_reports')
+    op.drop_table('expiry_reports')
+    op.drop_index('ix_order_item_batches_order_item_id', table_name='order_item_batches')
+    op.drop_index('ix_order_item_batches_id', table_name='order_item_batches')
+    op.drop_index('ix_order_item_batches_batch_id', table_name='order_item_batches')
+    op.drop_table('order_item_batches')
+    op.drop_index('ix_medicine_batches_receipt_id', table_name='medicine_batches')
+    op.drop_index('ix_medicine_batches_medicine_expiry', table_name='medicine_batches')
+    op.drop_index('ix_medicine_batches_id', table_name='medicine_batches')
+    op.drop_index('ix_medicine_batches_expiry', table_name='medicine_batches')
+    op.drop_table('medicine_batches')
+    op.drop_index('ix_goods_receipts_id', table_name='goods_receipts')
+    op.drop_table('goods_receipts')
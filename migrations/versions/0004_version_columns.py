@@ -0,0 +1,37 @@
+"""version_id columns for optimistic locking
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-19 09:02:17
+
+Adds the version_id counter that medicines, customers and orders use as
+their SQLAlchemy version_id_col. It is NOT NULL with a server default of
+1. The ADD COLUMN fills existing rows with that default, and the UPDATE
+after it backfills any row left NULL, so existing data can be versioned
+from the first write.
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0004'
+down_revision: Union[str, None] = '0003'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+TABLES = ('medicines', 'customers', 'orders')
+
+
+def upgrade() -> None:
+    for table in TABLES:
+        op.add_column(table, sa.Column('version_id', sa.Integer(), server_default='1', nullable=False))
+        op.execute(sa.text(f'UPDATE {table} SET version_id = 1 WHERE version_id IS NULL'))
+
+
+def downgrade() -> None:
+    for table in reversed(TABLES):
+        op.drop_column(table, 'version_id')
@@ -0,0 +1,52 @@
+"""dead letters and cache events
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-19 09:21:40
+
+dead_letters keeps fast-ack orders whose finalization kept failing;
+cache_events carries cache invalidations between workers on databases
+without LISTEN/NOTIFY.
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0005'
+down_revision: Union[str, None] = '0004'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('dead_letters',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('task', sa.String(length=50), nullable=False),
+    sa.Column('order_id', sa.Integer(), nullable=True),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('last_error', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+    sa.Column('resolved_at', sa.DateTime(timezone=True), nullable=True),
+    sa.ForeignKeyConstraint(['order_id'], ['orders.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_dead_letters_order_id', 'dead_letters', ['order_id'], unique=False)
+    op.create_table('cache_events',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('topic', sa.String(length=50), nullable=False),
+    sa.Column('origin', sa.String(length=32), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_cache_events_created_at', 'cache_events', ['created_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_cache_events_created_at', table_name='cache_events')
+    op.drop_table('cache_events')
+    op.drop_index('ix_dead_letters_order_id', table_name='dead_letters')
+    op.drop_table('dead_letters')
@@ -0,0 +1,60 @@
+"""foreign key and order date indexes
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-19 07:24:41
+
+Indexes the foreign keys the order screens join and filter on
+(orders.customer_id, order_items.order_id, order_items.medicine_id) and
+orders.order_date for the date-range reports.
+
+On Postgres the indexes are built CONCURRENTLY, outside the migration
+transaction, so a live shop keeps taking orders while they build. A
+concurrent build that fails leaves an INVALID index behind: drop it and
+run the upgrade again.
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0006'
+down_revision: Union[str, None] = '0005'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+INDEXES = [
+    ('ix_orders_customer_id', 'orders', ['customer_id']),
+    ('ix_orders_order_date', 'orders', ['order_date']),
+    ('ix_order_items_order_id', 'order_items', ['order_id']),
+    ('ix_order_items_medicine_id', 'order_items', ['medicine_id']),
+]
+
+
+def _is_postgres() -> bool:
+    return op.get_context().dialect.name == 'postgresql'
+
+
+def upgrade() -> None:
+    if _is_postgres():
+        # CREATE INDEX CONCURRENTLY can't run inside a transaction
+        with op.get_context().autocommit_block():
+            for name, table, columns in INDEXES:
+                op.create_index(name, table, columns, unique=False,
+                                postgresql_concurrently=True, if_not_exists=True)
+    else:
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns, unique=False, if_not_exists=True)
+
+
+def downgrade() -> None:
+    if _is_postgres():
+        with op.get_context().autocommit_block():
+            for name, table, _ in reversed(INDEXES):
+                op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
+    else:
+        for name, table, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table, if_exists=True)
@@ -0,0 +1,29 @@
+"""cache event keys
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-19 11:05:12
+
+Lets a cache invalidation name the entry that changed (for example one
+customer's phone) instead of the whole cache.
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0007'
+down_revision: Union[str, None] = '0006'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('cache_events', sa.Column('key', sa.String(length=100), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('cache_events', 'key')
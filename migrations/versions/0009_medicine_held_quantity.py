@@ -0,0 +1,36 @@
+"""medicine held_quantity
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-19 16:05:48
+
+Adds medicines.held_quantity, the running total of a medicine's stock
+holds. Holds, releases and the sweeper move it by the same delta in the
+same transaction as the hold rows, so available-to-promise is read by key
+instead of summing stock_holds. Existing holds are backfilled.
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0009'
+down_revision: Union[str, None] = '0008'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('medicines', sa.Column('held_quantity', sa.Integer(), server_default='0', nullable=False))
+    op.execute(sa.text(
+        'UPDATE medicines SET held_quantity = ('
+        'SELECT COALESCE(SUM(stock_holds.quantity), 0) FROM stock_holds '
+        'WHERE stock_holds.medicine_id = medicines.id)'
+    ))
+
+
+def downgrade() -> None:
+    op.drop_column('medicines', 'held_quantity')
@@ -0,0 +1,53 @@
+"""normalize customer phones
+
+Revision ID: 0010
+Revises: 0009
+Create Date: 2026-10-19 16:48:20
+
+Customers are now stored and looked up by normalized phone
+(app.phones.normalize_phone). This rewrites existing phones to that form so
+the next order from a customer saved as "98765 43210" finds them instead of
+creating a second customer. A phone whose normalized form already belongs to
+another customer is left as it is, since merging customers (and their
+orders) is a manual decision.
+
+"""
+from typing import Sequence, Union
+import re
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0010'
+down_revision: Union[str, None] = '0009'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _normalize(raw) -> str:
+    # Frozen copy of app.phones.normalize_phone as of this revision
+    digits = re.sub(r'\D', '', str(raw or "")).lstrip("0")
+    if len(digits) > 10:
+        return "+" + digits
+    return "+91" + digits.zfill(10)
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    rows = bind.execute(sa.text('SELECT id, phone FROM customers ORDER BY id')).all()
+    taken = {phone for _, phone in rows}
+    for customer_id, phone in rows:
+        normalized = _normalize(phone)
+        if normalized == phone or normalized in taken:
+            continue
+        bind.execute(sa.text('UPDATE customers SET phone = :phone WHERE id = :id'),
+                     {"phone": normalized, "id": customer_id})
+        taken.discard(phone)
+        taken.add(normalized)
+
+
+def downgrade() -> None:
+    # The original spellings are not kept; normalized phones stay valid for older code
+    pass
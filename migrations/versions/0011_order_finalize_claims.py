@@ -0,0 +1,31 @@
+"""order finalize claims
+
+Revision ID: 0011
+Revises: 0010
+Create Date: 2026-10-19 17:20:03
+
+Adds orders.finalize_claimed_at. A worker claims a fast-ack order before
+it finalizes it (on creation, or in startup recovery with a conditional
+UPDATE), so several workers recovering at once don't each finalize the
+same order.
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0011'
+down_revision: Union[str, None] = '0010'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('orders', sa.Column('finalize_claimed_at', sa.DateTime(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('orders', 'finalize_claimed_at')
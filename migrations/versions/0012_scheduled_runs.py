@@ -0,0 +1,41 @@
+"""scheduled runs
+
+Revision ID: 0012
+Revises: 0011
+Create Date: 2026-10-19 17:52:31
+
+Every worker runs the daily scheduler. Before a job runs, the worker
+inserts (job, scheduled_for) here with ON CONFLICT DO NOTHING, and only
+the worker whose insert lands runs the job, so it runs once per day
+however many workers there are.
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0012'
+down_revision: Union[str, None] = '0011'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('scheduled_runs',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('job', sa.String(length=50), nullable=False),
+    sa.Column('scheduled_for', sa.DateTime(), nullable=False),
+    sa.Column('worker', sa.String(length=64), nullable=False),
+    sa.Column('claimed_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+    sa.Column('finished_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('failed', sa.Boolean(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('job', 'scheduled_for', name='uq_scheduled_runs_job_time')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('scheduled_runs')
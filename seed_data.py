@@ -13,8 +13,9 @@ Sample data seeder for Medical Shop
 Run this to populate your database with sample medicines
 """
 from sqlalchemy.orm import Session
-from app.database import SessionLocal, engine
+from app.database import SessionLocal
 from app import models
+from app.schema_version import upgrade_to_head
 from datetime import datetime, timedelta
 
 def create_sample_medicines(db: Session):
@@ -319,9 +320,9 @@ def main():
     """Run the seeder"""
     print("Seeding database with sample data...")
     
-    # Create tables
-    models.Base.metadata.create_all(bind=engine)
-    print("Tables created")
+    # Bring the schema up to date (alembic upgrade head)
+    upgrade_to_head()
+    print("Database schema up to date")
     
     # Get database session
     db = SessionLocal()
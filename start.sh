@@ -8,8 +8,8 @@ echo ""
 echo "[1/4] Activating virtual environment..."
 source venv/bin/activate
 
-echo "[2/4] Checking database..."
-python -c "from app.database import engine; from app import models; models.Base.metadata.create_all(bind=engine); print('Database tables created/verified')"
+echo "[2/4] Applying database migrations..."
+alembic upgrade head || exit 1
 
 echo "[3/4] Starting server..."
 echo ""
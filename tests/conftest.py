@@ -0,0 +1,62 @@
+"""
+Test settings. The app reads its configuration from the environment at
+import time, so the databases are chosen here, before anything imports
+app: two throwaway SQLite files, one as the primary and one as the read
+replica.
+"""
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+_db_dir = tempfile.mkdtemp(prefix="medical_shop_tests_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_db_dir, 'primary.db')}"
+os.environ["REPLICA_DATABASE_URL"] = f"sqlite:///{os.path.join(_db_dir, 'replica.db')}"
+# Check the replica on every read, so a test's lag change applies immediately
+os.environ["REPLICA_LAG_CHECK_INTERVAL"] = "0"
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+import pytest  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def api():
+    """TestClient signed in as an admin, on a primary with every table created"""
+    from fastapi.testclient import TestClient
+
+    import main
+    from app import database, models
+    from app.auth import create_access_token
+
+    models.Base.metadata.create_all(database.engine)
+    db = database.SessionLocal()
+    admin = models.User(name="api admin", email="api-admin@example.com", password_hash="x", role="admin")
+    db.add(admin)
+    db.commit()
+    admin_id = admin.id
+    db.close()
+
+    client = TestClient(main.app)
+    client.headers["Authorization"] = "Bearer " + create_access_token({"sub": str(admin_id)})
+    return client
+
+
+@pytest.fixture
+def add_medicine(api):
+    """Create a medicine through the API (opening stock becomes unbatched stock); returns its id"""
+    def add(name, stock_quantity=0, **fields):
+        response = api.post("/api/medicines", json=dict(
+            {"name": name, "price_per_unit": 10, "mrp": 12, "stock_quantity": stock_quantity,
+             "reorder_level": 0}, **fields))
+        assert response.status_code == 201, response.text
+        return response.json()["id"]
+    return add
+
+
+@pytest.fixture
+def in_tmp_dir(tmp_path, monkeypatch):
+    """Orders write invoice PDFs under ./invoices; keep them out of the checkout"""
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
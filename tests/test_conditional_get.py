@@ -0,0 +1,70 @@
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+import main
+from app import database, models
+from app.auth import create_access_token
+
+
+@pytest.fixture(scope="module")
+def client():
+    models.Base.metadata.create_all(database.engine)
+    db = database.SessionLocal()
+    user = models.User(name="etag", email="etag@example.com", password_hash="x", role="admin")
+    db.add(user)
+    db.add(models.Medicine(name="Etag Tablet", price_per_unit=1, mrp=1, stock_quantity=100))
+    db.commit()
+    user_id = user.id
+    db.close()
+
+    test_client = TestClient(main.app)
+    test_client.headers["Authorization"] = "Bearer " + create_access_token({"sub": str(user_id)})
+    yield test_client, user_id
+
+
+@pytest.fixture
+def statements():
+    seen = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        seen.append(statement)
+
+    event.listen(database.engine, "before_cursor_execute", record)
+    yield seen
+    event.remove(database.engine, "before_cursor_execute", record)
+
+
+@pytest.mark.parametrize("path", ["/api/medicines", "/api/medicines/typeahead?q=eta"])
+def test_a_304_does_not_query_the_database(client, statements, path):
+    test_client, _ = client
+    etag = test_client.get(path).headers["ETag"]
+    statements.clear()
+
+    response = test_client.get(path, headers={"If-None-Match": etag})
+
+    assert response.status_code == 304
+    assert statements == []
+
+
+def test_a_body_still_needs_an_active_user(client):
+    test_client, user_id = client
+    etag = test_client.get("/api/medicines").headers["ETag"]
+    db = database.SessionLocal()
+    db.get(models.User, user_id).is_active = False
+    db.commit()
+    try:
+        assert test_client.get("/api/medicines").status_code == 401
+        # Nothing new is revealed by confirming the client's copy is current
+        assert test_client.get("/api/medicines", headers={"If-None-Match": etag}).status_code == 304
+    finally:
+        db.get(models.User, user_id).is_active = True
+        db.commit()
+        db.close()
+
+
+def test_a_bad_token_is_refused_even_for_a_conditional_get(client):
+    test_client, _ = client
+    etag = test_client.get("/api/medicines").headers["ETag"]
+    response = test_client.get("/api/medicines", headers={"If-None-Match": etag, "Authorization": "Bearer nope"})
+    assert response.status_code == 401
@@ -0,0 +1,73 @@
+import pytest
+
+from app import database, models
+from app.cache import customer_ids
+from app.phones import normalize_phone
+from app.services.order_service import OrderService
+
+
+@pytest.fixture
+def db():
+    models.Base.metadata.create_all(database.engine)
+    customer_ids.discard(None)
+    session = database.SessionLocal()
+    yield session
+    session.close()
+
+
+def customers_with(db, phone):
+    return db.query(models.Customer).filter(models.Customer.phone == phone).all()
+
+
+@pytest.mark.parametrize("raw", ["+91 98765 43210", "9876543210", "098765-43210", "0091 9876543210"])
+def test_phone_spellings_normalize_to_one_number(raw):
+    assert normalize_phone(raw) == "+919876543210"
+    assert customer_ids.key(raw) == "+919876543210"
+
+
+def test_the_same_phone_spelled_differently_is_one_customer(db):
+    first = OrderService.upsert_customer(db, "Asha", "+91 98765 43211")
+    db.commit()
+    customer_ids.discard(None)
+    second = OrderService.upsert_customer(db, "Asha", "098765-43211")
+    db.commit()
+
+    assert first == second
+    assert len(customers_with(db, "+919876543211")) == 1
+
+
+def test_a_repeat_customer_gets_the_new_details_and_a_version_bump(db):
+    customer_id = OrderService.upsert_customer(db, "Ravi", "9876543212", "Old Street")
+    db.commit()
+    version = db.get(models.Customer, customer_id).version_id
+
+    assert OrderService.upsert_customer(db, "Ravi", "9876543212", "New Street") == customer_id
+    db.commit()
+    db.expire_all()
+    customer = db.get(models.Customer, customer_id)
+    assert customer.address == "New Street"
+    assert customer.version_id == version + 1
+
+
+def test_missing_details_leave_the_stored_ones_alone(db):
+    customer_id = OrderService.upsert_customer(db, "Meena", "9876543213", "Lake Road")
+    db.commit()
+    customer_ids.discard(None)
+    version = db.get(models.Customer, customer_id).version_id
+
+    assert OrderService.upsert_customer(db, "", "+919876543213", None) == customer_id
+    db.commit()
+    db.expire_all()
+    customer = db.get(models.Customer, customer_id)
+    assert (customer.name, customer.address) == ("Meena", "Lake Road")
+    assert customer.version_id == version
+
+
+def test_a_cached_customer_with_unchanged_details_skips_the_database(db):
+    customer_id = OrderService.upsert_customer(db, "Kiran", "9876543214")
+    db.commit()
+    customer_ids.put("9876543214", customer_id, "Kiran", None)
+    hits = customer_ids.hits
+
+    assert OrderService.upsert_customer(db, "Kiran", "+91 98765 43214") == customer_id
+    assert customer_ids.hits == hits + 1
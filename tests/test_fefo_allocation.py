@@ -0,0 +1,93 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import database, models
+
+
+def add_batch(api, medicine_id, quantity, days_to_expiry=None, number=None):
+    expiry = (datetime.now() + timedelta(days=days_to_expiry)).isoformat() if days_to_expiry is not None else None
+    response = api.post(f"/api/medicines/{medicine_id}/batches",
+                        json={"quantity": quantity, "expiry_date": expiry, "batch_number": number})
+    assert response.status_code == 201, response.text
+    return response.json()["id"]
+
+
+def place_order(api, medicine_id, quantity, phone="9800000034"):
+    return api.post("/api/orders", json={
+        "customer_name": "FEFO", "customer_phone": phone,
+        "items": [{"medicine_id": medicine_id, "quantity": quantity, "packaging_type": "strip"}]})
+
+
+def batch_quantities(api, medicine_id):
+    response = api.get(f"/api/medicines/{medicine_id}/batches", params={"include_empty": True})
+    return {batch["id"]: batch["quantity"] for batch in response.json()}
+
+
+@pytest.fixture
+def stocked(api, add_medicine, in_tmp_dir):
+    """2 unbatched units, plus batches: 5 expired, 3 expiring soon, 10 later, 4 undated"""
+    medicine_id = add_medicine("FEFO Tablet", stock_quantity=2)
+    batches = {
+        "expired": add_batch(api, medicine_id, 5, days_to_expiry=-1),
+        "soon": add_batch(api, medicine_id, 3, days_to_expiry=30),
+        "later": add_batch(api, medicine_id, 10, days_to_expiry=300),
+        "undated": add_batch(api, medicine_id, 4),
+    }
+    return medicine_id, batches
+
+
+def test_an_order_draws_the_earliest_expiry_first_and_skips_expired_batches(api, stocked):
+    medicine_id, batches = stocked
+
+    response = place_order(api, medicine_id, 5)
+
+    assert response.status_code == 201, response.text
+    assert batch_quantities(api, medicine_id) == {
+        batches["expired"]: 5, batches["soon"]: 0, batches["later"]: 8, batches["undated"]: 4}
+    assert api.get(f"/api/medicines/{medicine_id}").json()["stock_quantity"] == 24 - 5
+    with database.SessionLocal() as db:
+        allocations = dict(
+            db.query(models.OrderItemBatch.batch_id, models.OrderItemBatch.quantity)
+            .join(models.OrderItem).filter(models.OrderItem.order_id == response.json()["id"]).all())
+    assert allocations == {batches["soon"]: 3, batches["later"]: 2}
+
+
+def test_undated_batches_then_unbatched_stock_are_used_last(api, stocked):
+    medicine_id, batches = stocked
+
+    assert place_order(api, medicine_id, 19).status_code == 201
+
+    assert batch_quantities(api, medicine_id) == {
+        batches["expired"]: 5, batches["soon"]: 0, batches["later"]: 0, batches["undated"]: 0}
+    # The 2 unbatched units covered the rest; only the expired batch is left
+    assert api.get(f"/api/medicines/{medicine_id}").json()["stock_quantity"] == 5
+
+
+def test_expired_units_are_not_for_sale(api, stocked):
+    medicine_id, _ = stocked
+
+    # 24 on the shelf, but 5 of them are expired
+    response = place_order(api, medicine_id, 20)
+
+    assert response.status_code == 400
+    assert "Insufficient stock" in response.json()["detail"]
+    assert api.get(f"/api/medicines/{medicine_id}").json()["stock_quantity"] == 24
+
+
+def test_several_lines_for_one_medicine_share_the_batches(api, stocked):
+    medicine_id, batches = stocked
+
+    response = api.post("/api/orders", json={
+        "customer_name": "FEFO", "customer_phone": "9800000034",
+        "items": [{"medicine_id": medicine_id, "quantity": 2, "packaging_type": "strip"},
+                  {"medicine_id": medicine_id, "quantity": 2, "packaging_type": "box"}]})
+
+    assert response.status_code == 201, response.text
+    with database.SessionLocal() as db:
+        per_item = (
+            db.query(models.OrderItem.packaging_type, models.OrderItemBatch.batch_id, models.OrderItemBatch.quantity)
+            .join(models.OrderItemBatch).filter(models.OrderItem.order_id == response.json()["id"])
+            .order_by(models.OrderItem.id, models.OrderItemBatch.batch_id).all())
+    assert [tuple(row) for row in per_item] == [
+        ("strip", batches["soon"], 2), ("box", batches["soon"], 1), ("box", batches["later"], 1)]
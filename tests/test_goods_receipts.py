@@ -0,0 +1,60 @@
+from app import database, models
+
+
+def receive(api, lines, **fields):
+    return api.post("/api/inventory/receipts", json=dict({"supplier_name": "Test Distributor", "lines": lines}, **fields))
+
+
+def test_each_batched_line_is_paired_with_its_own_batch(api, add_medicine):
+    first = add_medicine("Receipt Tablet A", stock_quantity=1)
+    second = add_medicine("Receipt Tablet B")
+    lines = [
+        {"medicine_id": second, "quantity": 7, "batch_number": "B-7", "purchase_price": 2.0},
+        {"medicine_id": first, "quantity": 3},  # no batch number or expiry: unbatched stock
+        {"medicine_id": first, "quantity": 5, "batch_number": "A-5", "expiry_date": "2030-01-31T00:00:00"},
+        {"medicine_id": second, "quantity": 2, "batch_number": "B-2", "purchase_price": 2.5},
+    ]
+
+    response = receive(api, lines, bill_number="BILL-37")
+
+    assert response.status_code == 201, response.text
+    receipt = response.json()
+    assert (receipt["line_count"], receipt["total_quantity"], receipt["total_cost"]) == (4, 17, 19.0)
+    assert sorted((b["medicine_id"], b["batch_number"], b["quantity"]) for b in receipt["batches"]) == sorted([
+        (second, "B-7", 7), (first, "A-5", 5), (second, "B-2", 2)])
+
+    # Every restock row in the ledger names the batch its line created
+    batch_ids = {batch["batch_number"]: batch["id"] for batch in receipt["batches"]}
+    with database.SessionLocal() as db:
+        restocks = [
+            (movement.medicine_id, movement.quantity, movement.batch_id)
+            for movement in db.query(models.StockMovement)
+            .filter(models.StockMovement.reference == f"receipt:{receipt['id']}").order_by(models.StockMovement.id)
+        ]
+    assert restocks == [
+        (second, 7, batch_ids["B-7"]), (first, 3, None), (first, 5, batch_ids["A-5"]), (second, 2, batch_ids["B-2"])]
+
+    assert api.get(f"/api/medicines/{first}").json()["stock_quantity"] == 1 + 3 + 5
+    assert api.get(f"/api/medicines/{second}").json()["stock_quantity"] == 7 + 2
+
+
+def test_a_receipt_with_an_unknown_medicine_changes_nothing(api, add_medicine):
+    medicine_id = add_medicine("Receipt Syrup", stock_quantity=4)
+    receipts_before = len(api.get("/api/inventory/receipts", params={"limit": 1000}).json())
+
+    response = receive(api, [
+        {"medicine_id": medicine_id, "quantity": 6, "batch_number": "S-6"},
+        {"medicine_id": 999999, "quantity": 1},
+    ])
+
+    assert response.status_code == 400
+    assert "999999" in response.json()["detail"]
+    assert api.get(f"/api/medicines/{medicine_id}").json()["stock_quantity"] == 4
+    assert api.get(f"/api/medicines/{medicine_id}/batches").json() == []
+    assert len(api.get("/api/inventory/receipts", params={"limit": 1000}).json()) == receipts_before
+
+
+def test_quantities_must_be_positive(api, add_medicine):
+    medicine_id = add_medicine("Receipt Cream")
+    assert receive(api, [{"medicine_id": medicine_id, "quantity": 0}]).status_code == 422
+    assert receive(api, []).status_code == 422
@@ -0,0 +1,106 @@
+import pytest
+
+from app import database, models
+
+
+@pytest.fixture
+def order(api, add_medicine, in_tmp_dir):
+    """A confirmed order for 4 of a medicine with 6 units in one batch and 10 unbatched"""
+    medicine_id = add_medicine("Lifecycle Capsule", stock_quantity=10)
+    batch = api.post(f"/api/medicines/{medicine_id}/batches", json={"quantity": 6, "batch_number": "LC-1"}).json()
+    response = api.post("/api/orders", json={
+        "customer_name": "Lifecycle", "customer_phone": "9800000039",
+        "items": [{"medicine_id": medicine_id, "quantity": 4, "packaging_type": "strip"}]})
+    assert response.status_code == 201, response.text
+    return response.json(), medicine_id, batch["id"]
+
+
+def set_status(api, order_id, status, **headers):
+    return api.put(f"/api/orders/{order_id}/status", json={"status": status}, headers=headers)
+
+
+def customer_totals(api):
+    customer = api.get("/api/customers/phone/9800000039").json()
+    return customer["total_orders"], customer["total_amount_spent"]
+
+
+def test_an_order_moves_forward_and_not_back(api, order):
+    created, _, _ = order
+    assert created["status"] == "confirmed"
+
+    completed = set_status(api, created["id"], "completed")
+    assert completed.status_code == 200
+    assert completed.json()["completed_at"] is not None
+
+    for status in ("pending", "confirmed", "cancelled"):
+        response = set_status(api, created["id"], status)
+        assert response.status_code == 400, status
+    assert api.get(f"/api/orders/{created['id']}").json()["status"] == "completed"
+
+
+def test_cancelling_puts_the_stock_back_where_it_came_from(api, order):
+    created, medicine_id, batch_id = order
+    orders_before, spent_before = customer_totals(api)
+
+    response = set_status(api, created["id"], "cancelled")
+
+    assert response.status_code == 200, response.text
+    assert api.get(f"/api/medicines/{medicine_id}").json()["stock_quantity"] == 16
+    batches = api.get(f"/api/medicines/{medicine_id}/batches").json()
+    assert [(batch["id"], batch["quantity"]) for batch in batches] == [(batch_id, 6)]
+    with database.SessionLocal() as db:
+        returns = [
+            (movement.batch_id, movement.quantity)
+            for movement in db.query(models.StockMovement).filter(
+                models.StockMovement.reference == f"order:{created['id']}",
+                models.StockMovement.movement_type == "return")
+        ]
+    assert returns == [(batch_id, 4)]
+    orders_after, spent_after = customer_totals(api)
+    assert orders_after == orders_before - 1
+    assert spent_after == pytest.approx(spent_before - created["final_amount"])
+
+    # Cancelling twice must not return the stock twice
+    assert set_status(api, created["id"], "cancelled").status_code == 400
+    assert api.get(f"/api/medicines/{medicine_id}").json()["stock_quantity"] == 16
+
+
+def test_a_stale_if_match_on_an_order_is_a_409(api, order):
+    created, _, _ = order
+    etag = api.get(f"/api/orders/{created['id']}").headers["ETag"]
+    assert set_status(api, created["id"], "completed", **{"If-Match": etag}).status_code == 200
+
+    response = set_status(api, created["id"], "cancelled", **{"If-Match": etag})
+
+    assert response.status_code == 409
+    assert api.get(f"/api/orders/{created['id']}").json()["status"] == "completed"
+
+
+def test_a_sale_in_between_makes_a_medicine_edit_a_409(api, order):
+    _, medicine_id, _ = order
+    etag = api.get(f"/api/medicines/{medicine_id}").headers["ETag"]
+    api.post("/api/orders", json={
+        "customer_name": "Lifecycle", "customer_phone": "9800000039",
+        "items": [{"medicine_id": medicine_id, "quantity": 1, "packaging_type": "strip"}]})
+
+    stale = api.put(f"/api/medicines/{medicine_id}", json={"stock_quantity": 50}, headers={"If-Match": etag})
+    assert stale.status_code == 409
+    assert api.get(f"/api/medicines/{medicine_id}").json()["stock_quantity"] == 11
+
+    etag = api.get(f"/api/medicines/{medicine_id}").headers["ETag"]
+    fresh = api.put(f"/api/medicines/{medicine_id}", json={"stock_quantity": 50}, headers={"If-Match": etag})
+    assert fresh.status_code == 200
+    assert fresh.headers["ETag"] != etag
+
+
+def test_bulk_status_reports_the_orders_it_skipped(api, order):
+    created, _, _ = order
+    set_status(api, created["id"], "completed")
+    second = api.post("/api/orders", json={
+        "customer_name": "Lifecycle", "customer_phone": "9800000039",
+        "items": [{"medicine_id": order[1], "quantity": 1, "packaging_type": "strip"}]}).json()
+
+    response = api.put("/api/orders/bulk-status", json={"status": "cancelled", "order_ids": [created["id"], second["id"]]})
+
+    assert response.status_code == 200
+    assert response.json() == {"status": "cancelled", "updated": [second["id"]], "skipped": [created["id"]]}
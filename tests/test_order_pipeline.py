@@ -0,0 +1,49 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import database, models
+from app.order_pipeline import OrderFinalizer
+
+
+@pytest.fixture
+def unfinalized_order():
+    models.Base.metadata.create_all(database.engine)
+    db = database.SessionLocal()
+    customer = models.Customer(name="Recover", phone="+919000000001")
+    db.add(customer)
+    db.flush()
+    order = models.Order(order_number=f"ORD-RECOVER-{datetime.now().timestamp()}", customer_id=customer.id,
+                         status="confirmed", final_amount=10)
+    db.add(order)
+    db.commit()
+    yield order.id
+    db.query(models.Order).filter(models.Order.id == order.id).delete()
+    db.query(models.Customer).filter(models.Customer.id == customer.id).delete()
+    db.commit()
+    db.close()
+
+
+def queued(finalizer):
+    return [order_id for _, _, order_id, _ in finalizer._queue]
+
+
+def test_of_several_workers_recovering_only_one_takes_an_order(unfinalized_order):
+    workers = [OrderFinalizer(max_attempts=1, retry_delay=0) for _ in range(3)]
+    for worker in workers:
+        worker.recover()
+
+    assert sum(queued(worker).count(unfinalized_order) for worker in workers) == 1
+
+
+def test_a_stale_claim_is_recovered(unfinalized_order):
+    with database.SessionLocal() as db:
+        db.get(models.Order, unfinalized_order).finalize_claimed_at = datetime.now() - timedelta(hours=1)
+        db.commit()
+
+    fresh, stale = OrderFinalizer(1, 0, claim_ttl=7200), OrderFinalizer(1, 0, claim_ttl=600)
+    fresh.recover()
+    stale.recover()
+
+    assert unfinalized_order not in queued(fresh)
+    assert unfinalized_order in queued(stale)
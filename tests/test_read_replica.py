@@ -0,0 +1,146 @@
+import threading
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from app import database, metrics, models
+from app.auth import create_access_token, get_password_hash
+
+LOW_STOCK = "/api/dashboard/low-stock"
+
+
+@pytest.fixture(scope="module")
+def client():
+    for bind in (database.engine, database.replica_engine):
+        models.Base.metadata.create_all(bind)
+
+    # Same user on both sides; the primary and the replica differ only in
+    # which medicine they hold, so each response shows where it was read
+    def seed(session_factory, medicine_name, user_id=None):
+        db = session_factory()
+        user = models.User(id=user_id, name="admin", email="replica-admin@example.com",
+                           password_hash=get_password_hash("pw"), role="admin")
+        db.add(user)
+        db.add(models.Medicine(name=medicine_name, price_per_unit=1, mrp=1, stock_quantity=0))
+        db.commit()
+        user_id = user.id
+        db.close()
+        return user_id
+
+    user_id = seed(database.SessionLocal, "Primary Only")
+    seed(database.ReplicaSessionLocal, "Replica Only", user_id)
+
+    test_client = TestClient(main.app)
+    test_client.headers["Authorization"] = "Bearer " + create_access_token({"sub": str(user_id)})
+    return test_client
+
+
+@pytest.fixture(autouse=True)
+def no_cookies(client):
+    client.cookies.clear()
+
+
+def read_names(client):
+    response = client.get(LOW_STOCK)
+    assert response.status_code == 200
+    # Other test modules add medicines to the same primary; only ours tell the databases apart
+    return {medicine["name"] for medicine in response.json()} & {"Primary Only", "Replica Only", "Just Added"}
+
+
+def test_reads_go_to_the_replica_when_it_is_healthy(client):
+    before = database.replica_guard.stats()["replica_reads"]
+
+    assert read_names(client) == {"Replica Only"}
+    assert database.replica_guard.stats()["replica_reads"] == before + 1
+    assert database.replica_guard.stats()["healthy"] is True
+
+
+def test_a_write_sets_last_write_and_keeps_the_client_on_the_primary(client):
+    response = client.post("/api/medicines", json={
+        "name": "Just Added", "price_per_unit": 1, "mrp": 1, "stock_quantity": 0})
+    assert response.status_code == 201
+    assert database.LAST_WRITE_COOKIE in response.cookies
+
+    before = database.replica_guard.stats()["primary_reads"]
+    assert read_names(client) == {"Primary Only", "Just Added"}
+    assert database.replica_guard.stats()["primary_reads"] == before + 1
+
+
+def test_the_inventory_list_is_read_from_the_replica(client):
+    response = client.get("/api/inventory/medicines")
+
+    assert response.status_code == 200
+    assert [item["name"] for item in response.json()["items"]] == ["Replica Only"]
+
+
+def test_replica_statements_are_counted(client):
+    before = metrics.db_statements_total.value()
+    with database.replica_engine.connect() as conn:
+        conn.exec_driver_sql("SELECT 1")
+    assert metrics.db_statements_total.value() == before + 1
+
+
+def test_reads_do_not_set_last_write(client):
+    response = client.get(LOW_STOCK)
+    assert database.LAST_WRITE_COOKIE not in response.cookies
+
+
+def test_an_old_last_write_no_longer_pins_the_client(client):
+    stale = time.time() - database.READ_YOUR_WRITES_SECONDS - 1
+    client.cookies.set(database.LAST_WRITE_COOKIE, str(stale))
+    assert read_names(client) == {"Replica Only"}
+
+    client.cookies.set(database.LAST_WRITE_COOKIE, "not-a-time")
+    assert read_names(client) == {"Replica Only"}
+
+
+def test_a_lagging_replica_falls_back_to_the_primary(client, monkeypatch):
+    guard = database.replica_guard
+    monkeypatch.setattr(guard, "_measure", lambda: guard.max_lag + 1)
+
+    assert "Primary Only" in read_names(client)
+    assert guard.stats()["healthy"] is False
+    assert guard.stats()["lag_seconds"] == guard.max_lag + 1
+
+    monkeypatch.setattr(guard, "_measure", lambda: guard.max_lag)
+    assert read_names(client) == {"Replica Only"}
+
+
+def test_an_unreachable_replica_falls_back_to_the_primary(client, monkeypatch):
+    guard = database.replica_guard
+
+    def unreachable():
+        raise ConnectionError("replica down")
+
+    monkeypatch.setattr(guard, "_measure", unreachable)
+    assert "Primary Only" in read_names(client)
+    assert guard.stats()["healthy"] is False
+    assert guard.stats()["lag_seconds"] is None
+
+
+def test_lag_is_checked_at_most_once_per_interval(monkeypatch):
+    guard = database.ReplicaLagGuard(database.replica_engine, max_lag=5, interval=60)
+    calls = []
+    monkeypatch.setattr(guard, "_measure", lambda: calls.append(1) or 0.0)
+
+    assert all(guard.healthy() for _ in range(10))
+    assert len(calls) == 1
+
+
+def test_read_counters_do_not_lose_updates_across_threads():
+    guard = database.ReplicaLagGuard(database.replica_engine, max_lag=5, interval=60)
+
+    def count():
+        for i in range(2000):
+            guard.count_read(on_replica=i % 2 == 0)
+
+    threads = [threading.Thread(target=count) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    stats = guard.stats()
+    assert stats["replica_reads"] == stats["primary_reads"] == 8 * 1000
@@ -0,0 +1,46 @@
+from datetime import datetime
+
+from app import database, models
+from app.scheduler import DailyScheduler
+
+
+def test_a_scheduled_run_happens_in_one_worker_only():
+    models.Base.metadata.create_all(database.engine)
+    ran = []
+    workers = [DailyScheduler() for _ in range(3)]
+    for index, worker in enumerate(workers):
+        worker.worker = f"worker-{index}"
+    scheduled_for = datetime(2026, 1, 1, 2, 0)
+
+    for worker in workers:
+        worker.run_job("test_job", lambda db, worker=worker: ran.append(worker.worker), scheduled_for)
+
+    assert ran == ["worker-0"]
+    with database.SessionLocal() as db:
+        run = db.query(models.ScheduledRun).filter_by(job="test_job").one()
+        assert (run.worker, run.failed) == ("worker-0", False)
+        assert run.finished_at is not None
+
+
+def test_a_failed_run_is_recorded_and_the_next_day_runs_again():
+    worker = DailyScheduler()
+
+    def fail(db):
+        raise RuntimeError("boom")
+
+    worker.run_job("failing_job", fail, datetime(2026, 1, 1, 2, 0))
+    ran = []
+    worker.run_job("failing_job", ran.append, datetime(2026, 1, 2, 2, 0))
+
+    assert len(ran) == 1
+    with database.SessionLocal() as db:
+        failed = [run.failed for run in db.query(models.ScheduledRun).filter_by(job="failing_job")
+                  .order_by(models.ScheduledRun.scheduled_for)]
+        assert failed == [True, False]
+
+
+def test_running_a_job_by_hand_needs_no_claim():
+    ran = []
+    DailyScheduler().run_job("manual_job", ran.append)
+    DailyScheduler().run_job("manual_job", ran.append)
+    assert len(ran) == 2
@@ -0,0 +1,114 @@
+import time
+
+import pytest
+from sqlalchemy import func, select
+
+from app import database, models
+from app.stock_holds import StockHoldBook
+
+
+@pytest.fixture(scope="module")
+def medicine_id():
+    models.Base.metadata.create_all(database.engine)
+    db = database.SessionLocal()
+    medicine = models.Medicine(name="Held Syrup", price_per_unit=1, mrp=1, stock_quantity=10)
+    db.add(medicine)
+    db.commit()
+    medicine_id = medicine.id
+    db.close()
+    return medicine_id
+
+
+@pytest.fixture
+def workers(medicine_id):
+    # Two books on one database, as two worker processes would have
+    books = StockHoldBook(ttl=60, sweep_interval=60), StockHoldBook(ttl=60, sweep_interval=60)
+    yield books
+    with database.engine.begin() as conn:
+        for call_id in ("A", "B"):
+            books[0].release(conn, call_id)
+
+
+def held_quantity(conn, medicine_id):
+    held = conn.execute(
+        select(models.Medicine.held_quantity).where(models.Medicine.id == medicine_id)).scalar()
+    # The running total always matches the hold rows
+    assert held == conn.execute(
+        select(func.coalesce(func.sum(models.StockHold.quantity), 0))
+        .where(models.StockHold.medicine_id == medicine_id)).scalar()
+    return held
+
+
+def test_a_hold_made_in_one_worker_is_seen_by_another(workers, medicine_id):
+    first, second = workers
+    with database.engine.begin() as conn:
+        first.hold(conn, "A", medicine_id, 7)
+
+    with database.engine.connect() as conn:
+        assert held_quantity(conn, medicine_id) == 7
+        assert second.available(conn, medicine_id, 10, call_id="B") == 3
+        assert second.available(conn, medicine_id, 10) == 3
+        # The call's own hold is still its to use
+        assert second.available(conn, medicine_id, 10, call_id="A") == 10
+
+
+def test_asking_again_replaces_the_hold(workers, medicine_id):
+    first, second = workers
+    with database.engine.begin() as conn:
+        first.hold(conn, "A", medicine_id, 7)
+    with database.engine.begin() as conn:
+        second.hold(conn, "A", medicine_id, 2)
+
+    with database.engine.connect() as conn:
+        assert held_quantity(conn, medicine_id) == 2
+        assert first.held_by_others(conn, medicine_id, "B") == 2
+
+
+def test_reserve_holds_only_what_is_available(workers, medicine_id):
+    first, second = workers
+    with database.engine.begin() as conn:
+        assert first.reserve(conn, "A", {medicine_id: 7}) == {medicine_id: 10}
+    with database.engine.begin() as conn:
+        assert second.reserve(conn, "B", {medicine_id: 5}) == {medicine_id: 3}
+
+    with database.engine.connect() as conn:
+        assert held_quantity(conn, medicine_id) == 10
+        assert first.available(conn, medicine_id, 10, call_id="A") == 7
+
+
+def test_a_rolled_back_hold_leaves_no_trace(workers, medicine_id):
+    first, _ = workers
+    with database.engine.connect() as conn:
+        with conn.begin() as transaction:
+            first.hold(conn, "A", medicine_id, 7)
+            transaction.rollback()
+        assert held_quantity(conn, medicine_id) == 0
+
+
+def test_release_in_another_worker_frees_the_units(workers, medicine_id):
+    first, second = workers
+    with database.engine.begin() as conn:
+        first.hold(conn, "A", medicine_id, 7)
+    with database.engine.begin() as conn:
+        second.release(conn, "A", [medicine_id], converted=True)
+
+    with database.engine.connect() as conn:
+        assert held_quantity(conn, medicine_id) == 0
+        assert first.available(conn, medicine_id, 10, call_id="B") == 10
+    assert second.converted == 1
+
+
+def test_expired_holds_are_swept_and_stats_come_from_the_sweep(workers, medicine_id):
+    first, second = workers
+    first.ttl = 0.05
+    with database.engine.begin() as conn:
+        first.hold(conn, "A", medicine_id, 7)
+        second.hold(conn, "B", medicine_id, 1)
+    time.sleep(0.1)
+
+    assert second.sweep() == 1
+    with database.engine.connect() as conn:
+        assert held_quantity(conn, medicine_id) == 1
+        assert second.available(conn, medicine_id, 10, call_id="A") == 9
+    assert second.stats()["holds"] == 1
+    assert second.stats()["units_held"] == 1
@@ -0,0 +1,100 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import func, update
+
+from app import database, models
+from app.services.stock_service import StockService
+
+
+def ledger(medicine_id):
+    with database.SessionLocal() as db:
+        return [
+            (movement.movement_type, movement.quantity)
+            for movement in db.query(models.StockMovement)
+            .filter(models.StockMovement.medicine_id == medicine_id).order_by(models.StockMovement.id)
+        ]
+
+
+def stock_at(api, medicine_id, at):
+    response = api.get(f"/api/medicines/{medicine_id}/stock-at", params={"at": at.isoformat()})
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def test_every_stock_change_is_in_the_ledger_and_it_adds_up(api, add_medicine, in_tmp_dir):
+    medicine_id = add_medicine("Ledger Syrup", stock_quantity=10)
+    api.post(f"/api/medicines/{medicine_id}/batches", json={"quantity": 5, "batch_number": "L1"})
+    api.post(f"/api/medicines/{medicine_id}/stock-adjustments", json={"quantity": -2, "note": "broken"})
+    order = api.post("/api/orders", json={
+        "customer_name": "Ledger", "customer_phone": "9800000036",
+        "items": [{"medicine_id": medicine_id, "quantity": 4, "packaging_type": "bottle"}]})
+    assert order.status_code == 201, order.text
+
+    # The batch (FEFO, undated) is drawn before the unbatched stock
+    assert ledger(medicine_id) == [("adjustment", 10), ("restock", 5), ("adjustment", -2), ("sale", -4)]
+    stock = api.get(f"/api/medicines/{medicine_id}").json()["stock_quantity"]
+    assert stock == sum(quantity for _, quantity in ledger(medicine_id)) == 9
+
+
+@pytest.fixture
+def history(add_medicine):
+    """Opened with 10 units three days ago, 4 written off two days ago"""
+    medicine_id = add_medicine("History Drops", stock_quantity=10)
+    now = datetime.now()
+    with database.SessionLocal() as db:
+        StockService.adjust(db, medicine_id, -4, models.MovementType.EXPIRY_WRITEOFF)
+        movements = models.StockMovement.__table__
+        for movement_type, days_ago in (("adjustment", 3), ("expiry_writeoff", 2)):
+            db.execute(
+                update(movements)
+                .where(movements.c.medicine_id == medicine_id, movements.c.movement_type == movement_type)
+                .values(created_at=now - timedelta(days=days_ago)))
+        db.commit()
+    return medicine_id, now
+
+
+def test_stock_at_a_past_moment_comes_from_the_ledger(api, history):
+    medicine_id, now = history
+
+    assert stock_at(api, medicine_id, now - timedelta(days=4))["quantity"] == 0
+    assert stock_at(api, medicine_id, now - timedelta(days=2, hours=12))["quantity"] == 10
+    assert stock_at(api, medicine_id, now - timedelta(days=1))["quantity"] == 6
+
+
+def test_snapshots_store_end_of_day_stock_and_are_used_as_anchors(api, history):
+    medicine_id, now = history
+    three_days_ago = (now - timedelta(days=3)).date()
+
+    with database.SessionLocal() as db:
+        assert StockService.take_snapshot(db, three_days_ago) >= 1
+        # Reruns skip what is already there
+        assert StockService.take_snapshot(db, three_days_ago) == 0
+        snapshot = db.query(models.StockSnapshot).filter_by(
+            medicine_id=medicine_id, snapshot_date=three_days_ago).one()
+        assert snapshot.quantity == 10
+        count = db.query(func.count(models.StockSnapshot.id)).filter_by(medicine_id=medicine_id).scalar()
+        assert count == 1
+
+    at = now - timedelta(days=2, hours=12)
+    result = stock_at(api, medicine_id, at)
+    assert result["quantity"] == 10
+    assert result["snapshot_date"] == three_days_ago.isoformat()
+
+
+def test_a_medicine_with_stock_history_cannot_be_deleted(api, add_medicine):
+    medicine_id = add_medicine("Delete Me Not", stock_quantity=3)
+
+    response = api.delete(f"/api/medicines/{medicine_id}")
+
+    assert response.status_code == 409
+    assert api.get(f"/api/medicines/{medicine_id}").status_code == 200
+
+
+def test_a_medicine_without_history_is_deleted_with_its_snapshots(api, add_medicine):
+    medicine_id = add_medicine("Delete Me")
+    with database.SessionLocal() as db:
+        StockService.take_snapshot(db, datetime.now().date() - timedelta(days=10))
+
+    assert api.delete(f"/api/medicines/{medicine_id}").status_code == 204
+    assert api.get(f"/api/medicines/{medicine_id}").status_code == 404
@@ -0,0 +1,75 @@
+import asyncio
+import threading
+
+from app import database, models
+from app.services.vapi_service import VapiService
+
+
+def tool_call(call_id, **arguments):
+    return {"id": call_id, "type": "function", "function": {"name": "check_stock", "arguments": arguments}}
+
+
+def message(call_id, *tool_calls):
+    return {"message": {"type": "tool-calls", "call": {"id": call_id}, "toolCalls": list(tool_calls)}}
+
+
+def test_every_tool_call_gets_its_own_result_in_order(api, add_medicine):
+    # One medicine per tool call: SQLite ignores FOR UPDATE, so two parallel
+    # checks of the same medicine would race here in a way Postgres serialises
+    first = add_medicine("Zyvapitol", stock_quantity=5)
+    second = add_medicine("Zyvapidine", stock_quantity=3)
+
+    response = api.post("/api/vapi/check-stock", json=message(
+        "call-040",
+        tool_call("tc-1", medicine_name="Zyvapitol", quantity=2),
+        tool_call("tc-2", medicine_name=""),
+        tool_call("tc-3", medicine_name="Zyvapidine", quantity=10),
+    ))
+
+    assert response.status_code == 200
+    assert response.json() == {"results": [
+        {"toolCallId": "tc-1", "result": "Haa."},
+        {"toolCallId": "tc-2", "result": "Nahi hai."},
+        {"toolCallId": "tc-3", "result": "Haa."},
+    ]}
+    # Each call held what it could, on its own session, and all of it was committed
+    with database.SessionLocal() as db:
+        holds = dict(db.query(models.StockHold.medicine_id, models.StockHold.quantity)
+                     .filter_by(call_id="call-040").all())
+        assert holds == {first: 2, second: 3}
+        assert db.get(models.Medicine, first).held_quantity == 2
+        assert db.get(models.Medicine, second).held_quantity == 3
+
+
+def test_tool_calls_run_concurrently_and_a_failure_stays_with_its_call():
+    # Three handlers that only finish once all three are running at the same time
+    barrier = threading.Barrier(3, timeout=5)
+
+    def handler(db, args, call_id):
+        barrier.wait()
+        if args.get("fail"):
+            raise RuntimeError("tool failed")
+        return f"ok {args['n']}"
+
+    calls = [tool_call("a", n=1), tool_call("b", n=2, fail=True), tool_call("c", n=3)]
+    result = asyncio.run(VapiService.run_tool_calls(calls, handler, "error", call_id="call-concurrent"))
+
+    assert result == {"results": [
+        {"toolCallId": "a", "result": "ok 1"},
+        {"toolCallId": "b", "result": "error"},
+        {"toolCallId": "c", "result": "ok 3"},
+    ]}
+
+
+def test_string_arguments_and_missing_ids_are_handled():
+    calls = [
+        {"function": {"arguments": '{"n": 1}'}},
+        {"function": {"arguments": "not json"}},
+    ]
+    result = asyncio.run(VapiService.run_tool_calls(
+        calls, lambda db, args, call_id: str(args.get("n")), "error"))
+
+    assert result == {"results": [
+        {"toolCallId": "tool-1", "result": "1"},
+        {"toolCallId": "tool-2", "result": "None"},
+    ]}
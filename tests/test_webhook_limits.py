@@ -0,0 +1,96 @@
+import asyncio
+
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+from app.rate_limit import MemoryBucketStore, WebhookLimiter, bucket_key
+
+
+def limited_client(**options):
+    app = FastAPI()
+
+    @app.post("/api/vapi/echo")
+    async def echo(request: Request):
+        return await request.json()
+
+    @app.post("/api/orders")
+    async def not_limited(request: Request):
+        return {"size": len(await request.body())}
+
+    options.setdefault("store", MemoryBucketStore())
+    app.add_middleware(WebhookLimiter, prefixes=("/api/vapi/",), enabled=True, **options)
+    return TestClient(app)
+
+
+def from_caller(number, **extra):
+    return dict({"message": {"call": {"customer": {"number": number}}}}, **extra)
+
+
+def test_the_body_is_replayed_to_the_handler():
+    client = limited_client()
+    payload = from_caller("+919800000001", toolCalls=[{"id": "t1"}])
+
+    response = client.post("/api/vapi/echo", json=payload)
+
+    assert response.status_code == 200
+    assert response.json() == payload
+
+
+def test_a_caller_past_the_burst_gets_429_while_others_get_through():
+    client = limited_client(per_minute=60, burst=2)
+
+    statuses = [client.post("/api/vapi/echo", json=from_caller("+919800000002")).status_code for _ in range(3)]
+    assert statuses == [200, 200, 429]
+
+    rejected = client.post("/api/vapi/echo", json=from_caller("+919800000002"))
+    assert rejected.json() == {"detail": "Too many requests"}
+    assert int(rejected.headers["retry-after"]) >= 1
+    assert client.post("/api/vapi/echo", json=from_caller("+919800000003")).status_code == 200
+
+
+def test_oversized_bodies_get_413_and_other_paths_are_not_limited():
+    client = limited_client(max_body_bytes=1024)
+    big = from_caller("+919800000004", padding="x" * 2048)
+
+    response = client.post("/api/vapi/echo", json=big)
+    assert response.status_code == 413
+    assert response.json() == {"detail": "Request body too large"}
+    assert client.post("/api/orders", json=big).status_code == 200
+
+
+def test_a_chunked_body_is_cut_off_once_it_passes_the_limit():
+    async def app(scope, receive, send):
+        raise AssertionError("the route must not run")
+
+    limiter = WebhookLimiter(app, prefixes=("/api/vapi/",), max_body_bytes=100,
+                             store=MemoryBucketStore(), enabled=True)
+    chunks = [{"type": "http.request", "body": b"x" * 60, "more_body": True}] * 3
+    sent = []
+
+    async def receive():
+        return chunks.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "path": "/api/vapi/echo", "headers": [], "client": ("127.0.0.1", 1)}
+    asyncio.run(limiter(scope, receive, send))
+
+    assert sent[0]["status"] == 413
+    assert len(chunks) == 1  # stopped reading at the second chunk
+    assert limiter.in_flight == 0
+
+
+def test_a_failing_store_lets_requests_through():
+    class BrokenStore:
+        def take(self, key, rate, burst):
+            raise ConnectionError("redis is down")
+
+    client = limited_client(store=BrokenStore())
+    assert client.post("/api/vapi/echo", json=from_caller("+919800000005")).status_code == 200
+
+
+def test_bucket_key_prefers_caller_then_assistant_then_address():
+    assert bucket_key(b'{"message": {"call": {"customer": {"number": "+91980"}}}}', "1.2.3.4") == "caller:+91980"
+    assert bucket_key(b'{"message": {"call": {"assistantId": "asst-1"}}}', "1.2.3.4") == "assistant:asst-1"
+    assert bucket_key(b"not json", "1.2.3.4") == "ip:1.2.3.4"